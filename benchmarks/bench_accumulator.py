@@ -0,0 +1,70 @@
+"""ログのテーブル化のピークメモリと処理時間を計測する
+
+旧実装(辞書のリストをpandas.DataFrameに渡す)と現在の実装(ColumnAccumulator)を比較する。
+ログを1件ずつパースしながら受け取り、DataFrameを作成するまでを計測する。
+
+$ PYTHONPATH=. python benchmarks/bench_accumulator.py
+"""
+
+import time
+import tracemalloc
+
+import pandas as pd
+
+from logtools.loganal import ColumnAccumulator, get_decoders, log_to_dict
+from logtools.logging_tool import Logger
+
+
+N_LINES = 100000
+
+LINE = ("2021-05-09 16:30:{:02d},{:03d}===INFO===service.worker{}===Worker.run==="
+        "run===None===processing item {}===use==="
+        "{{'i': {}, 'elapsed': {}, 'status': 'ok', 'nest': {{'retry': {}}}}}")
+
+
+def iter_records(attributes, splitter, decoders):
+    for i in range(N_LINES):
+        line = LINE.format(i % 60, i % 1000, i % 4, i, i, i * 0.001, i % 3)
+        yield log_to_dict(line, attributes, splitter, decoders)
+
+
+def build_legacy(records):
+    return pd.DataFrame(list(records))
+
+
+def build_current(records):
+    accumulator = ColumnAccumulator()
+    for dic in records:
+        accumulator.append(dic)
+    return accumulator.to_df()
+
+
+def measure_time(build, records_factory):
+    start = time.perf_counter()
+    df = build(records_factory())
+    return df, time.perf_counter() - start
+
+
+def measure_peak(build, records_factory):
+    tracemalloc.start()
+    build(records_factory())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+if __name__ == "__main__":
+    logsetting = Logger.makeformat()
+    attributes, splitter = logsetting.attributes, logsetting.splitter
+    decoders = get_decoders(attributes)
+    # ログファイルを読み込む場合と同じく、ログは1件ずつパースしながら渡す
+    records_factory = lambda: iter_records(attributes, splitter, decoders)
+
+    print("{} lines (parse + build)".format(N_LINES))
+    results = {}
+    for label, build in (("legacy", build_legacy), ("current", build_current)):
+        df, elapsed = measure_time(build, records_factory)
+        peak = measure_peak(build, records_factory)
+        results[label] = df
+        print("{:<8}: {:>6.2f} s, peak {:>7.1f} MiB".format(label, elapsed, peak))
+    pd.testing.assert_frame_equal(results["current"], results["legacy"])
@@ -0,0 +1,64 @@
+"""圧縮されたログファイルの読み込み速度を計測する
+
+非圧縮・フレーム付きのgzip(compress_file)・通常のgzipについて、
+全体の変換と時刻の範囲を指定した変換(全体の約1%)の処理時間を比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_compressed.py
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from logtools.compression import compress_file
+from logtools.loganal import LogToDf
+
+
+N_LINES = 500000
+
+LINE = ("2021-05-09 {:02d}:{:02d}:{:02d},{:03d}===INFO===service.worker===Worker.run==="
+        "run===None===processing item {}===use==={{'i': {}, 'status': 'ok'}}\n")
+
+# 範囲を指定した変換の範囲
+START, END = "2021-05-09 01:00:00,000", "2021-05-09 01:01:20,000"
+
+
+def make_logfile(path):
+    with open(path, "w") as f:
+        for i in range(N_LINES):
+            sec = i // 50
+            f.write(LINE.format(sec // 3600, sec // 60 % 60, sec % 60, i % 1000, i, i))
+
+
+def bench(path, **kwargs):
+    start = time.perf_counter()
+    df = LogToDf().convert([path], **kwargs)
+    return df, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain = os.path.join(tmpdir, "bench.log")
+        make_logfile(plain)
+        framed = compress_file(plain, plain + ".framed.gz", remove = False)
+        stream = plain + ".stream.gz"
+        with open(plain, "rb") as fin, gzip.open(stream, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+
+        print("{:<12} {:>10} {:>10} {:>10}".format("file", "MB", "all[s]", "range[s]"))
+        results = {}
+        for name, path in (("plain", plain), ("framed gzip", framed), ("gzip", stream)):
+            all_df, all_time = bench(path)
+            bench(path, start = START, end = END) # 時刻インデックスの作成
+            range_df, range_time = bench(path, start = START, end = END)
+            results[name] = (all_df, range_df)
+            print("{:<12} {:>10.1f} {:>10.3f} {:>10.3f}".format(name, os.path.getsize(path) / 1e6
+                                                               , all_time, range_time))
+
+    for name in ("framed gzip", "gzip"):
+        for expect, df in zip(results["plain"], results[name]):
+            pd.testing.assert_frame_equal(df, expect)
@@ -0,0 +1,48 @@
+"""LogToDfの解析エンジンの処理速度(lines/sec)を計測する
+
+engine="python"(1行ずつlog_to_dict)とengine="vectorized"(lines_to_df)を比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_engine.py
+"""
+
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from logtools.loganal import LogToDf
+
+
+N_LINES = 100000
+
+LINE = ("2021-05-09 16:30:{:02d},{:03d}===INFO===service.worker{}===Worker.run==="
+        "run===None===processing item {}===use==={}\n")
+
+VALUES = ["{'i': 1, 'status': 'ok'}", "None", "{'retry': 2, 'nest': {'A': 'x'}}"]
+
+
+def make_logfile(path):
+    with open(path, "w") as f:
+        for i in range(N_LINES):
+            f.write(LINE.format(i % 60, i % 1000, i % 4, i % 100, VALUES[i % 3]))
+
+
+def bench(engine, path):
+    start = time.perf_counter()
+    df = LogToDf(engine = engine).convert([path])
+    return df, N_LINES / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.log")
+        make_logfile(path)
+
+        python_df, python_speed = bench("python", path)
+        vectorized_df, vectorized_speed = bench("vectorized", path)
+    pd.testing.assert_frame_equal(vectorized_df, python_df)
+
+    print("python     : {:>10.0f} lines/sec".format(python_speed))
+    print("vectorized : {:>10.0f} lines/sec ({:.1f}x)".format(vectorized_speed
+                                                             , vectorized_speed / python_speed))
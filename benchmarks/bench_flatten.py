@@ -0,0 +1,29 @@
+"""valuesの展開の処理時間を計測する
+
+旧実装(flatten_values)と現在の実装(ValuesFlattener)を、valuesの形を変えて比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_flatten.py
+"""
+
+import timeit
+
+from logtools.loganal import ValuesFlattener, flatten_values
+
+
+VALUES = {"flat" : {"i" : 1, "status" : "ok"}
+          , "nested" : {"A" : "AAA", "int" : 3
+                        , "nest" : {"A" : "nestA", "BB" : {"bnest" : [1, 2, 3], "tag" : True}}}
+          , "wide" : {"k{}".format(i) : i for i in range(200)}
+          , "wide nested" : {"k{}".format(i) : {"a" : i, "b" : {"c" : 1}} for i in range(50)}
+          }
+
+
+if __name__ == "__main__":
+    flattener = ValuesFlattener()
+    print("{:<12} {:>12} {:>12} {:>8}".format("values", "legacy[us]", "current[us]", "ratio"))
+    for label, values_lit in VALUES.items():
+        assert flattener.flatten(values_lit, "FUNC") == flatten_values(values_lit)
+        legacy = timeit.timeit(lambda: flatten_values(values_lit), number = 20000) / 20000 * 1e6
+        current = timeit.timeit(lambda: flattener.flatten(values_lit, "FUNC")
+                                , number = 20000) / 20000 * 1e6
+        print("{:<12} {:>12.2f} {:>12.2f} {:>8.1f}".format(label, legacy, current, legacy / current))
@@ -0,0 +1,55 @@
+"""Formatterのスループット(records/sec)を計測する
+
+logging.Formatter(Logger.makeformat().format)とSplitterFormatterを、
+logtools.Loggerが作成するレコードで比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_formatter.py
+"""
+
+import logging
+import time
+
+from logtools.formatters import SplitterFormatter
+from logtools.logging_tool import Logger
+
+
+N = 200000
+
+# (ラベル, message, values)
+CASES = [("no values", "hello", None)
+         , ("values", "loop", {"i" : 10, "status" : "ok", "rate" : 0.25})
+         , ("nested values", "loop", {"A" : "AAA", "nest" : {"B" : [1, 2, 3]}})
+         ]
+
+
+def make_records(message, values, n):
+    """1ミリ秒間隔のレコードを作成する"""
+    start = time.time()
+    records = []
+    for i in range(n):
+        record = logging.LogRecord("bench_formatter", logging.INFO, __file__, 0
+                                   , message, None, None)
+        record.created = start + i * 1e-3
+        record.msecs = (record.created - int(record.created)) * 1000
+        record.__dict__.update(action = "run", exception = None, function = "bench"
+                               , tag = "use", values = values)
+        records.append(record)
+    return records
+
+def throughput(formatter, records)->float:
+    start = time.perf_counter()
+    for record in records:
+        formatter.format(record)
+    return len(records) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    stdlib = logging.Formatter(Logger.makeformat().format)
+    current = SplitterFormatter()
+    print("{:<16} {:>16} {:>16} {:>8}".format("case", "stdlib[rec/s]", "current[rec/s]", "ratio"))
+    for label, message, values in CASES:
+        records = make_records(message, values, N)
+        assert stdlib.format(records[0]) == current.format(records[0])
+        legacy = throughput(stdlib, records)
+        fast = throughput(current, records)
+        print("{:<16} {:>16,.0f} {:>16,.0f} {:>8.1f}".format(label, legacy, fast, fast / legacy))
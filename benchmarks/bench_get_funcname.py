@@ -0,0 +1,50 @@
+"""get_funcnameの1回あたりの処理時間を計測する
+
+旧実装(inspect.stack)と現在の実装(sys._getframe + キャッシュ)を
+スタックの深さを変えて比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_get_funcname.py
+"""
+
+import inspect
+import timeit
+
+from logtools.logging_tool import get_funcname
+
+
+def get_funcname_legacy(layer:int = 1)->str:
+    """旧実装（比較用）"""
+    frame = inspect.stack()[layer]
+    function_name = frame.function
+    locals_dic = inspect.getargvalues(frame[0]).locals
+    if ("self" in locals_dic.keys()):
+        class_name = locals_dic["self"].__class__.__name__
+        return class_name + "." + function_name
+    else:
+        return function_name
+
+
+class Target():
+    def method(self, resolver):
+        return resolver()
+
+
+def run_at_depth(depth, func):
+    if depth > 0:
+        return run_at_depth(depth - 1, func)
+    return func()
+
+
+def bench(resolver, depth, number):
+    target = Target()
+    total = timeit.timeit(lambda: run_at_depth(depth, lambda: target.method(resolver))
+                          , number = number)
+    return total / number * 1e6 # us/call
+
+
+if __name__ == "__main__":
+    print("{:>6} {:>14} {:>14} {:>8}".format("depth", "legacy[us]", "current[us]", "ratio"))
+    for depth in (0, 10, 50):
+        legacy = bench(get_funcname_legacy, depth, number = 200)
+        current = bench(get_funcname, depth, number = 20000)
+        print("{:>6} {:>14.2f} {:>14.2f} {:>8.1f}".format(depth, legacy, current, legacy / current))
@@ -0,0 +1,90 @@
+"""ファイルハンドラのスループットと書き込み回数を計測する
+
+logging.handlers.RotatingFileHandlerとBufferedRotatingFileHandlerを、
+同期モードと非同期モード(Logger.enable_async)で比較する。
+RotatingFileHandlerのシステムコール数は、ストリームのflush(write), seek, tellの呼び出し回数で数える。
+
+$ PYTHONPATH=. python benchmarks/bench_handler.py
+"""
+
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+
+from logtools.formatters import SplitterFormatter
+from logtools.handlers import BufferedRotatingFileHandler
+from logtools.logging_tool import getLogger
+
+
+N = 100000
+MAX_BYTES = 1 << 30 # ベンチマーク中にはローテーションしない
+
+
+class CountingStream():
+    """ストリームのflush, seek, tellの呼び出し回数を数える"""
+    def __init__(self, stream):
+        self._stream = stream
+        self.syscalls = 0
+
+    def write(self, s):
+        return self._stream.write(s)
+
+    def flush(self):
+        self.syscalls += 1
+        self._stream.flush()
+
+    def seek(self, *args):
+        self.syscalls += 1
+        return self._stream.seek(*args)
+
+    def tell(self):
+        self.syscalls += 1
+        return self._stream.tell()
+
+    def close(self):
+        self._stream.close()
+
+
+def run(name, handler, async_):
+    std_logger = logging.getLogger(name)
+    std_logger.setLevel(logging.INFO)
+    std_logger.propagate = False
+    handler.setFormatter(SplitterFormatter())
+    std_logger.addHandler(handler)
+    logger = getLogger(name)
+    if async_:
+        logger.enable_async(maxsize = N)
+
+    start = time.perf_counter()
+    for i in range(N):
+        logger.info("loop", action = "run", values = {"i" : i})
+    if async_:
+        logger.disable_async()
+    handler.flush()
+    elapsed = time.perf_counter() - start
+    std_logger.removeHandler(handler)
+    return N / elapsed
+
+
+if __name__ == "__main__":
+    print("{:<28} {:>12} {:>10}".format("handler", "rec/s", "syscalls"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for async_ in (False, True):
+            mode = "async" if async_ else "sync"
+
+            path = os.path.join(tmpdir, "stdlib_{}.log".format(mode))
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes = MAX_BYTES
+                                                           , backupCount = 1)
+            handler.stream = CountingStream(handler.stream)
+            rate = run("bench_stdlib_" + mode, handler, async_)
+            print("{:<28} {:>12,.0f} {:>10,}".format("RotatingFileHandler " + mode
+                                                      , rate, handler.stream.syscalls))
+            handler.close()
+
+            path = os.path.join(tmpdir, "buffered_{}.log".format(mode))
+            handler = BufferedRotatingFileHandler(path, maxBytes = MAX_BYTES, backupCount = 1)
+            rate = run("bench_buffered_" + mode, handler, async_)
+            print("{:<28} {:>12,.0f} {:>10,}".format("Buffered " + mode, rate, handler.writes))
+            handler.close()
@@ -0,0 +1,57 @@
+"""log_to_dictの処理速度(lines/sec)を計測する
+
+旧実装(全属性をast.literal_eval)と現在の実装(属性ごとのデコーダ)を比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_log_to_dict.py
+"""
+
+import ast
+import time
+
+from logtools.loganal import breakdown_values, get_decoders, log_to_dict
+from logtools.logging_tool import Logger
+
+
+LINE = ("2021-05-09 16:30:12,093===INFO===service.worker===Worker.run==="
+        "run===None===processing item 42===use==="
+        "{'A': 'AAA', 'int': 3, 'nest': {'A': 'nestA', 'BB': {'bnest': [1, 2, 3], 'tag': True}}}")
+
+
+def log_to_dict_legacy(unitlog_str, attributes, splitter):
+    """旧実装（比較用）"""
+    log_ls = unitlog_str.split(splitter)
+    if len(log_ls) != len(attributes):
+        return {"values" : unitlog_str, "convert_exception" : "strange format"}
+
+    ret_dic = {}
+    for k,v in zip(attributes[:-1], log_ls[:-1]):
+        try:
+            v_lit = ast.literal_eval(v)
+        except (SyntaxError, ValueError):
+            v_lit = v
+        ret_dic[k] = v_lit
+
+    val_dic = breakdown_values(log_ls[-1])
+    if val_dic is not None:
+        ret_dic.update(val_dic)
+    return ret_dic
+
+
+def bench(func, n = 20000):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return n / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    logsetting = Logger.makeformat()
+    attributes, splitter = logsetting.attributes, logsetting.splitter
+    decoders = get_decoders(attributes)
+
+    assert log_to_dict_legacy(LINE, attributes, splitter) == log_to_dict(LINE, attributes, splitter)
+
+    legacy = bench(lambda: log_to_dict_legacy(LINE, attributes, splitter))
+    current = bench(lambda: log_to_dict(LINE, attributes, splitter, decoders))
+    print("legacy  : {:>10.0f} lines/sec".format(legacy))
+    print("current : {:>10.0f} lines/sec ({:.1f}x)".format(current, current / legacy))
@@ -0,0 +1,108 @@
+"""複数のプロセスからLogWriterに送信した場合の全体のスループットを計測する
+
+N個のワーカープロセスがそれぞれRECORDS件をLogWriterHandlerでログし、
+ライタープロセスがBufferedRotatingFileHandlerでローテーションしながら書き込む。
+全プロセスの開始からライタープロセスがすべて書き込むまでの時間で、全体のrec/sを求める。
+比較として、1プロセスでBufferedRotatingFileHandlerに直接書き込んだ場合も計測する。
+
+$ PYTHONPATH=. python benchmarks/bench_multiprocess.py
+"""
+
+import glob
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from logtools.formatters import SplitterFormatter
+from logtools.handlers import BufferedRotatingFileHandler
+from logtools.logging_tool import getLogger
+from logtools.multiprocess import LogWriter, LogWriterHandler
+
+
+RECORDS = 50000
+WORKERS = [1, 2, 4, 8]
+MAX_BYTES = 10 * 1024 * 1024
+
+
+def log_loop(name):
+    logger = getLogger(name)
+    for i in range(RECORDS):
+        logger.info("loop", action = "run", values = {"i" : i})
+
+
+def worker(address, authkey, start_event):
+    std_logger = logging.getLogger("bench_worker")
+    std_logger.setLevel(logging.INFO)
+    std_logger.propagate = False
+    handler = LogWriterHandler(address, authkey = authkey)
+    std_logger.addHandler(handler)
+    start_event.wait()
+    log_loop("bench_worker")
+    handler.close()
+
+
+def count_lines(path):
+    n = 0
+    for fn in glob.glob(path + "*"):
+        with open(fn, "rb") as f:
+            n += sum(1 for _ in f)
+    return n
+
+
+def bench_direct(tmpdir):
+    path = os.path.join(tmpdir, "direct.log")
+    std_logger = logging.getLogger("bench_direct")
+    std_logger.setLevel(logging.INFO)
+    std_logger.propagate = False
+    handler = BufferedRotatingFileHandler(path, maxBytes = MAX_BYTES, backupCount = 100)
+    handler.setFormatter(SplitterFormatter())
+    std_logger.addHandler(handler)
+    start = time.perf_counter()
+    log_loop("bench_direct")
+    handler.close()
+    elapsed = time.perf_counter() - start
+    assert count_lines(path) == RECORDS
+    return RECORDS / elapsed
+
+
+def bench_writer(tmpdir, n_workers):
+    path = os.path.join(tmpdir, "writer{}.log".format(n_workers))
+    config = {"version" : 1
+              , "formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}
+              , "handlers" : {"file" : {"class" : "logtools.handlers.BufferedRotatingFileHandler"
+                                        , "formatter" : "splitter"
+                                        , "filename" : path
+                                        , "maxBytes" : MAX_BYTES
+                                        , "backupCount" : 100}}
+              , "root" : {"level" : "INFO", "handlers" : ["file"]}}
+    writer = LogWriter(config)
+    writer.start()
+    start_event = multiprocessing.Event()
+    processes = [multiprocessing.Process(target = worker
+                                         , args = (writer.address, writer.authkey, start_event))
+                 for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    time.sleep(0.5) # プロセスの起動を待つ
+
+    start = time.perf_counter()
+    start_event.set()
+    for process in processes:
+        process.join()
+    stats = writer.stop()
+    elapsed = time.perf_counter() - start
+    assert stats["records"] == RECORDS * n_workers
+    assert count_lines(path) == RECORDS * n_workers
+    return RECORDS * n_workers / elapsed, stats["batches"]
+
+
+if __name__ == "__main__":
+    print("{:<20} {:>12} {:>10}".format("", "rec/s", "batches"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print("{:<20} {:>12,.0f} {:>10}".format("direct (1 process)", bench_direct(tmpdir), "-"))
+        for n_workers in WORKERS:
+            rate, batches = bench_writer(tmpdir, n_workers)
+            print("{:<20} {:>12,.0f} {:>10,}".format("writer {} workers".format(n_workers)
+                                                      , rate, batches))
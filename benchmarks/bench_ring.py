@@ -0,0 +1,66 @@
+"""DEBUGレベルのログ1件あたりの処理時間を、ハンドラごとに比較する
+
+- NullHandler : レコードの作成までのコスト（基準）
+- BufferedRotatingFileHandler : すべてをフォーマットしてファイルに書き込む
+- RingBufferHandler : フォーマットせずにリングバッファに保持する（件数, バイト数で制限）
+
+RingBufferHandlerは最後にdump()した分だけがフォーマットされる。
+
+$ PYTHONPATH=. python benchmarks/bench_ring.py
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+from logtools.formatters import SplitterFormatter
+from logtools.handlers import BufferedRotatingFileHandler, RingBufferHandler
+from logtools.logging_tool import getLogger
+
+
+N = 200000
+CAPACITY = 10000
+
+
+def run(name, handler):
+    std_logger = logging.getLogger(name)
+    std_logger.setLevel(logging.DEBUG)
+    std_logger.propagate = False
+    std_logger.addHandler(handler)
+    logger = getLogger(name)
+
+    start = time.perf_counter()
+    for i in range(N):
+        logger.debug("loop", action = "run", values = {"i" : i, "status" : "ok"})
+    elapsed = time.perf_counter() - start
+    std_logger.removeHandler(handler)
+    return elapsed / N * 1e6
+
+
+if __name__ == "__main__":
+    print("{:<28} {:>10} {:>12}".format("handler", "us/record", "written"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print("{:<28} {:>10.2f} {:>12}".format("NullHandler"
+                                               , run("bench_null", logging.NullHandler()), "-"))
+
+        path = os.path.join(tmpdir, "all.log")
+        handler = BufferedRotatingFileHandler(path)
+        handler.setFormatter(SplitterFormatter())
+        us = run("bench_file", handler)
+        handler.close()
+        print("{:<28} {:>10.2f} {:>12,}".format("BufferedRotatingFileHandler", us
+                                                , os.path.getsize(path)))
+
+        for label, kwargs in (("RingBufferHandler", {})
+                              , ("RingBufferHandler max_bytes", {"max_bytes" : 2 * 1024 * 1024})):
+            path = os.path.join(tmpdir, "dump.log")
+            target = logging.FileHandler(path)
+            target.setFormatter(SplitterFormatter())
+            handler = RingBufferHandler(capacity = CAPACITY, target = target, **kwargs)
+            us = run("bench_ring", handler)
+            handler.dump()
+            handler.close()
+            target.close()
+            print("{:<28} {:>10.2f} {:>12,}".format(label, us, os.path.getsize(path)))
+            os.remove(path)
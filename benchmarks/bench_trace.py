@@ -0,0 +1,43 @@
+"""trace_decoのオーバーヘッドを計測する
+
+DEBUGが無効な場合、記録だけ有効な場合、呼び出しごとのログを出力する場合を
+デコレートしていない関数と比較する。
+
+$ PYTHONPATH=. python benchmarks/bench_trace.py
+"""
+
+import logging
+import timeit
+
+from logtools.logging_tool import getLogger
+
+
+N = 100000
+
+
+if __name__ == "__main__":
+    std_logger = logging.getLogger("bench_trace")
+    std_logger.propagate = False
+    logger = getLogger("bench_trace")
+
+    def plain():
+        return 1
+    decorated = logger.trace_deco(plain)
+
+    def run(func):
+        return timeit.timeit(func, number = N) / N * 1e6
+
+    base = run(plain)
+    print("{:<24} {:>10}".format("case", "per call[us]"))
+    print("{:<24} {:>10.3f}".format("undecorated", base))
+
+    std_logger.setLevel(logging.INFO)
+    print("{:<24} {:>10.3f}".format("debug disabled", run(decorated)))
+
+    logger.enable_trace_stats(interval = 60, per_call = False)
+    print("{:<24} {:>10.3f}".format("summary only", run(decorated)))
+    logger.disable_trace_stats()
+
+    std_logger.setLevel(logging.DEBUG)
+    std_logger.addHandler(logging.NullHandler())
+    print("{:<24} {:>10.3f}".format("per call records", run(decorated)))
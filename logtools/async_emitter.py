@@ -0,0 +1,246 @@
+"""ログレコードの出力（フォーマット・ハンドラのI/O）をバックグラウンドスレッドで行う"""
+
+import atexit
+import collections
+import logging
+import sys
+import threading
+import traceback
+
+
+# キューが満杯の場合の振る舞い
+OVERFLOW_POLICIES = tuple(["block", "drop_oldest", "drop_debug"])
+
+
+class AsyncEmitter():
+    """logging.LoggerのレコードをキューにためてQueueListenerのように別スレッドで出力する
+
+    呼び出し元のスレッドではLogRecordの作成とキューへの追加だけを行い、
+    フォーマットやハンドラのI/Oはドレインスレッドでlogging.Logger.handle()が行う。
+    ハンドラはlogging.Loggerに設定されているものがそのまま使われるので、
+    dictConfig等の設定を変更する必要はない。
+
+    Notes
+    -----
+    - valuesの辞書はフォーマットされるまで参照で保持されるため、
+      ログした後に呼び出し元で変更すると変更後の内容が出力される可能性がある
+    - close()後に追加されたレコードは、呼び出し元のスレッドで同期的に出力される
+    - キューが空になるたびにハンドラのflush()を呼ぶので、flush()から戻った時点で
+      BufferedRotatingFileHandler等のバッファも書き込まれている
+    """
+    def __init__(self, logger, maxsize:int = 10000, overflow:str = "block"):
+        """
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            レコードを出力するロガー
+        maxsize : int, optional
+            キューに保持する最大レコード数, by default 10000
+        overflow : str, optional
+            キューが満杯の場合の振る舞い, by default "block"
+            - "block" : 空きができるまで呼び出し元を待たせる
+            - "drop_oldest" : 最も古いレコードを捨てる
+            - "drop_debug" : DEBUGレベルのレコードから捨てる。
+              DEBUGレベルのレコードがキューにない場合は"block"と同じ
+
+        Raises
+        ------
+        ValueError
+            maxsizeが1未満、またはoverflowが不正な場合
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of " + str(OVERFLOW_POLICIES))
+
+        self._logger = logger
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._unfinished = 0
+
+        self._queued = 0
+        self._dropped = 0
+        self._emitted = 0
+
+        self._thread = None
+        self._stopping = False
+        self._closed = False
+
+    @property
+    def queued(self)->int:
+        """キューに追加されたレコードの累計"""
+        return self._queued
+
+    @property
+    def dropped(self)->int:
+        """overflowによって捨てられたレコードの累計"""
+        return self._dropped
+
+    @property
+    def emitted(self)->int:
+        """ドレインスレッドで出力されたレコードの累計"""
+        return self._emitted
+
+    @property
+    def qsize(self)->int:
+        """現在キューにあるレコード数"""
+        return len(self._queue)
+
+    @property
+    def closed(self)->bool:
+        return self._closed
+
+    def start(self):
+        """ドレインスレッドを開始する"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target = self._drain
+                                        , name = "logtools-AsyncEmitter-" + self._logger.name
+                                        , daemon = True)
+        self._thread.start()
+        # インタプリタ終了時にキューを出力しきる
+        # logging.shutdownより先に呼ばれる（atexitは登録と逆順）
+        atexit.register(self.close)
+
+    def put(self, record)->bool:
+        """レコードをキューに追加する
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+
+        Returns
+        -------
+        bool
+            キューに追加された場合（close後に同期的に出力された場合を含む）にはTrue
+            overflowによって捨てられた場合にはFalse
+        """
+        with self._lock:
+            if not self._closed:
+                while len(self._queue) >= self.maxsize:
+                    if self.overflow == "drop_oldest":
+                        self._queue.popleft()
+                        self._dropped += 1
+                        self._unfinished -= 1
+                    elif (self.overflow == "drop_debug"
+                          and record.levelno <= logging.DEBUG):
+                        self._dropped += 1
+                        return False
+                    elif (self.overflow == "drop_debug"
+                          and self._drop_queued_debug()):
+                        pass
+                    else:
+                        self._not_full.wait()
+                        if self._closed:
+                            break
+                else:
+                    self._queue.append(record)
+                    self._queued += 1
+                    self._unfinished += 1
+                    self._not_empty.notify()
+                    return True
+
+        # close後は同期的に出力する
+        self._logger.handle(record)
+        return True
+
+    def _drop_queued_debug(self)->bool:
+        """キューにある最も古いDEBUGレベル以下のレコードを捨てる（ロックを取得して呼ぶこと）"""
+        for i, queued_record in enumerate(self._queue):
+            if queued_record.levelno <= logging.DEBUG:
+                del self._queue[i]
+                self._dropped += 1
+                self._unfinished -= 1
+                return True
+        return False
+
+    def _drain(self):
+        """ドレインスレッドの処理"""
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._not_empty.wait()
+                if not self._queue:
+                    # _stoppingかつキューが空
+                    return
+                record = self._queue.popleft()
+                self._not_full.notify()
+
+            try:
+                self._logger.handle(record)
+                if not self._queue:
+                    # キューを空にするたびにハンドラをflushする
+                    # （バッファするハンドラは、負荷が高いほどまとめて書き込む）
+                    self._flush_handlers()
+            except Exception:
+                # ハンドラのエラーはHandler.handleErrorで処理されるので、ここに来るのは想定外
+                traceback.print_exc(file = sys.stderr)
+            finally:
+                with self._lock:
+                    self._unfinished -= 1
+                    self._emitted += 1
+                    if self._unfinished <= 0:
+                        self._all_done.notify_all()
+
+    def _flush_handlers(self):
+        """ロガーと伝播先のロガーのハンドラをflushする"""
+        logger = self._logger
+        while logger:
+            for hdlr in logger.handlers:
+                hdlr.flush()
+            if not logger.propagate:
+                break
+            logger = logger.parent
+
+    def flush(self, timeout:float = None)->bool:
+        """キューにあるレコードがすべて出力されるまで待つ
+
+        Parameters
+        ----------
+        timeout : float, optional
+            最大待ち時間[s], by default None
+
+        Returns
+        -------
+        bool
+            すべて出力された場合にはTrue、タイムアウトした場合にはFalse
+        """
+        if self._thread is None:
+            return not self._queue
+        with self._lock:
+            return self._all_done.wait_for(lambda: self._unfinished <= 0, timeout)
+
+    def close(self, timeout:float = None):
+        """キューにあるレコードを出力しきってからドレインスレッドを終了する
+
+        close後に追加されたレコードは同期的に出力される
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._stopping = True
+            self._not_empty.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            atexit.unregister(self.close)
+
+        with self._lock:
+            self._closed = True
+            # blockで待っている呼び出し元を解放する
+            self._not_full.notify_all()
+            remaining = list(self._queue)
+            self._queue.clear()
+            self._unfinished = 0
+            self._all_done.notify_all()
+
+        # スレッドが開始されていない、またはタイムアウトした場合の残り
+        for record in remaining:
+            self._logger.handle(record)
@@ -0,0 +1,260 @@
+"""ログファイルの圧縮と、圧縮されたログファイルの読み込み
+
+圧縮はフレーム付きのgzip形式で行う。
+行の区切りに揃えたブロック（目安FRAME_BYTES）ごとに1つのgzipメンバーとし、
+各メンバーのヘッダーの拡張フィールドにメンバーのサイズと展開後のサイズを格納する
+（BGZFと同じ考え方）。
+複数メンバーのgzipなので通常のgzip(gzip.open, zcat等)でそのまま読めるうえ、
+ヘッダーだけをたどってフレームの索引を作れるので、範囲を指定した読み込みでは
+その範囲を含むフレームだけを展開すればよい。
+
+フレームのない圧縮ファイル（通常のgzip, zstd, lz4）は、先頭から逐次展開して読む。
+zstd, lz4の読み込みにはそれぞれzstandard, lz4パッケージが必要。
+"""
+
+import functools
+import gzip
+import os
+import struct
+import zlib
+
+
+# 圧縮形式 -> ファイル先頭のマジックナンバー
+MAGIC_NUMBERS = {"gzip" : b"\x1f\x8b"
+                 , "zstd" : b"\x28\xb5\x2f\xfd"
+                 , "lz4" : b"\x04\x22\x4d\x18"}
+
+# 圧縮形式 -> ファイル名の拡張子
+SUFFIXES = {"gzip" : ".gz", "zstd" : ".zst", "lz4" : ".lz4"}
+
+# 書き込みに対応している圧縮形式
+WRITE_COMPRESSIONS = tuple(["gzip"])
+
+# 1フレームの展開後の目安のバイト数
+FRAME_BYTES = 1024 * 1024
+
+# フレームのない圧縮ファイルを展開する際に一度に読むバイト数
+READ_BYTES = 1024 * 1024
+
+# gzipヘッダーの拡張フィールドのサブフィールドID
+# データはメンバー全体のサイズ, 展開後のサイズ(いずれもuint32 little endian)
+_SUBFIELD_ID = b"LT"
+_SUBFIELD = struct.Struct("<2sHII")
+_FEXTRA = 0x04
+# ID1, ID2, CM(deflate), FLG(FEXTRA), MTIME, XFL, OS(unknown)
+_HEADER = b"\x1f\x8b\x08" + bytes([_FEXTRA]) + b"\x00\x00\x00\x00\x00\xff"
+_TRAILER = struct.Struct("<II")
+
+
+def detect_compression(filepath)->str:
+    """ファイル先頭のマジックナンバーから圧縮形式を判定する
+
+    Returns
+    -------
+    str or None
+        MAGIC_NUMBERSのキー
+        圧縮されていない場合はNone
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(4)
+    for compression, magic in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+def _make_member(data:bytes, level:int)->bytes:
+    """dataを1つのgzipメンバー（フレーム）にする"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    member_size = len(_HEADER) + 2 + _SUBFIELD.size + len(deflated) + _TRAILER.size
+    extra = _SUBFIELD.pack(_SUBFIELD_ID, 8, member_size, len(data))
+    return (_HEADER + struct.pack("<H", len(extra)) + extra + deflated
+            + _TRAILER.pack(zlib.crc32(data), len(data)))
+
+def compress_file(src, dst = None, frame_bytes:int = FRAME_BYTES, level:int = 6
+                  , remove:bool = True)->str:
+    """ログファイルをフレーム付きのgzip形式で圧縮する
+
+    圧縮中のファイルは一時ファイル(dst + ".tmp")に書き込み、完了してからdstに置き換えるので、
+    dstが書き込み途中の状態で読まれることはない。
+
+    Parameters
+    ----------
+    src : path
+        圧縮するファイル
+    dst : path, optional
+        圧縮したファイル, by default None
+        Noneの場合はsrc + ".gz"
+    frame_bytes : int, optional
+        1フレームの展開後の目安のバイト数, by default FRAME_BYTES
+        フレームは行の区切りに揃えるので、長い行を含む場合はこれより大きくなる
+    level : int, optional
+        圧縮レベル, by default 6
+    remove : bool, optional
+        圧縮後にsrcを削除するかどうか, by default True
+
+    Returns
+    -------
+    str
+        dst
+    """
+    src = os.fspath(src)
+    dst = src + SUFFIXES["gzip"] if dst is None else os.fspath(dst)
+    tmp = dst + ".tmp"
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        while True:
+            data = fin.read(frame_bytes)
+            if not data:
+                break
+            if not data.endswith(b"\n"):
+                data += fin.readline()
+            fout.write(_make_member(data, level))
+    os.replace(tmp, dst)
+    if remove:
+        os.remove(src)
+    return dst
+
+def _read_member_sizes(f):
+    """現在位置のgzipメンバーのヘッダーから(メンバーのサイズ, 展開後のサイズ)を読む
+
+    ヘッダーの後の位置にシークする。フレームでない場合はNoneを返す
+    """
+    header = f.read(12)
+    if len(header) < 12 or header[:2] != MAGIC_NUMBERS["gzip"] or not header[3] & _FEXTRA:
+        return None
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = f.read(xlen)
+    pos = 0
+    while pos + 4 <= len(extra):
+        subfield_id, length = extra[pos:pos + 2], struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+        if subfield_id == _SUBFIELD_ID and length == 8:
+            return struct.unpack("<II", extra[pos + 4:pos + 12])
+        pos += 4 + length
+    return None
+
+@functools.lru_cache(maxsize = 256)
+def _frame_index(filepath:str, mtime_ns:int, size:int)->tuple:
+    """フレームの索引（ファイルの更新時刻・サイズごとにキャッシュする）"""
+    frames = []
+    offset = uncompressed = 0
+    with open(filepath, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            sizes = _read_member_sizes(f)
+            if sizes is None:
+                return None
+            member_size, data_size = sizes
+            frames.append((offset, member_size, uncompressed, data_size))
+            offset += member_size
+            uncompressed += data_size
+    if offset != size:
+        return None
+    return tuple(frames)
+
+def frame_index(filepath)->tuple:
+    """フレーム付きのgzipファイルのフレームの索引を返す
+
+    ヘッダーだけを読み、展開は行わない
+
+    Returns
+    -------
+    tuple of tuple(int, int, int, int) or None
+        (メンバーの位置, メンバーのサイズ, 展開後の位置, 展開後のサイズ)のタプル
+        フレーム付きのgzip形式でない場合はNone
+    """
+    filepath = os.fspath(filepath)
+    stat = os.stat(filepath)
+    return _frame_index(filepath, stat.st_mtime_ns, stat.st_size)
+
+def _open_stream(filepath, compression:str):
+    """フレームのない圧縮ファイルを逐次展開するファイルオブジェクトを返す"""
+    if compression == "gzip":
+        return gzip.open(filepath, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard is required to read zstd compressed log files")
+        return zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb")
+                                                          , read_across_frames = True
+                                                          , closefd = True)
+    if compression == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 is required to read lz4 compressed log files")
+        return lz4.frame.open(filepath, "rb")
+    raise ValueError("unsupported compression : " + str(compression))
+
+def iter_decompressed(filepath, start:int = 0, compression:str = None):
+    """圧縮ファイルを展開したバイト列を、展開後の位置とともに順に返す
+
+    Parameters
+    ----------
+    filepath : path
+    start : int, optional
+        読みたい範囲の開始位置（展開後）, by default 0
+        フレーム付きのgzipの場合はstartを含むフレームから展開する。
+        それ以外の場合は先頭から展開する（startより前も返す）
+    compression : str, optional
+        圧縮形式, by default None
+        Noneの場合はdetect_compressionで判定する
+
+    Yields
+    ------
+    tuple(int, bytes)
+        (展開後の位置, 展開したバイト列)
+    """
+    if compression is None:
+        compression = detect_compression(filepath)
+    frames = frame_index(filepath) if compression == "gzip" else None
+    if frames is not None:
+        with open(filepath, "rb") as f:
+            for offset, member_size, uncompressed, data_size in frames:
+                if uncompressed + data_size <= start:
+                    continue
+                f.seek(offset)
+                yield uncompressed, gzip.decompress(f.read(member_size))
+        return
+
+    with _open_stream(filepath, compression) as stream:
+        pos = 0
+        while True:
+            data = stream.read(READ_BYTES)
+            if not data:
+                return
+            yield pos, data
+            pos += len(data)
+
+@functools.lru_cache(maxsize = 256)
+def _uncompressed_size(filepath:str, mtime_ns:int, size:int, compression:str)->int:
+    frames = frame_index(filepath) if compression == "gzip" else None
+    if frames is not None:
+        return sum(frame[3] for frame in frames)
+    total = 0
+    for _, data in iter_decompressed(filepath, 0, compression):
+        total += len(data)
+    return total
+
+def uncompressed_size(filepath, compression:str = None)->int:
+    """圧縮ファイルの展開後のサイズ
+
+    フレーム付きのgzipの場合は索引から求め、それ以外の場合は全体を展開して数える
+    （ファイルの更新時刻・サイズごとにキャッシュする）
+    """
+    if compression is None:
+        compression = detect_compression(filepath)
+    filepath = os.fspath(filepath)
+    stat = os.stat(filepath)
+    return _uncompressed_size(filepath, stat.st_mtime_ns, stat.st_size, compression)
+
+def read_head(filepath, n_bytes:int, compression:str = None)->bytes:
+    """圧縮ファイルを展開した先頭n_bytesバイトを返す"""
+    head = b""
+    if n_bytes <= 0:
+        return head
+    for _, data in iter_decompressed(filepath, 0, compression):
+        head += data
+        if len(head) >= n_bytes:
+            break
+    return head[:n_bytes]
@@ -0,0 +1,194 @@
+"""logtools用のFormatter"""
+
+import json
+import logging
+import operator
+import time
+
+from logtools.logging_tool import Logger
+
+
+# JSONのオブジェクトのキーにできる型（json.dumpsが文字列にする）
+_JSON_KEY_TYPES = (str, int, float, bool, type(None))
+
+def _stringify_keys(value):
+    """JSONのキーにできない辞書のキー(tuple等)をreprの文字列にする"""
+    if isinstance(value, dict):
+        return {(k if isinstance(k, _JSON_KEY_TYPES) else repr(k)) : _stringify_keys(v)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stringify_keys(v) for v in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSON(JSON Lines)にするFormatter
+
+    スプリッター形式と同じ属性をJSONオブジェクトとして出力する。
+    valuesは辞書のまま入れ子のJSONになるので、
+    メッセージにスプリッターや改行が含まれていてもloganalで曖昧さなく解析できる。
+
+    dictConfigでは以下のように指定する。
+    {"formatters" : {"json" : {"()" : "logtools.formatters.JsonFormatter"}}}
+
+    Notes
+    -----
+    - JSONにできない値はreprで文字列にする
+    - JSONのキーにできない辞書のキー(タプル等)はreprで文字列にする
+    - タプルはリストになる
+    """
+    def __init__(self, attributes:tuple = None, datefmt:str = None):
+        """
+
+        Parameters
+        ----------
+        attributes : tuple of str, optional
+            出力する属性, by default None
+            Noneの場合はLogger.makeformat().attributes
+        datefmt : str, optional
+            asctimeの書式, by default None
+            logging.Formatterと同じ
+        """
+        super().__init__(datefmt = datefmt)
+        if attributes is None:
+            attributes = Logger.makeformat().attributes
+        self.attributes = tuple(attributes)
+        self._uses_asctime = "asctime" in self.attributes
+
+    def format(self, record)->str:
+        record.message = None if record.msg is None else record.getMessage()
+        if self._uses_asctime:
+            record.asctime = self.formatTime(record, self.datefmt)
+
+        dic = {attrib : getattr(record, attrib, None) for attrib in self.attributes}
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dic["exc_text"] = record.exc_text
+
+        try:
+            return json.dumps(dic, ensure_ascii = False, default = repr)
+        except TypeError:
+            # キーにできない型のキーがある場合
+            return json.dumps(_stringify_keys(dic), ensure_ascii = False, default = repr)
+
+
+def _escape_char(c:str)->str:
+    """文字をPythonの文字列リテラル内のエスケープシーケンスにする"""
+    code = ord(c)
+    if code < 0x100:
+        return "\\x{:02x}".format(code)
+    if code < 0x10000:
+        return "\\u{:04x}".format(code)
+    return "\\U{:08x}".format(code)
+
+
+class SplitterFormatter(logging.Formatter):
+    """スプリッター形式のFormatter
+
+    logging.Formatter(Logger.makeformat().format)と同じ出力を、
+    属性とスプリッターから事前に準備した処理で作成する。
+
+    - 属性はoperator.attrgetterでまとめて取得し、%書式の解釈を行わない
+    - asctimeの秒までの部分は1秒ごとにキャッシュする
+    - フィールドにスプリッターや改行が含まれる場合は、
+      loganalで解析できるようにエスケープする（Notes参照）
+
+    dictConfigでは以下のように指定する。
+    {"formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}}
+
+    Notes
+    -----
+    - 文字列のフィールドは、文字列リテラル（reprで引用符付き）にしたうえで、
+      スプリッターの各文字を\\xNNの形でエスケープする。
+      loganalはこれを文字列リテラルとして評価するので、元の文字列に戻る
+      （function等のデコーダが文字列のままにする属性は、引用符付きのまま読み込まれる）
+    - 文字列以外(valuesの辞書等)は、reprの中のスプリッターをエスケープする
+    - 属性を持たないレコード（logtools.Logger以外からのログ）の値はNoneとして出力する
+    """
+    def __init__(self, attributes:tuple = None, splitter:str = None, datefmt:str = None):
+        """
+
+        Parameters
+        ----------
+        attributes : tuple of str, optional
+            出力する属性, by default None
+            Noneの場合はLogger.makeformat().attributes
+        splitter : str, optional
+            属性の区切り文字, by default None
+            Noneの場合はLogger.makeformat().splitter
+        datefmt : str, optional
+            asctimeの書式, by default None
+            logging.Formatterと同じ
+
+        Raises
+        ------
+        ValueError
+            スプリッターが空、または引用符やバックスラッシュを含む場合
+        """
+        if attributes is None:
+            attributes = Logger.makeformat().attributes
+        if splitter is None:
+            splitter = Logger.makeformat().splitter
+        if not splitter or any(c in splitter for c in "'\"\\"):
+            raise ValueError("splitter must be non-empty and must not contain quotes or backslashes")
+
+        self.attributes = tuple(attributes)
+        self.splitter = splitter
+        super().__init__(fmt = splitter.join("%(" + attrib + ")s" for attrib in self.attributes)
+                         , datefmt = datefmt)
+
+        self._getter = operator.attrgetter(*self.attributes)
+        self._uses_asctime = "asctime" in self.attributes
+        self._escaped_splitter = "".join(_escape_char(c) for c in splitter)
+        self._splitter_chars = frozenset(splitter)
+        # (秒, asctimeの秒までの部分)
+        self._asctime_cache = (None, None)
+
+    def formatTime(self, record, datefmt:str = None)->str:
+        """logging.Formatter.formatTimeと同じ文字列を、秒までの部分をキャッシュして作成する"""
+        second = int(record.created)
+        cached_second, text = self._asctime_cache
+        if cached_second != second:
+            text = time.strftime(datefmt or self.default_time_format, self.converter(record.created))
+            self._asctime_cache = (second, text)
+        if datefmt or not self.default_msec_format:
+            return text
+        return self.default_msec_format % (text, record.msecs)
+
+    def _escape(self, value, text:str)->str:
+        """解析時に区切りと誤認されないようにフィールドをエスケープする"""
+        if isinstance(value, str):
+            if (self.splitter in text or "\n" in text or "\r" in text
+                or (text and (text[0] in self._splitter_chars
+                              or text[-1] in self._splitter_chars))):
+                return repr(text).replace(self.splitter, self._escaped_splitter)
+            return text
+        return (text.replace(self.splitter, self._escaped_splitter)
+                .replace("\n", "\\n").replace("\r", "\\r"))
+
+    def format(self, record)->str:
+        record.message = record.getMessage()
+        if self._uses_asctime:
+            record.asctime = self.formatTime(record, self.datefmt)
+
+        try:
+            values = self._getter(record)
+        except AttributeError:
+            values = tuple(getattr(record, attrib, None) for attrib in self.attributes)
+        if len(self.attributes) == 1:
+            values = (values,)
+        texts = list(map(str, values))
+        line = self.splitter.join(texts)
+        if line.split(self.splitter) != texts or "\n" in line or "\r" in line:
+            line = self.splitter.join([self._escape(v, text) for v, text in zip(values, texts)])
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = line + "\n" + record.exc_text
+        if record.stack_info:
+            line = line + "\n" + self.formatStack(record.stack_info)
+        return line
@@ -0,0 +1,496 @@
+"""logtools用のHandler"""
+
+import locale
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+
+from logtools.compression import compress_file, SUFFIXES, WRITE_COMPRESSIONS
+from logtools.records import decode_record, dumps_records, encode_record, loads_records
+
+
+class BufferedRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """フォーマットしたレコードをバイト列のバッファにため、まとめて書き込むFileHandler
+
+    logging.handlers.RotatingFileHandlerはレコードごとに書き込み・flushと
+    ファイルサイズの確認(seek/tell)を行う。このハンドラはレコードをバッファにため、
+    以下のいずれかの場合にバッファ全体を1回のwriteで書き込む。
+
+    - バッファがbuffer_sizeバイト以上になった場合
+    - flush_level以上（デフォルトはERROR, CRITICAL）のレコードを受け取った場合
+    - 前回の書き込みからflush_interval秒以上経過した場合
+      （レコードを受け取った時点と、バックグラウンドスレッドで判定する）
+    - flush(), close()が呼ばれた場合
+
+    ローテーションはRotatingFileHandlerと同じ名前(.log -> .log.1 ...)で行い、
+    サイズ(maxBytes)と時間(rotate_interval)で判定する。
+    ファイルサイズはオープン時に1回だけ取得し、以降は書き込んだバイト数で数える。
+    compress="gzip"の場合、ローテーションしたファイルはバックグラウンドスレッドで
+    フレーム付きのgzip(.log.1.gz ...)に圧縮される（logtools.compression参照）。
+
+    dictConfigでは以下のように指定する。
+    {"handlers" : {"file" : {"class" : "logtools.handlers.BufferedRotatingFileHandler"
+                             , "filename" : "logfolder/logfile.log"
+                             , "maxBytes" : 10000000, "backupCount" : 3}}}
+
+    Notes
+    -----
+    - backupCountが0の場合はローテーションしない（RotatingFileHandlerと同じ）
+    - 書き込まれるまでのレコードはメモリ上にしかないため、
+      プロセスが異常終了した場合は最大でflush_interval秒分のレコードが失われる
+    - 非同期モード(Logger.enable_async)では、AsyncEmitterがキューを空にするたびにflushする
+      （負荷が高いほどまとめて書き込まれる）
+    - 圧縮中は圧縮前のファイル(.log.1)と圧縮後のファイル(.log.1.gz)が存在する期間がある。
+      前回の圧縮が終わる前に次のローテーションが必要になった場合は、圧縮の終了を待つ
+    - 圧縮に失敗した場合は圧縮前のファイルが残り、次のローテーションで同期的に圧縮し直す。
+      それでも失敗した場合は圧縮前のまま名前をずらし、backupCountに数える
+    """
+    def __init__(self, filename, mode:str = "a", maxBytes:int = 0, backupCount:int = 0
+                 , encoding:str = None, delay:bool = False, rotate_interval:float = None
+                 , buffer_size:int = 65536, flush_interval:float = 1.0
+                 , flush_level:int = logging.ERROR, compress:str = None):
+        """
+
+        Parameters
+        ----------
+        filename : path
+        mode : str, optional
+            "a"または"w", by default "a"
+            maxBytesまたはrotate_intervalを指定した場合は"a"になる
+        maxBytes : int, optional
+            ファイルの最大サイズ[byte], by default 0
+            0の場合はサイズではローテーションしない
+        backupCount : int, optional
+            残すローテーション済みファイルの数, by default 0
+        encoding : str, optional
+            by default None
+            Noneの場合はopen()と同じlocale.getpreferredencoding(False)
+        delay : bool, optional
+            最初の書き込みまでファイルを開かない, by default False
+        rotate_interval : float, optional
+            ローテーションの間隔[s], by default None
+            Noneの場合は時間ではローテーションしない
+        buffer_size : int, optional
+            バッファを書き込むサイズ[byte], by default 65536
+        flush_interval : float, optional
+            バッファを書き込む最大の間隔[s], by default 1.0
+            Noneの場合は時間では書き込まない（バックグラウンドスレッドも作成しない）
+        flush_level : int, optional
+            受け取った時点でバッファを書き込むレベル, by default logging.ERROR
+        compress : str, optional
+            ローテーションしたファイルの圧縮形式, by default None
+            "gzip"またはNone（圧縮しない）
+
+        Raises
+        ------
+        ValueError
+            buffer_sizeが0未満、flush_interval, rotate_intervalが0以下、
+            またはcompressが不正な場合
+        """
+        if buffer_size < 0:
+            raise ValueError("buffer_size must not be negative")
+        if flush_interval is not None and flush_interval <= 0:
+            raise ValueError("flush_interval must be positive")
+        if rotate_interval is not None and rotate_interval <= 0:
+            raise ValueError("rotate_interval must be positive")
+        if compress is not None and compress not in WRITE_COMPRESSIONS:
+            raise ValueError("compress must be one of " + str(WRITE_COMPRESSIONS))
+        if maxBytes > 0 or rotate_interval is not None:
+            mode = "a"
+
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.rotate_interval = rotate_interval
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.compress = compress
+        self._compressor = None # 圧縮中のスレッド
+        if encoding is None or encoding == "locale":
+            self._encoding = locale.getpreferredencoding(False)
+        else:
+            self._encoding = encoding
+
+        self._buffer = bytearray()
+        self._size = 0 # ファイルサイズ（書き込み済みの分）
+        self._records = 0
+        self._writes = 0
+        self._last_flush = time.monotonic()
+        self._rollover_at = None if rotate_interval is None else time.time() + rotate_interval
+
+        super().__init__(filename, mode, encoding, delay)
+        self.delay = delay
+
+        self._stop_event = threading.Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target = self._flush_periodically
+                                             , name = "logtools-BufferedRotatingFileHandler"
+                                             , daemon = True)
+            self._flusher.start()
+
+    @property
+    def records(self)->int:
+        """受け取ったレコードの累計"""
+        return self._records
+
+    @property
+    def writes(self)->int:
+        """ファイルへの書き込み(write)の累計"""
+        return self._writes
+
+    def _open(self):
+        """バッファなしのバイナリモードで開き、ファイルサイズを取得する"""
+        stream = open(self.baseFilename, self.mode.replace("b", "") + "b", buffering = 0)
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + self.terminator).encode(self._encoding)
+            if self.shouldRollover(record, len(data)):
+                self.doRollover()
+            self._buffer += data
+            self._records += 1
+            if (len(self._buffer) >= self.buffer_size
+                or record.levelno >= self.flush_level
+                or (self.flush_interval is not None
+                    and time.monotonic() - self._last_flush >= self.flush_interval)):
+                self._write_buffer()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def shouldRollover(self, record, size:int = 0)->bool:
+        """レコード(sizeバイト)を追加する前にローテーションするかどうか
+
+        ファイルサイズは書き込み済みのサイズとバッファのサイズから求める
+        """
+        if self.backupCount <= 0:
+            return False
+        if self.maxBytes > 0:
+            pending = self._size + len(self._buffer)
+            if pending > 0 and pending + size >= self.maxBytes:
+                return True
+        return self._rollover_at is not None and record.created >= self._rollover_at
+
+    def rotation_filename(self, default_name:str)->str:
+        """ローテーション後のファイル名（圧縮する場合は拡張子を付ける）"""
+        name = super().rotation_filename(default_name)
+        if self.compress is not None:
+            name += SUFFIXES[self.compress]
+        return name
+
+    def rotate(self, source:str, dest:str):
+        """sourceをdestにする
+
+        圧縮する場合は、拡張子のない名前に変更してから、バックグラウンドスレッドで圧縮する
+        """
+        if self.compress is None:
+            super().rotate(source, dest)
+            return
+        plain = dest[:-len(SUFFIXES[self.compress])]
+        if os.path.exists(source):
+            os.rename(source, plain)
+            self._compressor = threading.Thread(target = self._compress, args = (plain, dest)
+                                                , name = "logtools-BufferedRotatingFileHandler-compress")
+            self._compressor.start()
+
+    def _compress(self, plain:str, dest:str):
+        """ローテーションしたファイルを圧縮する（バックグラウンドスレッド）"""
+        try:
+            compress_file(plain, dest)
+        except Exception:
+            traceback.print_exc(file = sys.stderr)
+
+    def wait_compression(self, timeout:float = None):
+        """圧縮中のファイルがあれば、圧縮が終わるまで待つ"""
+        compressor = self._compressor
+        if compressor is not None:
+            compressor.join(timeout)
+
+    def _backup_names(self, i:int)->list:
+        """i番目のローテーション済みファイルの名前のリスト
+
+        圧縮する場合は、圧縮後の名前と圧縮に失敗した場合に残る圧縮前の名前
+        """
+        name = "%s.%d" % (self.baseFilename, i)
+        names = [self.rotation_filename(name)]
+        if self.compress is not None:
+            names.append(name)
+        return names
+
+    def _retry_compression(self):
+        """圧縮に失敗して残った圧縮前のファイルを同期的に圧縮する
+
+        再び失敗した場合は圧縮前のファイルのまま残す（ローテーションではそのまま名前をずらす）
+        """
+        if self.compress is None:
+            return
+        for i in range(1, self.backupCount + 1):
+            plain, dest = self._backup_names(i)[::-1]
+            if os.path.exists(plain):
+                try:
+                    compress_file(plain, dest)
+                except Exception:
+                    traceback.print_exc(file = sys.stderr)
+
+    def doRollover(self):
+        """バッファを書き込んでからローテーションする"""
+        self._write_buffer()
+        # 前回のローテーションの圧縮が終わる前に名前をずらさない
+        self.wait_compression()
+        self._retry_compression()
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0:
+            # 最も古いファイルは圧縮の有無によらず削除する
+            for dfn in self._backup_names(self.backupCount):
+                if os.path.exists(dfn):
+                    os.remove(dfn)
+            for i in range(self.backupCount - 1, 0, -1):
+                for sfn, dfn in zip(self._backup_names(i), self._backup_names(i + 1)):
+                    if os.path.exists(sfn):
+                        if os.path.exists(dfn):
+                            os.remove(dfn)
+                        os.rename(sfn, dfn)
+            for dfn in self._backup_names(1):
+                if os.path.exists(dfn):
+                    os.remove(dfn)
+            self.rotate(self.baseFilename, self._backup_names(1)[0])
+        self._size = 0
+        if not self.delay:
+            self.stream = self._open()
+        if self._rollover_at is not None:
+            now = time.time()
+            while self._rollover_at <= now:
+                self._rollover_at += self.rotate_interval
+
+    def _write_buffer(self):
+        """バッファを1回のwriteで書き込む（ロックを取得して呼ぶこと）"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        data, self._buffer = self._buffer, bytearray()
+        view = memoryview(data)
+        written = 0
+        while written < len(data):
+            # バッファなしのFileIO.writeは一部だけ書き込む場合がある
+            written += self.stream.write(view[written:])
+        self._size += len(data)
+        self._writes += 1
+
+    def flush(self):
+        """バッファを書き込む"""
+        self.acquire()
+        try:
+            self._write_buffer()
+        finally:
+            self.release()
+
+    def _flush_periodically(self):
+        """flush_intervalごとにバッファを書き込む（バックグラウンドスレッド）"""
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc(file = sys.stderr)
+
+    def close(self):
+        """バッファを書き込んでファイルを閉じる"""
+        self._stop_event.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.acquire()
+        try:
+            try:
+                self._write_buffer()
+            finally:
+                super().close()
+        finally:
+            self.release()
+        self.wait_compression()
+
+
+class RingBufferHandler(logging.handlers.MemoryHandler):
+    """直近のレコードをメモリ上のリングバッファに保持し、エラー時にまとめてtargetに出力するハンドラ
+
+    レコードはフォーマット(msg % argsの適用を含む)をせずに圧縮表現(logtools.records)で保持し、
+    capacity件（max_bytesを指定した場合はmax_bytesバイト以内）を超えると古いものから捨てる。
+    dump_level以上（デフォルトはERROR, CRITICAL）のレコードを受け取った場合やdump()を呼んだ場合に、
+    保持しているレコードを古い順にtargetに渡して、リングバッファを空にする。
+    フォーマットはtargetで行われるので、出力されなかったレコードのフォーマットのコストはかからない。
+
+    ロガーのレベルをDEBUGにし、通常のファイルハンドラのレベルをINFOにしたうえでこのハンドラを追加すると、
+    エラーの直前のDEBUGレベルのログだけが出力される。
+
+    dictConfigでは以下のように指定する（targetはハンドラ名で指定できる）。
+    {"handlers" : {"debug_file" : {"class" : "logging.FileHandler", "filename" : "debug.log"}
+                   , "ring" : {"class" : "logtools.handlers.RingBufferHandler"
+                               , "capacity" : 10000, "target" : "debug_file"}}}
+
+    Notes
+    -----
+    - logging.handlers.MemoryHandlerと異なり、flush()はtargetのflushだけを行う
+      （非同期モード等でflush()が頻繁に呼ばれても出力しない）
+    - リングバッファは件数分のスロットを事前に確保する
+    - valuesの辞書等の値とargsは、保持する時点の浅いコピーを保持する
+      （ログした後に呼び出し元で変更しても出力は変わらない。入れ子の中身の変更は反映される）
+    - max_bytesはpickleした圧縮表現のバイト数で判定する。
+      1件でmax_bytesを超えるレコードは、それだけを保持する
+    - exc_infoを持つレコードは、保持する時点でトレースバックを文字列にする
+    """
+    def __init__(self, capacity:int = 10000, max_bytes:int = None
+                 , dump_level:int = logging.ERROR, target = None, dump_on_close:bool = False):
+        """
+
+        Parameters
+        ----------
+        capacity : int, optional
+            保持する最大レコード数, by default 10000
+        max_bytes : int, optional
+            保持する最大バイト数, by default None
+            Noneの場合は件数だけで判定する（バイト列にしないので保持のコストが小さい）
+        dump_level : int, optional
+            受け取った時点で出力するレベル, by default logging.ERROR
+        target : logging.Handler, optional
+            出力先のハンドラ, by default None
+        dump_on_close : bool, optional
+            close()の際に保持しているレコードを出力するかどうか, by default False
+
+        Raises
+        ------
+        ValueError
+            capacity, max_bytesが1未満の場合
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        super().__init__(capacity, flushLevel = dump_level, target = target, flushOnClose = False)
+        self.max_bytes = max_bytes
+        self.dump_level = dump_level
+        self.dump_on_close = dump_on_close
+
+        self._slots = [None] * capacity
+        self._next = 0 # 次に書き込むスロット
+        self._count = 0
+        self._nbytes = 0
+        self._discarded = 0
+        self._dumps = 0
+
+    @property
+    def size(self)->int:
+        """保持しているレコード数"""
+        return self._count
+
+    @property
+    def nbytes(self)->int:
+        """保持しているレコードのバイト数（max_bytesを指定した場合のみ）"""
+        return self._nbytes
+
+    @property
+    def discarded(self)->int:
+        """出力されずに捨てられたレコードの累計"""
+        return self._discarded
+
+    @property
+    def dumps(self)->int:
+        """出力した回数の累計"""
+        return self._dumps
+
+    def emit(self, record):
+        try:
+            entry = encode_record(record, deferred = True)
+            if self.max_bytes is not None:
+                entry = dumps_records([entry])
+                while self._count and self._nbytes + len(entry) > self.max_bytes:
+                    self._discard_oldest()
+                self._nbytes += len(entry)
+            if self._count >= self.capacity:
+                self._discard_oldest()
+            self._slots[self._next] = entry
+            self._next = (self._next + 1) % self.capacity
+            self._count += 1
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= self.dump_level:
+            self._dump()
+
+    def _discard_oldest(self):
+        """最も古いレコードを捨てる（ロックを取得して呼ぶこと）"""
+        i = (self._next - self._count) % self.capacity
+        if self.max_bytes is not None:
+            self._nbytes -= len(self._slots[i])
+        self._slots[i] = None
+        self._count -= 1
+        self._discarded += 1
+
+    def _take(self)->list:
+        """保持しているレコードを古い順に取り出して空にする（ロックを取得して呼ぶこと）"""
+        start = (self._next - self._count) % self.capacity
+        if start + self._count <= self.capacity:
+            entries = self._slots[start:start + self._count]
+        else:
+            entries = self._slots[start:] + self._slots[:self._next]
+        self._slots = [None] * self.capacity
+        self._next = self._count = self._nbytes = 0
+        return entries
+
+    def _dump(self):
+        """保持しているレコードをtargetに出力する（ロックを取得して呼ぶこと）"""
+        if self.target is None:
+            return
+        entries = self._take()
+        for entry in entries:
+            fields = loads_records(entry)[0] if self.max_bytes is not None else entry
+            self.target.handle(decode_record(fields))
+        self.target.flush()
+        self._dumps += 1
+
+    def dump(self):
+        """保持しているレコードを古い順にtargetに出力し、リングバッファを空にする
+
+        targetが設定されていない場合は何もしない（レコードは保持したまま）
+        """
+        self.acquire()
+        try:
+            self._dump()
+        finally:
+            self.release()
+
+    def clear(self):
+        """保持しているレコードを出力せずに捨てる"""
+        self.acquire()
+        try:
+            self._discarded += self._count
+            self._take()
+        finally:
+            self.release()
+
+    def flush(self):
+        """targetをflushする（保持しているレコードは出力しない）"""
+        self.acquire()
+        try:
+            if self.target:
+                self.target.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            if self.dump_on_close:
+                self.dump()
+        finally:
+            super().close()
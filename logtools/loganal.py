@@ -2,15 +2,48 @@
 
 from __future__ import annotations # python3.9以降では不要
 
+import array
 import ast
+import bisect
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import codecs
+import datetime
+import locale
+import mmap
+import os
+import time
 import warnings
 
 
+import numpy as np
 import pandas as pd
 
+from logtools.compression import (detect_compression, frame_index, iter_decompressed
+                                  , read_head, uncompressed_size, SUFFIXES)
 from logtools.logging_tool import Logger
 
 
+# LogToDf.iter_chunksで1つのテーブルに含めるログ件数のデフォルト
+CHUNKSIZE = 100000
+
+# 並列処理の際にファイルを分割する目安のバイト数
+SPLIT_BYTES = 16 * 1024 * 1024
+
+# 追記・ローテーションの判定に使うファイル先頭のバイト数
+HEAD_BYTES = 4096
+
+# ファイルを走査する際に一度にデコードするブロックの目安のバイト数
+BLOCK_BYTES = 1024 * 1024
+
+# 時刻インデックス(TimeIndex)の1ブロックの目安のバイト数
+INDEX_BYTES = 64 * 1024
+
 ##########
 # Private
 ##########
@@ -53,7 +86,7 @@ def expand_dict(dic, head_str = None):
     return expanded_dic, remain_dic
 
 
-def breakdown_values(values):
+def breakdown_values(values, function = None):
     """辞書のログ内容（文字列）を展開された辞書型に変換する
     
     辞書のネストはすべて展開される
@@ -62,6 +95,9 @@ def breakdown_values(values):
     ----------
     values : str
         ast.literal_eval(values)で辞書型が返る文字列
+    function : str, optional
+        ログしたfunction, by default None
+        展開パターンのキャッシュ(ValuesFlattener)のキーに使う
 
     Returns
     -------
@@ -87,6 +123,30 @@ def breakdown_values(values):
         warnings.warn("values is not valid")
         return {"values" : values, "convert_exception" : "values error"}
     
+    return _FLATTENER.flatten(values_lit, function)
+
+
+def flatten_values(values_lit):
+    """評価済みのvaluesを展開された辞書型に変換する
+    
+    breakdown_valuesのast.literal_eval以降の処理
+
+    Parameters
+    ----------
+    values_lit : object
+        評価済みのvalues
+
+    Returns
+    -------
+    dict
+        展開された辞書
+        values_litがNoneの場合はNone
+    
+    Warnings
+    -------
+    UserWarning(values is not valid but work)
+        breakdown_valuesを参照
+    """
     if type(values_lit)==dict:
         
         expanded_dic, remain_dic = expand_dict(values_lit)
@@ -117,7 +177,173 @@ def breakdown_values(values):
     return res_dic
 
 
-def log_to_dict(unitlog_str, attributes:tuple, splitter:str)->dict:
+# ValuesFlattenerで保持する展開パターンの最大数
+FLATTEN_CACHE_SIZE = 1024
+
+def _node_markers(dic:dict, nodes:list, node_no:int = 0)->dict:
+    """ValuesFlattenerの展開パターンを作るための辞書を作る
+    
+    ネストの形をそのままに、辞書以外の値を(親の辞書の番号, キー)にする。
+    ネストされた辞書は出現順に番号を付け、(親の辞書の番号, キー, _dict_shape)をnodesに追加する。
+    """
+    markers = {}
+    for k, v in dic.items():
+        if type(v) == dict:
+            nodes.append((node_no, k, _dict_shape(v)))
+            markers[k] = _node_markers(v, nodes, len(nodes))
+        else:
+            markers[k] = (node_no, k)
+    return markers
+
+def _dict_shape(dic:dict)->tuple:
+    """辞書のキーと値の型のタプル"""
+    return tuple(dic), tuple(map(type, dic.values()))
+
+class ValuesFlattener():
+    """展開パターンをキャッシュしてvaluesの辞書を展開する
+    
+    同じ関数からのログのvaluesは、ほとんどの場合同じ形（キーとネスト）の辞書になる。
+    (function, 最上位のキーと値の型)ごとに、展開後のキーとその値へのパスをキャッシュしておき、
+    2回目以降はネストされた辞書の形を確認して値を取り出すだけにする。
+    ネストされた辞書の形が異なる場合はflatten_valuesで展開する。
+    結果は常にflatten_valuesと同じ。
+    """
+    def __init__(self, maxsize:int = FLATTEN_CACHE_SIZE):
+        """
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            保持する展開パターンの最大数, by default FLATTEN_CACHE_SIZE
+            超えた場合はキャッシュをクリアする
+        """
+        self.maxsize = maxsize
+        self._layouts = {}
+    
+    def flatten(self, values_lit, function = None)->dict:
+        """評価済みのvaluesを展開する（flatten_valuesと同じ）
+
+        Parameters
+        ----------
+        values_lit : object
+            評価済みのvalues
+        function : str, optional
+            ログしたfunction, by default None
+            展開パターンのキャッシュのキーに使う
+        """
+        if type(values_lit) != dict:
+            return flatten_values(values_lit)
+        
+        types = tuple(map(type, values_lit.values()))
+        if dict not in types:
+            # ネストがない場合はキーはそのまま
+            return dict(values_lit)
+        
+        key = (function, tuple(values_lit), types)
+        layout = self._layouts.get(key)
+        if layout is None:
+            if len(self._layouts) >= self.maxsize:
+                self._layouts.clear()
+            nodes = []
+            markers = _node_markers(values_lit, nodes)
+            layout = self._layouts[key] = (nodes, list(flatten_values(markers).items()))
+        
+        # 辞書の番号順（親が先）に、ネストされた辞書を取り出して形を確認する
+        nodes, leaves = layout
+        dics = [values_lit]
+        for parent_no, k, shape in nodes:
+            dic = dics[parent_no][k]
+            if _dict_shape(dic) != shape:
+                return flatten_values(values_lit)
+            dics.append(dic)
+        return {flat_key : dics[node_no][k] for flat_key, (node_no, k) in leaves}
+
+# breakdown_values等で使うValuesFlattener
+_FLATTENER = ValuesFlattener()
+
+# ast.literal_evalで評価できる文字列の先頭文字
+_LITERAL_HEADS = frozenset("0123456789.+-'\"([{ \t")
+# 文字列リテラルのプレフィックス(b'', r'', u''等)
+_STRING_PREFIXES = frozenset("bBrRuU")
+
+def decode_literal(v:str):
+    """可能であればast.literal_evalで型評価する
+    
+    明らかにリテラルではない文字列（"run"や"INFO"等）は
+    ast.literal_evalを呼ばずにそのまま返す
+    """
+    if not v:
+        return v
+    head = v[0]
+    if not (head in _LITERAL_HEADS
+            or (head in _STRING_PREFIXES and ("'" in v[1:3] or '"' in v[1:3]))
+            or v.rstrip() in ("None", "True", "False", "set()")):
+        return v
+    try:
+        return ast.literal_eval(v)
+    except (SyntaxError, ValueError):
+        return v
+
+def _decode_str(v:str):
+    return v
+
+def _decode_int(v:str):
+    try:
+        return int(v)
+    except ValueError:
+        return decode_literal(v)
+
+def _decode_float(v:str):
+    try:
+        return float(v)
+    except ValueError:
+        return decode_literal(v)
+
+# 組み込みの属性の型が既知であるもののデコーダ
+# ここにない属性(logtoolsオリジナルの属性やmessage等)はdecode_literalで評価する
+# https://docs.python.org/ja/3/library/logging.html#logrecord-attributes
+ATTRIBUTE_DECODERS = {"asctime" : _decode_str
+                      , "filename" : _decode_str
+                      , "funcName" : _decode_str
+                      , "levelname" : _decode_str
+                      , "module" : _decode_str
+                      , "name" : _decode_str
+                      , "pathname" : _decode_str
+                      , "processName" : _decode_str
+                      , "threadName" : _decode_str
+                      , "function" : _decode_str
+                      , "created" : _decode_float
+                      , "msecs" : _decode_float
+                      , "relativeCreated" : _decode_float
+                      , "levelno" : _decode_int
+                      , "process" : _decode_int
+                      , "thread" : _decode_int
+                      }
+
+def get_decoders(attributes:tuple)->tuple:
+    """attributesの各属性のデコーダのタプルを返す"""
+    return tuple(ATTRIBUTE_DECODERS.get(attrib, decode_literal) for attrib in attributes)
+
+# logging.Formatterのデフォルトのasctimeの書式
+ASCTIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+
+def apply_schema(df):
+    """テーブルの列を既知の型に変換する
+    
+    - asctime : datetime（デフォルトの書式で解釈できない値がある場合は文字列のまま）
+    - levelname : category
+    """
+    if ("asctime" in df.columns
+        and not pd.api.types.is_datetime64_any_dtype(df["asctime"])):
+        asctime = pd.to_datetime(df["asctime"], format = ASCTIME_FORMAT, errors = "coerce")
+        if asctime.notna().sum() == df["asctime"].notna().sum():
+            df["asctime"] = asctime
+    if "levelname" in df.columns:
+        df["levelname"] = df["levelname"].astype("category")
+    return df
+
+def log_to_dict(unitlog_str, attributes:tuple, splitter:str, decoders:tuple = None
+                , expand_values:bool = True)->dict:
     """log文字列（1件のログ）を辞書に変換する
 
     Parameters
@@ -129,6 +355,13 @@ def log_to_dict(unitlog_str, attributes:tuple, splitter:str)->dict:
         ログと内容・順序の整合性が取れている必要がある
     splitter : str
         ログの各属性間を表す仕切り文字
+    decoders : tuple of callable, optional
+        attributesの各属性のデコーダ, by default None
+        Noneの場合はget_decoders(attributes)
+        多数の行を処理する場合は、事前に作成したものを渡すと速い
+    expand_values : bool, optional
+        valuesを評価・展開するかどうか, by default True
+        Falseの場合は"values"キーに評価前の文字列を入れる（flatten_values_columnで後から展開できる）
 
     Returns
     -------
@@ -149,42 +382,1290 @@ def log_to_dict(unitlog_str, attributes:tuple, splitter:str)->dict:
         warnings.warn("strange format")
         return {"values" : unitlog_str, "convert_exception" : "strange format"}
     
-    ret_dic = {}
-    for k,v in zip(attributes[:-1], log_ls[:-1]):
-        try:
-            # 可能なものは型評価
-            v_lit = ast.literal_eval(v)
-        except (SyntaxError, ValueError):
-            v_lit = v
-        ret_dic[k] = v_lit
+    if decoders is None:
+        decoders = get_decoders(attributes)
+    
+    # 可能なものは型評価
+    ret_dic = {k : decode(v) for k, decode, v
+               in zip(attributes[:-1], decoders, log_ls[:-1])}
     
     # values属性の処理
-    val_dic = breakdown_values(log_ls[-1])
+    if not expand_values:
+        ret_dic["values"] = log_ls[-1]
+        return ret_dic
+    val_dic = breakdown_values(log_ls[-1], ret_dic.get("function"))
     if val_dic is not None:
         ret_dic.update(val_dic)
     
     return ret_dic
 
+def _iter_line_blocks(filepath, start:int = 0, end:int = None):
+    """ファイルのstart~endの範囲を、行の区切りに揃えたバイト列のブロックとして返す
+    
+    ファイルをメモリマップし、ブロック(目安BLOCK_BYTES)ごとにだけコピーする。
+    endが行の途中の場合は、その行の終わりまでを範囲とする。
+    圧縮されたファイルは逐次展開する（start, endは展開後の位置）。
+    """
+    compression = detect_compression(filepath)
+    if compression is not None:
+        yield from _iter_compressed_line_blocks(filepath, compression, start, end)
+        return
+    
+    with open(filepath, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if end is None or end > size:
+            end = size
+        if start >= end:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            if end < size and mm[end - 1] != 0x0a: # b"\n"
+                # endで始まる行の途中で終わらないようにする
+                nl = mm.find(b"\n", end)
+                end = size if nl < 0 else nl + 1
+            
+            pos = start
+            while pos < end:
+                block_end = min(pos + BLOCK_BYTES, end)
+                if block_end < end:
+                    nl = mm.rfind(b"\n", pos, block_end)
+                    if nl < 0:
+                        # BLOCK_BYTESより長い行
+                        nl = mm.find(b"\n", block_end, end)
+                    block_end = end if nl < 0 else nl + 1
+                yield mm[pos:block_end]
+                pos = block_end
+
+def _iter_compressed_line_blocks(filepath, compression:str, start:int = 0, end:int = None):
+    """圧縮されたファイルの_iter_line_blocks
+    
+    メモリマップできないので、展開したバイト列を行の区切りに揃えて返す。
+    フレーム付きのgzipの場合は、startを含むフレームから展開する。
+    """
+    if end is not None and start >= end:
+        return
+    pending = b""
+    for offset, data in iter_decompressed(filepath, start, compression):
+        if offset + len(data) <= start:
+            continue
+        if offset < start:
+            data = data[start - offset:]
+            offset = start
+        buf = pending + data
+        buf_start = offset - len(pending)
+        
+        if end is not None and buf_start + len(buf) >= end:
+            # endで始まる行の途中で終わらないようにする
+            nl = buf.find(b"\n", max(end - 1 - buf_start, 0))
+            if nl >= 0:
+                yield buf[:nl + 1]
+                return
+            pending = buf
+            continue
+        
+        nl = buf.rfind(b"\n")
+        if nl < 0:
+            pending = buf
+            continue
+        yield buf[:nl + 1]
+        pending = buf[nl + 1:]
+    if pending:
+        yield pending
+
+def logfile_size(filepath)->int:
+    """ログファイルのサイズ（圧縮されたファイルは展開後のサイズ）"""
+    compression = detect_compression(filepath)
+    if compression is None:
+        return os.path.getsize(filepath)
+    return uncompressed_size(filepath, compression)
+
+def _split_block(block):
+    """ブロックを行に分割する（最後の改行の後の空文字列は除く）"""
+    lines = block.split(b"\n" if isinstance(block, bytes) else "\n")
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+def iter_logfile_lines(filepath, start:int = 0, end:int = None):
+    """ログファイルのstart~endバイトの範囲で始まる行を順に返すジェネレータ
+    
+    ファイルはメモリマップされ、行ごとではなくブロックごとにデコード・分割される
+
+    Parameters
+    ----------
+    filepath : path
+    start : int, optional
+        読み始めるバイト位置, by default 0
+        行頭である必要がある
+    end : int, optional
+        この位置以降で始まる行は読まない, by default None
+        Noneの場合はファイルの最後まで読む
+
+    Yields
+    ------
+    str
+        改行コードを除いた1行
+    """
+    # open(filepath, "r")と同じエンコーディング
+    encoding = locale.getpreferredencoding(False)
+    for block in _iter_line_blocks(filepath, start, end):
+        for line in _split_block(block.decode(encoding)):
+            yield line.rstrip("\r")
+
+def iter_logfile_fields(filepath, splitter:str, n_fields:int, indices:tuple
+                        , start:int = 0, end:int = None):
+    """ログファイルの各行をスプリッターで分割し、必要なフィールドだけをデコードして返す
+    
+    UTF-8(ASCII)のファイルでは、デコードする前のバイト列のまま分割するので、
+    不要なフィールドのデコードは行わない。
+    start, endはiter_logfile_linesを参照
+
+    Parameters
+    ----------
+    filepath : path
+    splitter : str
+        ログの各属性間を表す仕切り文字
+    n_fields : int
+        1行のフィールド数（属性の数）
+    indices : tuple of int
+        デコードするフィールドの位置
+
+    Yields
+    ------
+    tuple(bytes or str, list of str)
+        (行, デコードしたフィールドのリスト(indicesの順))
+        フィールド数がn_fieldsと異なる場合、フィールドのリストはNone
+        行はdecode_lineで文字列にできる
+    """
+    encoding = locale.getpreferredencoding(False)
+    by_bytes = codecs.lookup(encoding).name in ("utf-8", "ascii")
+    for block in _iter_line_blocks(filepath, start, end):
+        if by_bytes:
+            sep = splitter.encode(encoding)
+        else:
+            block = block.decode(encoding)
+            sep = splitter
+        for line in _split_block(block):
+            line = line.rstrip(b"\r" if by_bytes else "\r")
+            parts = line.split(sep)
+            if len(parts) != n_fields:
+                yield line, None
+            elif by_bytes:
+                yield line, [parts[i].decode(encoding) for i in indices]
+            else:
+                yield line, [parts[i] for i in indices]
+
+def decode_line(line)->str:
+    """iter_logfile_fieldsが返す行を文字列にする"""
+    if isinstance(line, bytes):
+        return line.decode(locale.getpreferredencoding(False))
+    return line
+
+def split_logfile(filepath, split_bytes:int = None
+                  , start:int = 0, end:int = None)->list[tuple]:
+    """ログファイルを行頭に揃えたバイト範囲に分割する
+
+    Parameters
+    ----------
+    filepath : path
+    split_bytes : int, optional
+        1つの範囲の目安のバイト数, by default None
+        Noneの場合はSPLIT_BYTES
+    start : int, optional
+        分割する範囲の開始位置（行頭）, by default 0
+    end : int, optional
+        分割する範囲の終了位置, by default None
+        Noneの場合はファイルの最後
+
+    Returns
+    -------
+    list of tuple(int, int)
+        (start, end)のリスト
+        start~endを重複なく覆い、iter_logfile_linesの引数に使える
+    """
+    if split_bytes is None:
+        split_bytes = SPLIT_BYTES
+    size = logfile_size(filepath) if end is None else end
+    
+    compression = detect_compression(filepath)
+    if compression is not None:
+        return _split_compressed(filepath, compression, split_bytes, start, size)
+    
+    offsets = [start]
+    with open(filepath, "rb") as f:
+        target = start + split_bytes
+        while target < size:
+            # target-1から読むことで、targetが行頭の場合はtargetに揃う
+            f.seek(target - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            offsets.append(pos)
+            target = pos + split_bytes
+    offsets.append(size)
+    
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def _split_compressed(filepath, compression:str, split_bytes:int, start:int, size:int)->list[tuple]:
+    """圧縮されたファイルのsplit_logfile
+    
+    フレーム付きのgzipはフレームの境界（行頭）で分割する。
+    それ以外は途中から展開できないので分割しない。
+    """
+    frames = frame_index(filepath) if compression == "gzip" else None
+    offsets = [start]
+    if frames is not None:
+        target = start + split_bytes
+        for _, _, frame_start, _ in frames:
+            if frame_start >= size:
+                break
+            if frame_start >= target:
+                offsets.append(frame_start)
+                target = frame_start + split_bytes
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def json_to_dict(unitlog_str, expand_values:bool = True)->dict:
+    """JSON Lines形式のlog文字列（1件のログ）を辞書に変換する
+    
+    logtools.formatters.JsonFormatterで出力したログを対象とする
+    valuesはlog_to_dictと同様に展開される
+
+    Parameters
+    ----------
+    unitlog_str : str
+        1件のログ
+    expand_values : bool, optional
+        valuesを展開するかどうか, by default True
+        Falseの場合は"values"キーに辞書のまま残す
+
+    Returns
+    -------
+    dict
+        辞書化されたログ
+    """
+    try:
+        ret_dic = json.loads(unitlog_str)
+    except ValueError:
+        ret_dic = None
+    if type(ret_dic) != dict:
+        warnings.warn("strange format")
+        return {"values" : unitlog_str, "convert_exception" : "strange format"}
+    
+    if expand_values and "values" in ret_dic:
+        val_dic = _FLATTENER.flatten(ret_dic.pop("values"), ret_dic.get("function"))
+        if val_dic is not None:
+            ret_dic.update(val_dic)
+    
+    return ret_dic
+
+# ログファイルの形式
+# - "text" : Logger.makeformat().formatで出力した、スプリッターで区切られた形式
+# - "jsonl" : logtools.formatters.JsonFormatterで出力したJSON Lines形式
+LOGFORMATS = tuple(["text", "jsonl"])
+
+def get_line_parser(attributes:tuple, splitter:str, logformat:str = "text"
+                    , expand_values:bool = True):
+    """1行を辞書に変換する関数を返す
+    
+    expand_valuesはlog_to_dictを参照
+
+    Raises
+    ------
+    ValueError
+        logformatがLOGFORMATSに含まれない場合
+    """
+    if logformat == "text":
+        return functools.partial(log_to_dict, attributes = attributes, splitter = splitter
+                                 , decoders = get_decoders(attributes)
+                                 , expand_values = expand_values)
+    elif logformat == "jsonl":
+        return functools.partial(json_to_dict, expand_values = expand_values)
+    else:
+        raise ValueError("logformat must be one of " + str(LOGFORMATS))
+
+def last_line_end(filepath, size:int = None)->int:
+    """最後の改行コードの直後の位置を返す
+    
+    書き込み途中の（改行で終わっていない）最後の行を除いた範囲の終わり
+    改行がない場合は0
+    圧縮されたファイルのsizeは展開後のサイズ(logfile_size)
+    """
+    if size is None:
+        size = logfile_size(filepath)
+    compression = detect_compression(filepath)
+    if compression is not None:
+        return _compressed_last_line_end(filepath, compression, size)
+    blocksize = 4096
+    with open(filepath, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - blocksize)
+            f.seek(start)
+            pos = f.read(end - start).rfind(b"\n")
+            if pos >= 0:
+                return start + pos + 1
+            end = start
+    return 0
+
+def _compressed_last_line_end(filepath, compression:str, size:int)->int:
+    """圧縮されたファイルのlast_line_end
+    
+    フレーム付きのgzipは最後のフレームだけを展開する（フレームの先頭は行頭）
+    """
+    line_end = None
+    for offset, data in iter_decompressed(filepath, max(size - 1, 0), compression):
+        if offset >= size:
+            break
+        if line_end is None:
+            line_end = offset
+        pos = data.rfind(b"\n", 0, size - offset)
+        if pos >= 0:
+            line_end = offset + pos + 1
+    return line_end or 0
+
+# whereで絞り込みができる属性
+WHERE_ATTRIBUTES = tuple(["levelname", "name", "tag", "function", "action"])
+
+def make_matchers(where:dict, attributes:tuple)->dict:
+    """whereの条件を、属性の文字列（評価前）を判定する関数の辞書にする
+
+    Parameters
+    ----------
+    where : dict
+        属性 -> 許可する値(str, またはstrのリスト)
+        属性はWHERE_ATTRIBUTESのいずれか
+        nameは前方一致、それ以外は完全一致で判定する
+        Noneを指定するとNoneがログされたものに一致する
+    attributes : tuple of str
+        ログ属性のタプル
+
+    Returns
+    -------
+    dict
+        属性 -> 判定する関数
+
+    Raises
+    ------
+    ValueError
+        whereの属性がWHERE_ATTRIBUTESまたはattributesに含まれない場合
+    """
+    matchers = {}
+    for attrib, cond in where.items():
+        if attrib not in WHERE_ATTRIBUTES:
+            raise ValueError("where supports only " + str(WHERE_ATTRIBUTES))
+        if attrib not in attributes:
+            raise ValueError(attrib + " is not in attributes")
+        if isinstance(cond, str) or cond is None:
+            cond = [cond]
+        allowed = tuple(str(v) for v in cond)
+        if attrib == "name":
+            matchers[attrib] = functools.partial(_startswith, prefixes = allowed)
+        else:
+            matchers[attrib] = frozenset(allowed).__contains__
+    return matchers
+
+def _startswith(v:str, prefixes:tuple)->bool:
+    return v.startswith(prefixes)
+
+def _iter_text_pushdown(filepath, attributes:tuple, splitter:str, start:int, end:int
+                        , where:dict, columns:list, expand_values:bool = True):
+    """スプリッター形式のログファイルを、whereとcolumnsを適用しながら辞書にする
+    
+    whereの判定は評価前のフィールドの文字列で行い、
+    不一致の行はそれ以外のフィールドのデコードも評価も行わない。
+    valuesはcolumnsに属性以外の列が含まれる場合にだけ評価・展開する。
+    expand_valuesがFalseの場合は、columnsに"values"が含まれる場合にだけ評価前の文字列を返す。
+    """
+    matchers = make_matchers(where or {}, attributes)
+    decoders = get_decoders(attributes)
+    n_fields = len(attributes)
+    values_index = n_fields - 1
+    
+    if columns is None:
+        out_indices = list(range(n_fields - 1))
+        needs_values = True
+    else:
+        out_indices = [i for i, attrib in enumerate(attributes[:-1]) if attrib in columns]
+        if expand_values:
+            needs_values = any(col not in attributes for col in columns)
+        else:
+            needs_values = "values" in columns
+    where_indices = [attributes.index(attrib) for attrib in matchers]
+    indices = sorted(set(out_indices) | set(where_indices)
+                     | ({values_index} if needs_values else set()))
+    position = {i : pos for pos, i in enumerate(indices)}
+    where_items = [(position[attributes.index(attrib)], matcher)
+                   for attrib, matcher in matchers.items()]
+    out_items = [(attributes[i], decoders[i], position[i]) for i in out_indices]
+    
+    for line, fields in iter_logfile_fields(filepath, splitter, n_fields, tuple(indices)
+                                            , start, end):
+        if fields is None:
+            if matchers:
+                # 判定できないので除外する
+                continue
+            warnings.warn("strange format")
+            yield {"values" : decode_line(line), "convert_exception" : "strange format"}
+            continue
+        
+        if not all(matcher(fields[pos]) for pos, matcher in where_items):
+            continue
+        
+        ret_dic = {attrib : decode(fields[pos]) for attrib, decode, pos in out_items}
+        if needs_values and not expand_values:
+            ret_dic["values"] = fields[position[values_index]]
+        elif needs_values:
+            val_dic = breakdown_values(fields[position[values_index]], ret_dic.get("function"))
+            if val_dic is not None:
+                ret_dic.update(_select_columns(val_dic, columns))
+        yield ret_dic
+
+def _select_columns(dic:dict, columns:list)->dict:
+    """columnsに含まれるキーだけを残す（convert_exceptionは常に残す）"""
+    if columns is None:
+        return dic
+    return {k : v for k, v in dic.items() if k in columns or k == "convert_exception"}
+
+def _iter_jsonl_pushdown(filepath, attributes:tuple, start:int, end:int
+                         , where:dict, columns:list, expand_values:bool = True):
+    """JSON Lines形式のログファイルを、whereとcolumnsを適用しながら辞書にする
+    
+    whereの判定はvaluesを展開する前に行う
+    """
+    matchers = make_matchers(where or {}, attributes)
+    for line in iter_logfile_lines(filepath, start, end):
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            obj = None
+        if type(obj) != dict:
+            if matchers:
+                continue
+            warnings.warn("strange format")
+            yield {"values" : line, "convert_exception" : "strange format"}
+            continue
+        
+        if not all(matcher(str(obj.get(attrib))) for attrib, matcher in matchers.items()):
+            continue
+        
+        if not expand_values:
+            yield _select_columns(obj, columns)
+            continue
+        values = obj.pop("values", None)
+        ret_dic = _select_columns(obj, columns)
+        if columns is None or any(col not in obj for col in columns):
+            val_dic = _FLATTENER.flatten(values, obj.get("function"))
+            if val_dic is not None:
+                ret_dic.update(_select_columns(val_dic, columns))
+        yield ret_dic
+
+def iter_logfile(filepath, attributes:tuple, splitter:str
+                 , start:int = 0, end:int = None, logformat:str = "text"
+                 , where:dict = None, columns:list = None, expand_values:bool = True):
+    """ログファイルを1件ずつ辞書にして返すジェネレータ
+    
+    ファイル全体をメモリに読み込まない
+    start, endはiter_logfile_lines、logformatはLOGFORMATS、whereはmake_matchers、
+    expand_valuesはlog_to_dictを参照
+    columnsを指定した場合は、その列(とconvert_exception)だけを返す
+    """
+    if where or columns is not None:
+        if logformat == "text":
+            yield from _iter_text_pushdown(filepath, attributes, splitter, start, end
+                                           , where, columns, expand_values)
+        else:
+            yield from _iter_jsonl_pushdown(filepath, attributes, start, end, where, columns
+                                            , expand_values)
+        return
+    
+    parse = get_line_parser(attributes, splitter, logformat, expand_values)
+    for line in iter_logfile_lines(filepath, start, end):
+        yield parse(line)
+
+def _parse_range(task)->list[dict]:
+    """並列処理用：ファイルの1範囲を辞書のリストにする
+
+    Parameters
+    ----------
+    task : tuple
+        (filepath, start, end, attributes, splitter, logformat, where, columns, expand_values)
+    """
+    (filepath, start, end, attributes, splitter, logformat, where, columns
+     , expand_values) = task
+    return list(iter_logfile(filepath, attributes, splitter, start, end, logformat
+                             , where, columns, expand_values))
+
 def logfile_converter(filepath, attributes:tuple, splitter:str)->list[dict]:
     """ログファイルを1件ごとに辞書にしたリストを作成する
     
     log_to_dict()をループする
     """
+    return list(iter_logfile(filepath, attributes, splitter))
+
+def _head_digest(filepath, offset:int)->str:
+    """ファイルの先頭(最大HEAD_BYTES)のハッシュ値
+    
+    読み込み済みのファイルに追記されただけなのかどうかの判定に使う
+    """
+    n_bytes = min(offset, HEAD_BYTES)
+    compression = detect_compression(filepath)
+    if compression is not None:
+        return hashlib.sha1(read_head(filepath, n_bytes, compression)).hexdigest()
+    with open(filepath, "rb") as f:
+        return hashlib.sha1(f.read(n_bytes)).hexdigest()
+
+def _to_repr(v):
+    """LogCacheでobject型の列の値をreprとして保存する（欠損値はNone）"""
+    if isinstance(v, float) and v != v:
+        return None
+    return repr(v)
+
+# reprでは名前になるfloatの特殊な値
+_SPECIAL_FLOATS = {"inf" : float("inf"), "nan" : float("nan")}
+
+class _SpecialFloatTransformer(ast.NodeTransformer):
+    """inf, nanの名前を定数にする（-infは単項マイナスとして評価される）"""
+    def visit_Name(self, node):
+        if node.id in _SPECIAL_FLOATS:
+            return ast.copy_location(ast.Constant(_SPECIAL_FLOATS[node.id]), node)
+        return node
+
+def _restore_repr(v):
+    """LogCacheでreprとして保存した値を元に戻す"""
+    if not isinstance(v, str):
+        return float("nan")
+    try:
+        return ast.literal_eval(v)
+    except ValueError:
+        # repr(float("inf"))等は"inf"となりliteral_evalで評価できない
+        tree = _SpecialFloatTransformer().visit(ast.parse(v, mode = "eval"))
+        return ast.literal_eval(tree)
+
+def to_datetime(v):
+    """asctimeや時刻の指定をdatetime.datetimeにする
+
+    Parameters
+    ----------
+    v : str, datetime.datetime, pandas.Timestamp or None
+        文字列の場合はASCTIME_FORMAT、またはpandas.Timestampが解釈できる書式
+
+    Returns
+    -------
+    datetime.datetime
+        解釈できない場合はNone
+    """
+    if v is None or isinstance(v, datetime.datetime) and not isinstance(v, pd.Timestamp):
+        return v
+    if isinstance(v, str):
+        try:
+            return datetime.datetime.strptime(v, ASCTIME_FORMAT)
+        except ValueError:
+            pass
+    try:
+        ts = pd.Timestamp(v)
+    except (ValueError, TypeError):
+        return None
+    return None if ts is pd.NaT else ts.to_pydatetime()
+
+def get_asctime_getter(attributes:tuple, splitter:str, logformat:str = "text"):
+    """1行(バイト列)からasctimeの文字列を取り出す関数を返す
+
+    Raises
+    ------
+    ValueError
+        ログの属性にasctimeが含まれない場合
+    """
+    encoding = locale.getpreferredencoding(False)
+    if logformat == "jsonl":
+        def get_asctime(line):
+            try:
+                return json.loads(line.decode(encoding)).get("asctime")
+            except (ValueError, AttributeError):
+                return None
+        return get_asctime
+    
+    if "asctime" not in attributes:
+        raise ValueError("asctime is not in attributes")
+    index = list(attributes).index("asctime")
+    n_fields = len(attributes)
+    def get_asctime(line):
+        parts = line.decode(encoding).split(splitter)
+        return parts[index] if len(parts) == n_fields else None
+    return get_asctime
+
+def _to_time_bound(v):
+    """LogToDfのstart, end引数をdatetime.datetimeにする
+
+    Raises
+    ------
+    ValueError
+        時刻として解釈できない場合
+    """
+    ts = to_datetime(v)
+    if v is not None and ts is None:
+        raise ValueError("invalid time : " + str(v))
+    return ts
+
+def _concat_chunks(df_ls:list):
+    """チャンクを結合する
+    
+    欠損値の表現(None/NaN)と列の型はチャンクごとに推定されるため、
+    結合すると同じ列にNoneとNaNが混在し、型もチャンクの区切り方(chunksize, merge)によって変わる。
+    convertの出力がチャンクの区切り方によらず、1つのチャンクで作成した場合と同一になるように、
+    
+    - すべて欠損値の列はobject型のNoneにする
+    - 欠損値を含むobject型の列は、欠損値をNoneにして型を推定し直す
+      （文字列とNoneだけの列は文字列型のNaN、それ以外はobject型のNoneになる）
+    """
+    if not df_ls:
+        return pd.DataFrame()
+    df = pd.concat(df_ls, ignore_index = True)
+    for col in df.columns:
+        column = df[col]
+        missing = column.isna()
+        if not missing.any():
+            continue
+        if missing.all():
+            df[col] = pd.Series([None] * len(df), index = df.index, dtype = object)
+        elif column.dtype == object:
+            values = column.tolist()
+            for i in np.flatnonzero(missing.to_numpy()):
+                values[i] = None
+            df[col] = pd.Series(values, index = df.index)
+    return df
+
+def _time_key(dic:dict)->tuple:
+    """asctimeで並べる際のキー（asctimeがないログは最後）
+    
+    asctimeはデフォルトの書式では文字列の順と時刻の順が一致するので、文字列で比較する
+    """
+    asctime = dic.get("asctime")
+    if asctime is None or asctime != asctime:
+        return (1, "")
+    return (0, str(asctime))
+
+def is_time_ordered(filepath, attributes:tuple, splitter:str, logformat:str = "text")->bool:
+    """ログファイルがasctimeの順に並んでいるかどうか
+    
+    asctimeのフィールドだけを取り出して確認する（valuesの評価等は行わない）
+    asctimeのない行（フォーマット異常の行）の後にasctimeのある行がある場合もFalse
+    スプリッター形式でattributesにasctimeが含まれない場合は、警告を出してTrueを返す
+    （並び変えることができないため、行の順のままとする）
+    """
+    if logformat == "text" and "asctime" not in attributes:
+        warnings.warn("asctime is not in attributes")
+        return True
+    get_asctime = get_asctime_getter(attributes, splitter, logformat)
+    prev = (0, "")
+    for block in _iter_line_blocks(filepath):
+        for line in _split_block(block):
+            key = _time_key({"asctime" : get_asctime(line.rstrip(b"\r"))})
+            if key < prev:
+                return False
+            prev = key
+    return True
+
+def _in_time_range(ts, start, end)->bool:
+    """tsがstart~end（両端を含む）に含まれるか（tsがNoneの場合はFalse）"""
+    if ts is None:
+        return False
+    if start is not None and ts < start:
+        return False
+    if end is not None and ts > end:
+        return False
+    return True
+
+# ColumnAccumulatorで値を辞書引きしてコードとして保持する属性
+# 種類が少なく、同じ文字列が繰り返し現れる
+CATEGORY_ATTRIBUTES = tuple(["levelname", "name", "function", "action", "tag"])
+
+# ColumnAccumulatorの列のバッファの種類
+_CATEGORY, _INT, _FLOAT, _OBJECT = range(4)
+
+# ログにキーがない場合の値（pandas.DataFrame(list of dict)と同じくNaN）
+# 辞書引きで同一のオブジェクトとして扱えるように、1つのオブジェクトを使う
+_MISSING = float("nan")
+
+class ColumnAccumulator():
+    """ログ(辞書)を列ごとのバッファにためて、最後にpandas.DataFrameを作成する
+    
+    ログごとの辞書のリストを保持する代わりに、列ごとに以下のバッファに値を追加する。
+    - CATEGORY_ATTRIBUTESの列 : 値(str, None)の辞書とコード(array)
+    - int/floatだけの列 : 型付きのarray
+    - その他の列 : 値のリスト
+    他の型の値が現れた場合（int/floatの列の欠損を含む）は、その列をリストに切り替える。
+    作成されるDataFrameは、同じログのリストをpandas.DataFrameに渡した場合と同じになる。
+    """
+    def __init__(self, category_columns:tuple = CATEGORY_ATTRIBUTES):
+        """
+
+        Parameters
+        ----------
+        category_columns : tuple of str, optional
+            値の辞書とコードで保持する列, by default CATEGORY_ATTRIBUTES
+        """
+        self.category_columns = frozenset(category_columns)
+        self._n_rows = 0
+        self._buffers = {} # 列名 -> バッファ（列の順は最初に現れた順）
+        self._kinds = {} # 列名 -> バッファの種類
+        self._codes = {} # 列名 -> {値 : コード}
+    
+    def __len__(self)->int:
+        return self._n_rows
+    
+    def append(self, dic:dict):
+        """ログを1件追加する"""
+        n_rows = self._n_rows
+        buffers, kinds = self._buffers, self._kinds
+        for key, value in dic.items():
+            buf = buffers.get(key)
+            if buf is None:
+                buf = self._new_buffer(key, value)
+            if len(buf) < n_rows:
+                buf = self._pad(key, n_rows)
+            
+            kind = kinds[key]
+            if kind == _OBJECT:
+                buf.append(value)
+                continue
+            if kind == _CATEGORY:
+                if type(value) is str or value is None:
+                    codes = self._codes[key]
+                    code = codes.get(value)
+                    if code is None:
+                        code = codes[value] = len(codes)
+                    buf.append(code)
+                    continue
+            elif type(value) is (int if kind == _INT else float):
+                try:
+                    buf.append(value)
+                    continue
+                except OverflowError:
+                    # int64に収まらない値
+                    pass
+            self._to_object(key).append(value)
+        self._n_rows = n_rows + 1
+    
+    def _new_buffer(self, key, value):
+        if key in self.category_columns:
+            kind, buf = _CATEGORY, array.array("i")
+            self._codes[key] = {}
+        elif type(value) is int:
+            kind, buf = _INT, array.array("q")
+        elif type(value) is float:
+            kind, buf = _FLOAT, array.array("d")
+        else:
+            kind, buf = _OBJECT, []
+        self._kinds[key] = kind
+        self._buffers[key] = buf
+        return buf
+    
+    def _pad(self, key, n_rows:int):
+        """列をn_rows件になるまで欠損値で埋める"""
+        kind, n_missing = self._kinds[key], n_rows - len(self._buffers[key])
+        if kind == _CATEGORY:
+            codes = self._codes[key]
+            code = codes.get(_MISSING)
+            if code is None:
+                code = codes[_MISSING] = len(codes)
+            self._buffers[key].extend([code] * n_missing)
+        elif kind == _FLOAT:
+            self._buffers[key].extend([_MISSING] * n_missing)
+        else:
+            # intの列に欠損がある場合はfloatにするかどうかをpandasに任せる
+            self._to_object(key).extend([_MISSING] * n_missing)
+        return self._buffers[key]
+    
+    def _to_object(self, key)->list:
+        """列のバッファを値のリストに切り替える"""
+        kind, buf = self._kinds[key], self._buffers[key]
+        if kind == _CATEGORY:
+            values = list(self._codes.pop(key))
+            buf = [values[code] for code in buf]
+        elif kind != _OBJECT:
+            buf = buf.tolist()
+        self._kinds[key] = _OBJECT
+        self._buffers[key] = buf
+        return buf
+    
+    def to_df(self):
+        """ためたログからpandas.DataFrameを作成する"""
+        if not self._n_rows:
+            return pd.DataFrame()
+        data = {}
+        for key in self._buffers:
+            buf = self._pad(key, self._n_rows)
+            kind = self._kinds[key]
+            if kind == _CATEGORY:
+                values = np.empty(len(self._codes[key]), dtype = object)
+                for i, value in enumerate(self._codes[key]):
+                    values[i] = value
+                values = values[np.frombuffer(buf, dtype = np.intc)]
+                if any(type(value) is str for value in self._codes[key]):
+                    data[key] = values
+                else:
+                    # 欠損値だけの列はobjectの配列では型が推定されないので、リストにする
+                    data[key] = values.tolist()
+            elif kind == _INT:
+                data[key] = np.frombuffer(buf, dtype = np.int64)
+            elif kind == _FLOAT:
+                data[key] = np.frombuffer(buf, dtype = np.float64)
+            else:
+                data[key] = buf
+        if not data:
+            # 列のないログだけの場合も行数は保つ
+            return pd.DataFrame([{}] * self._n_rows)
+        return pd.DataFrame(data)
+
+def records_to_df(records):
+    """ログ(辞書)のイテラブルをColumnAccumulatorでpandas.DataFrameにする"""
+    accumulator = ColumnAccumulator()
+    for dic in records:
+        accumulator.append(dic)
+    return accumulator.to_df()
+
+# LogToDfの解析エンジン
+# - "vectorized" : 行をまとめて列ごとに処理する(lines_to_df)
+# - "python" : 1行ずつ辞書にする(log_to_dict)
+ENGINES = tuple(["vectorized", "python"])
+
+# デコード結果をほかの行と共有しない型
+# 行の間で共有してよい（変更不可能な）値の型
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None))
+
+def _is_shareable(value)->bool:
+    """中身まで変更不可能な値かどうか（変更可能な値を含むtuple等はFalse）"""
+    if type(value) in (tuple, frozenset):
+        return all(_is_shareable(v) for v in value)
+    return type(value) in _IMMUTABLE_TYPES
+
+def _decode_column(fields, decode)->list:
+    """1列分のフィールドの文字列をデコードする
+    
+    同じ文字列は1度だけデコードする
+    （list等の変更可能な値、それを含むtuple等は行ごとにデコードする）
+    """
+    if decode is _decode_str:
+        return list(fields)
+    decoded = {v : decode(v) for v in set(fields)}
+    fresh = {v for v, d in decoded.items() if not _is_shareable(d)}
+    if fresh:
+        return [decode(v) if v in fresh else decoded[v] for v in fields]
+    return [decoded[v] for v in fields]
+
+def lines_to_df(lines:list, attributes:tuple, splitter:str, decoders:tuple = None
+                , expand_values:bool = True):
+    """複数行のログを列ごとにまとめて処理して、テーブルにする
+    
+    log_to_dictの結果をColumnAccumulatorでテーブルにした場合と同じテーブルを返す。
+    属性のフィールドは列ごとに分割・デコードし（同じ文字列は1度だけデコードする）、
+    フィールド数が合わない行（フォーマット異常）だけをlog_to_dictで処理する。
+    valuesは行ごとにbreakdown_valuesで展開する（展開パターンはfunctionごとにキャッシュされる）。
 
-    with open(filepath,"r") as f:
-        log_ls = []
-        for line in f:
-            log_ls.append(log_to_dict(line.replace("\n", ""), attributes, splitter))
+    Parameters
+    ----------
+    lines : list of str
+        ログの行（改行を含まない）
+    attributes : tuple of str
+        ログ属性のタプル（最後はvalues）
+    splitter : str
+        ログの各属性間を表す仕切り文字
+    decoders : tuple of callable, optional
+        attributesの各属性のデコーダ, by default None
+    expand_values : bool, optional
+        valuesを評価・展開するかどうか, by default True
+        log_to_dictを参照
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    if decoders is None:
+        decoders = get_decoders(attributes)
+    n_fields = len(attributes)
+    
+    split_ls = [line.split(splitter) for line in lines]
+    good = [len(fields) == n_fields for fields in split_ls]
+    good_split = [fields for fields, ok in zip(split_ls, good) if ok]
+    # 列ごとのフィールドの文字列
+    field_columns = list(zip(*good_split)) if good_split else [()] * n_fields
+    
+    # values（フォーマット異常の行はlog_to_dictの結果）をためる
+    extra = ColumnAccumulator()
+    head_columns = None # 最初の正常な行より前に現れた列
+    values_iter = iter(field_columns[-1])
+    if "function" in attributes[:-1]:
+        functions_iter = iter(field_columns[attributes.index("function")])
+    else:
+        functions_iter = itertools.repeat(None)
+    for line, ok in zip(lines, good):
+        if not ok:
+            extra.append(log_to_dict(line, attributes, splitter, decoders))
+            continue
+        if head_columns is None:
+            head_columns = list(extra._buffers)
+        if expand_values:
+            val_dic = breakdown_values(next(values_iter), next(functions_iter))
+            extra.append({} if val_dic is None else val_dic)
+        else:
+            extra.append({"values" : next(values_iter)})
+    extra_df = extra.to_df()
+    
+    if head_columns is None:
+        # すべてフォーマット異常
+        return extra_df
+    if any(attrib in extra_df.columns for attrib in attributes[:-1]):
+        # valuesのキーが属性と重複する場合は、辞書での上書きの順序を再現できないので1行ずつ処理する
+        return records_to_df(log_to_dict(line, attributes, splitter, decoders, expand_values)
+                             for line in lines)
+    
+    data = {}
+    for attrib, decode, fields in zip(attributes[:-1], decoders, field_columns):
+        decoded = _decode_column(fields, decode)
+        if len(decoded) == len(lines):
+            data[attrib] = decoded
+        else:
+            decoded_iter = iter(decoded)
+            data[attrib] = [next(decoded_iter) if ok else _MISSING for ok in good]
+    
+    order = (head_columns + list(attributes[:-1])
+             + [col for col in extra_df.columns if col not in head_columns])
+    for col in extra_df.columns:
+        data[col] = extra_df[col]
+    return pd.DataFrame(data, columns = order)
+
+def flatten_values_column(df, keys:list = None):
+    """valuesを展開せずに作成したテーブル(LogToDf(expand_values=False))のvalues列を展開する
+    
+    values列を、展開した列に置き換えたテーブルを返す。
+    必要な行だけに絞り込んでから呼ぶと、その行のvaluesだけが評価・展開される。
+    フォーマット異常の行(convert_exceptionがある行)のvaluesはそのまま残す。
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        values列を含むテーブル
+    keys : list of str, optional
+        展開後の列のうち追加する列, by default None
+        Noneの場合はすべての列
+
+    Returns
+    -------
+    pandas.DataFrame
+        valuesを展開したテーブル
+        valuesのキーが既存の列と重複する場合は、キーのある行はvaluesの値で上書きされる
+    """
+    if "values" not in df.columns:
+        return df
+    n_rows = len(df)
+    functions = df["function"].tolist() if "function" in df.columns else [None] * n_rows
+    if "convert_exception" in df.columns:
+        exceptions = df["convert_exception"].notna().tolist()
+    else:
+        exceptions = [False] * n_rows
     
-    return log_ls
+    accumulator = ColumnAccumulator()
+    for values, function, exception in zip(df["values"].tolist(), functions, exceptions):
+        if exception:
+            val_dic = {"values" : values}
+        elif isinstance(values, str):
+            val_dic = breakdown_values(values, function)
+        else:
+            val_dic = _FLATTENER.flatten(values, function)
+        if val_dic is None:
+            val_dic = {}
+        elif keys is not None:
+            val_dic = {k : v for k, v in val_dic.items()
+                       if k in keys or k in ("values", "convert_exception")}
+        accumulator.append(val_dic)
+    values_df = accumulator.to_df()
+    values_df.index = df.index
+    
+    df = df.drop(columns = "values")
+    for col in [col for col in values_df.columns if col in df.columns]:
+        df[col] = values_df.pop(col).combine_first(df[col])
+    return pd.concat([df, values_df], axis = 1)
 
 ##########
 # Public
 ##########
+class TimeIndex():
+    """ログファイルの疎な時刻インデックス
+    
+    ファイルを行頭に揃えたブロック(目安INDEX_BYTES)に分け、
+    ブロックごとに(開始位置, 終了位置, asctimeの最小値, 最大値)を保持する。
+    index_dirを指定した場合はインデックスをそのディレクトリに保存し、次回はそれを読み込む。
+    ファイルに追記された場合は追記された部分だけが追加される。
+    
+    Notes
+    -----
+    - ブロックごとに最小値・最大値を持つので、ファイル内でログの時刻が前後していても
+      該当するログを取りこぼさない
+    - asctimeが解釈できない行(フォーマット異常の行など)はインデックスに反映されない
+    """
+    VERSION = 1
+    SUFFIX = ".idx"
+    
+    def __init__(self, filepath, attributes:tuple, splitter:str, logformat:str = "text"
+                 , index_dir = None):
+        """
+
+        Parameters
+        ----------
+        filepath : path
+            ログファイルのパス
+        attributes, splitter, logformat
+            LogToDfを参照
+        index_dir : path, optional
+            インデックスを保存するディレクトリ, by default None
+            存在しない場合は作成される
+            ファイル名はログファイルの絶対パスのハッシュ値+SUFFIX
+            Noneの場合は保存せず、メモリ上だけで使う
+        """
+        self.filepath = os.fspath(filepath)
+        self.index_dir = None if index_dir is None else os.fspath(index_dir)
+        self.settings = [logformat, list(attributes), splitter]
+        self._get_asctime = get_asctime_getter(attributes, splitter, logformat)
+        # [start, end, min, max]のリスト
+        self.blocks = []
+        self.indexed_end = 0
+        self._head = None
+        self._load()
+    
+    @property
+    def index_path(self)->str:
+        """インデックスを保存するパス（index_dirがNoneの場合はNone）"""
+        if self.index_dir is None:
+            return None
+        key = hashlib.sha1(os.path.abspath(self.filepath).encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, key + self.SUFFIX)
+    
+    def _load(self):
+        if self.index_dir is None:
+            return
+        try:
+            with open(self.index_path, "r", encoding = "utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("version") != self.VERSION or saved.get("settings") != self.settings:
+            return
+        self.blocks = [[start, end, to_datetime(min_ts), to_datetime(max_ts)]
+                       for start, end, min_ts, max_ts in saved["blocks"]]
+        self.indexed_end = saved["indexed_end"]
+        self._head = saved["head"]
+    
+    def _save(self):
+        if self.index_dir is None:
+            return
+        blocks = [[start, end
+                   , None if min_ts is None else min_ts.isoformat()
+                   , None if max_ts is None else max_ts.isoformat()]
+                  for start, end, min_ts, max_ts in self.blocks]
+        try:
+            os.makedirs(self.index_dir, exist_ok = True)
+            with open(self.index_path, "w", encoding = "utf-8") as f:
+                json.dump({"version" : self.VERSION, "settings" : self.settings
+                           , "indexed_end" : self.indexed_end, "head" : self._head
+                           , "blocks" : blocks}, f)
+        except OSError:
+            # 書き込めない場合でも、インデックスはメモリ上で使える
+            pass
+    
+    def update(self):
+        """インデックスをログファイルに合わせて更新する
+        
+        ファイルが書き換えられていた場合は作り直し、
+        追記されていた場合は追記された部分だけを追加する
+        """
+        size = logfile_size(self.filepath)
+        if (self.indexed_end > size
+            or _head_digest(self.filepath, self.indexed_end) != self._head):
+            self.blocks = []
+            self.indexed_end = 0
+        
+        end = last_line_end(self.filepath, size)
+        if end <= self.indexed_end and self._head is not None:
+            return
+        self._scan(self.indexed_end, end)
+        self.indexed_end = end
+        self._head = _head_digest(self.filepath, end)
+        self._save()
+    
+    def _scan(self, start, end):
+        """start~end(行頭・行末に揃っていること)をブロックに分けてインデックスに追加する"""
+        block_start = pos = start
+        min_ts = max_ts = None
+        for block in _iter_line_blocks(self.filepath, start, end):
+            for line in _split_block(block):
+                ts = to_datetime(self._get_asctime(line.rstrip(b"\r")))
+                if ts is not None:
+                    min_ts = ts if min_ts is None or ts < min_ts else min_ts
+                    max_ts = ts if max_ts is None or ts > max_ts else max_ts
+                pos += len(line) + 1
+                if pos - block_start >= INDEX_BYTES:
+                    self.blocks.append([block_start, pos, min_ts, max_ts])
+                    block_start = pos
+                    min_ts = max_ts = None
+        if pos > block_start:
+            self.blocks.append([block_start, pos, min_ts, max_ts])
+    
+    def ranges(self, start = None, end = None)->list[tuple]:
+        """start~endの時刻のログを含むバイト範囲を二分探索で求める
+
+        Parameters
+        ----------
+        start, end : datetime.datetime, optional
+            時刻の範囲（両端を含む）, by default None
+            Noneの場合はその方向に制限しない
+
+        Returns
+        -------
+        list of tuple(int, int)
+            (start, end)のリスト（iter_logfile_linesの引数に使える）
+            範囲内のログがない場合は空のリスト
+        """
+        if not self.blocks:
+            return []
+        # 時刻のないブロックは、どの範囲にも含まれないように扱う
+        prefix_max = []
+        running = datetime.datetime.min
+        for block in self.blocks:
+            if block[3] is not None and block[3] > running:
+                running = block[3]
+            prefix_max.append(running)
+        suffix_min = []
+        running = datetime.datetime.max
+        for block in reversed(self.blocks):
+            if block[2] is not None and block[2] < running:
+                running = block[2]
+            suffix_min.append(running)
+        suffix_min.reverse()
+        
+        # prefix_max, suffix_minは単調非減少
+        # lo : 最大値がstart以上になる最初のブロック
+        # hi : 最小値がend以下である最後のブロックの次
+        lo = 0 if start is None else bisect.bisect_left(prefix_max, start)
+        hi = len(self.blocks) if end is None else bisect.bisect_right(suffix_min, end)
+        if lo >= hi:
+            return []
+        return [(self.blocks[lo][0], self.blocks[hi - 1][1])]
+
+def _cache_read_errors()->tuple:
+    """キャッシュが読み込めない場合の例外"""
+    errors = (OSError, ValueError, SyntaxError, KeyError)
+    try:
+        import pyarrow
+    except ImportError:
+        return errors
+    return errors + (pyarrow.ArrowException,)
+
+class LogCache():
+    """変換したログをファイルごとに列指向形式(Parquet)でキャッシュする
+    
+    キャッシュはログファイルのパスごとに作成され、
+    ファイルサイズ・更新時刻・フォーマット設定と一緒に保存される。
+    ファイルに追記された場合は、追記された部分だけを解析できるように、
+    解析済みの位置も保存する。
+    
+    Notes
+    -----
+    - pyarrowが必要
+    - object型の列（型が混在する列、リスト等を含む列）はreprで保存し、
+      読み込み時にast.literal_evalで元に戻す（inf, nanを含む値も戻せる）
+    - キャッシュが壊れていて読み込めない場合は、キャッシュがない場合と同様にログを解析し直す
+    """
+    # キャッシュの形式を変更した場合に更新する
+    VERSION = 1
+    
+    def __init__(self, cache_dir):
+        """
+
+        Parameters
+        ----------
+        cache_dir : path
+            キャッシュを保存するディレクトリ
+            存在しない場合は作成される
+        """
+        self.cache_dir = os.fspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok = True)
+    
+    def _cache_paths(self, filepath)->tuple:
+        """(データのパス, メタ情報のパス)"""
+        key = hashlib.sha1(os.path.abspath(os.fspath(filepath)).encode("utf-8")).hexdigest()
+        return (os.path.join(self.cache_dir, key + ".parquet")
+                , os.path.join(self.cache_dir, key + ".json"))
+    
+    def load(self, filepath, settings:list)->tuple:
+        """キャッシュを読み込む
+
+        Parameters
+        ----------
+        filepath : path
+            ログファイルのパス
+        settings : list
+            フォーマット設定
+            保存時と異なる場合はキャッシュは無効
+
+        Returns
+        -------
+        tuple(pandas.DataFrame, dict)
+            (キャッシュされたテーブル, メタ情報)
+            キャッシュがない・無効の場合は(None, None)
+        """
+        data_path, meta_path = self._cache_paths(filepath)
+        try:
+            with open(meta_path, "r", encoding = "utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("version") != self.VERSION or meta.get("settings") != settings:
+            return None, None
+        
+        try:
+            df = pd.read_parquet(data_path)
+            for col in meta["repr_columns"]:
+                df[col] = df[col].map(_restore_repr).astype(object)
+        except _cache_read_errors():
+            # 壊れた・書き込み途中のキャッシュは、ないものとして解析し直す
+            return None, None
+        return df, meta
+    
+    def store(self, filepath, df, meta:dict):
+        """キャッシュを保存する
+
+        Parameters
+        ----------
+        filepath : path
+            ログファイルのパス
+        df : pandas.DataFrame
+            filepathを変換したテーブル
+        meta : dict
+            size, mtime_ns, offset, head, settingsを含むメタ情報
+        """
+        data_path, meta_path = self._cache_paths(filepath)
+        
+        df = df.reset_index(drop = True)
+        repr_columns = [col for col in df.columns if df[col].dtype == object]
+        if repr_columns:
+            df = df.copy()
+            for col in repr_columns:
+                df[col] = df[col].map(_to_repr)
+        df.to_parquet(data_path, index = False)
+        
+        meta = dict(meta, version = self.VERSION, repr_columns = repr_columns
+                    , path = os.path.abspath(os.fspath(filepath)))
+        with open(meta_path, "w", encoding = "utf-8") as f:
+            json.dump(meta, f)
+
 class LogToDf():
     """logging_toolで作成したログを扱いやすいテーブルに変換する
     """
-    def __init__(self, attributes:tuple = None, splitter:str = None):
+    def __init__(self, attributes:tuple = None, splitter:str = None, typed:bool = True
+                 , logformat:str = "text", cache_dir = None, engine:str = "vectorized"
+                 , expand_values:bool = True):
         """
 
         Parameters
@@ -195,7 +1676,38 @@ class LogToDf():
         splitter : str, optional
             ログの各属性間を表す仕切り文字, by default None
             Noneの場合は、loggint_tool.SPLITTERが間接的に設定される
+        typed : bool, optional
+            出力するテーブルの列を既知の型に変換するかどうか, by default True
+            詳細はapply_schemaを参照
+        logformat : str, optional
+            ログファイルの形式, by default "text"
+            "text" : スプリッター形式
+            "jsonl" : logtools.formatters.JsonFormatterで出力したJSON Lines形式
+                      attributesとsplitterは使用しない
+        cache_dir : path, optional
+            変換結果のキャッシュを保存するディレクトリ, by default None
+            指定した場合、convertは変更のないファイルの解析を省略し、
+            追記されたファイルは追記された部分だけを解析する。
+            時刻の範囲を指定した場合の時刻インデックス(TimeIndex)もこのディレクトリに保存する。
+            詳細はLogCacheを参照
+        engine : str, optional
+            スプリッター形式のログの解析エンジン, by default "vectorized"
+            "vectorized" : chunksize件の行をまとめて列ごとに処理する(lines_to_df)
+            "python" : 1行ずつ辞書にする(log_to_dict)
+            出力はどちらも同一。
+            並列処理・時刻の範囲・列と行の絞り込みを指定した場合は"python"で処理する。
+        expand_values : bool, optional
+            valuesを展開した列にするかどうか, by default True
+            Falseの場合はvaluesを評価・展開せずに1つの"values"列に保持する
+            （スプリッター形式では評価前の文字列、JSON Lines形式では辞書）。
+            キーの多いログで展開する必要のある行・キーが一部の場合には、
+            絞り込んでからflatten_values_columnで展開すると速い。
         """
+        if logformat not in LOGFORMATS:
+            raise ValueError("logformat must be one of " + str(LOGFORMATS))
+        if engine not in ENGINES:
+            raise ValueError("engine must be one of " + str(ENGINES))
+
         format = Logger.makeformat() # 使うかどうかわからないけれどとりあえず取得しておく
         
         if attributes is None:
@@ -208,35 +1720,585 @@ class LogToDf():
         else:
             self.splitter = splitter
         
-    def convert(self, logfilepath_ls : list):
+        self.typed = typed
+        self.logformat = logformat
+        self.cache = None if cache_dir is None else LogCache(cache_dir)
+        self._time_indexes = {} # ログファイルの絶対パス -> TimeIndex
+        self.engine = engine
+        self.expand_values = expand_values
+        
+    def iter_chunks(self, logfilepath_ls : list, chunksize : int = CHUNKSIZE
+                    , workers : int = None, start = None, end = None
+                    , columns : list = None, where : dict = None, merge : bool = False):
+        """ログをchunksize件ごとのテーブルとして順に返す
+        
+        ファイル全体を辞書のリストとして保持しないので、
+        メモリ使用量はchunksizeに比例する
+
+        Parameters
+        ----------
+        logfilepath_ls : list of path
+            処理するログファイルのパスのリスト
+        chunksize : int, optional
+            1つのテーブルに含める最大のログ件数, by default CHUNKSIZE
+            1つのテーブルに複数のファイルのログが含まれることもある
+        workers : int, optional
+            解析に使用するプロセス数, by default None
+            None, 1の場合は呼び出し元のプロセスで処理する。
+            2以上の場合、ファイルは行頭に揃えて分割され、プロセスプールで解析される。
+            出力はworkersによらず同一。
+            Windows等spawnでプロセスを起動する環境では、
+            呼び出し元を if __name__ == "__main__": で保護すること。
+            また、解析中のUserWarningは子プロセスで発生する。
+        start, end : str, datetime.datetime or pandas.Timestamp, optional
+            asctimeの範囲（両端を含む）, by default None
+            指定した場合、ファイルごとの時刻インデックス(TimeIndex)を使って、
+            範囲内のログを含む部分だけを読み込む。
+            インデックスは初回に作成され、LogToDfのインスタンスが保持する。
+            cache_dirを指定した場合はcache_dirに保存され、次回以降のLogToDfでも使われる。
+            asctimeが解釈できないログ、書き込み途中の最後の行は含まれない。
+        columns : list of str, optional
+            出力する列, by default None
+            属性以外の列はvaluesを展開した列とみなす。
+            属性以外の列を指定しない場合はvaluesは評価されない。
+            convert_exception列は存在する場合は常に出力される。
+            "values"はexpand_valuesがFalseの場合だけ指定できる
+            （Trueの場合は展開後のキーを指定する）。
+        where : dict, optional
+            ログの絞り込み条件, by default None
+            {"levelname" : ["ERROR", "CRITICAL"], "name" : "service.", "tag" : "use"}のように、
+            属性(levelname, name, tag, function, action)ごとに許可する値を指定する。
+            nameは前方一致、それ以外は完全一致で、すべての条件を満たすログだけを出力する。
+            判定は各行の評価・展開の前に行われる。
+            フォーマット異常の行は除外される。
+        merge : bool, optional
+            ファイルごとのログをasctimeの順にマージしながら返すかどうか, by default False
+            Trueの場合、各ファイルはasctimeの順に並んでいるとみなして逐次マージする。
+            並んでいないファイルだけは、そのファイルを読み込んで並び変えてからマージする。
+            asctimeのないログはasctimeのあるログの後になるので、
+            attributesにasctimeが含まれない場合はファイルの順・行の順に結合される。
+            workersは使用されない。
+
+        Yields
+        ------
+        pandas.DataFrame
+            ログのテーブル
+            mergeがFalseの場合は、ファイルの順・ファイル内の行の順に並び、asctimeでは並び変えられていない
+            mergeがTrueの場合は、asctimeの順（同時刻はファイルの順・行の順）
+        """
+        start, end = _to_time_bound(start), _to_time_bound(end)
+        if where:
+            make_matchers(where, self.attributes) # 条件の確認
+        self._check_columns(columns)
+        if merge:
+            chunks = self._iter_merged_chunks(logfilepath_ls, chunksize, start, end
+                                              , where, self._parse_columns(columns))
+            chunks = (df for df, _ in chunks)
+        else:
+            ranges = self._make_ranges(logfilepath_ls, workers, start, end)
+            chunks = self._iter_raw_chunks(ranges, chunksize, workers, start, end
+                                           , where, self._parse_columns(columns))
+        for df in chunks:
+            if self.typed:
+                df = apply_schema(df)
+            yield self._project(df, columns)
+    
+    def _check_columns(self, columns):
+        """columnsの確認
+        
+        Raises
+        ------
+        ValueError
+            expand_valuesがTrueで、columnsに"values"が含まれる場合
+            （valuesは展開されるので"values"列は存在しない）
+        """
+        if columns is not None and self.expand_values and "values" in columns:
+            raise ValueError("values is expanded into columns. "
+                             "specify the keys of values, or use expand_values=False")
+    
+    def _parse_columns(self, columns):
+        """解析する列（並び替えのためにasctimeは常に解析する）"""
+        if columns is None:
+            return None
+        return list(columns) + ["asctime"]
+    
+    @staticmethod
+    def _project(df, columns):
+        """columnsの順に並べる（存在しない列は欠損値、convert_exceptionは存在する場合は残す）"""
+        if columns is None:
+            return df
+        columns = list(columns)
+        if "convert_exception" in df.columns and "convert_exception" not in columns:
+            columns.append("convert_exception")
+        return df.reindex(columns = columns)
+    
+    def _make_ranges(self, logfilepath_ls, workers, start = None, end = None):
+        """解析する範囲(path, start, end)のリストを作成する
+        
+        時刻の範囲が指定されている場合は、TimeIndexで絞り込む
+        並列処理の場合はファイルを分割する
+        """
+        ranges = []
+        for path in logfilepath_ls:
+            if start is None and end is None:
+                file_ranges = [(0, None)]
+            else:
+                index = self._time_index(path)
+                index.update()
+                file_ranges = index.ranges(start, end)
+            
+            for range_start, range_end in file_ranges:
+                if workers is None or workers <= 1:
+                    ranges.append((path, range_start, range_end))
+                else:
+                    ranges.extend((path, s, e) for s, e
+                                  in split_logfile(path, start = range_start, end = range_end))
+        return ranges
+    
+    def _time_index(self, path)->TimeIndex:
+        """ログファイルのTimeIndex（cache_dirを指定した場合はcache_dirに保存する）"""
+        key = os.path.abspath(os.fspath(path))
+        index = self._time_indexes.get(key)
+        if index is None:
+            index = TimeIndex(path, self.attributes, self.splitter, self.logformat
+                              , None if self.cache is None else self.cache.cache_dir)
+            self._time_indexes[key] = index
+        return index
+    
+    def _iter_raw_chunks(self, ranges, chunksize, workers, start = None, end = None
+                         , where = None, columns = None):
+        """iter_chunksの本体（型の変換は行わない）
+        
+        rangesは(path, start, end)のリスト
+        start, endはdatetime.datetime
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be positive")
+        
+        if (self.engine == "vectorized" and self.logformat == "text"
+            and (workers is None or workers <= 1)
+            and start is None and end is None and not where and columns is None):
+            yield from self._iter_vectorized_chunks(ranges, chunksize)
+            return
+        
+        if workers is None or workers <= 1:
+            records = self._iter_records(ranges, where, columns)
+        else:
+            records = self._iter_records_parallel(ranges, workers, where, columns)
+        
+        if start is not None or end is not None:
+            records = (dic for dic in records
+                       if _in_time_range(to_datetime(dic.get("asctime")), start, end))
+        
+        accumulator = ColumnAccumulator()
+        for dic in records:
+            accumulator.append(dic)
+            if len(accumulator) >= chunksize:
+                yield accumulator.to_df()
+                accumulator = ColumnAccumulator()
+        if len(accumulator):
+            yield accumulator.to_df()
+    
+    def _iter_vectorized_chunks(self, ranges, chunksize):
+        """rangesの行をchunksize件ずつlines_to_dfでテーブルにする"""
+        decoders = get_decoders(self.attributes)
+        lines = itertools.chain.from_iterable(iter_logfile_lines(path, start, end)
+                                              for path, start, end in ranges)
+        while True:
+            batch = list(itertools.islice(lines, chunksize))
+            if not batch:
+                return
+            yield lines_to_df(batch, self.attributes, self.splitter, decoders
+                              , self.expand_values)
+    
+    def _iter_merged_chunks(self, logfilepath_ls, chunksize, start, end, where, columns
+                            , first_seen:dict = None):
+        """ファイルごとのログをasctimeの順にマージしたテーブルを返す（型の変換は行わない）
+        
+        first_seenを指定した場合は、列名 -> 最初に現れた((ファイルの番号, ファイル内の番号), ログ内の順)
+        を記録する（マージしない場合の列の順を求めるため）
+        
+        Yields
+        ------
+        tuple(pandas.DataFrame, list of tuple(int, int))
+            (テーブル, 各行の(ファイルの番号, ファイル内の番号))
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be positive")
+        
+        streams = []
+        for file_no, path in enumerate(logfilepath_ls):
+            records = self._iter_records(self._make_ranges([path], None, start, end)
+                                         , where, columns)
+            if start is not None or end is not None:
+                records = (dic for dic in records
+                           if _in_time_range(to_datetime(dic.get("asctime")), start, end))
+            stream = self._keyed_records(records, file_no)
+            # asctimeが属性にない場合はすべてのログのキーが同じなので、ファイルの順・行の順に結合される
+            if ((self.logformat != "text" or "asctime" in self.attributes)
+                and not is_time_ordered(path, self.attributes, self.splitter, self.logformat)):
+                # 並んでいないファイルだけは読み込んで並び変える(安定ソート)
+                stream = iter(sorted(stream, key = lambda item: item[0]))
+            streams.append(stream)
+        
+        # heapq.mergeは同じキーの場合は先のストリームのものを先に返す
+        accumulator, positions = ColumnAccumulator(), []
+        for _, file_no, row_no, dic in heapq.merge(*streams, key = lambda item: item[0]):
+            accumulator.append(dic)
+            position = (file_no, row_no)
+            positions.append(position)
+            if first_seen is not None:
+                for i, key in enumerate(dic):
+                    seen = first_seen.get(key)
+                    if seen is None or position < seen[0]:
+                        first_seen[key] = (position, i)
+            if len(accumulator) >= chunksize:
+                yield accumulator.to_df(), positions
+                accumulator, positions = ColumnAccumulator(), []
+        if len(accumulator):
+            yield accumulator.to_df(), positions
+    
+    @staticmethod
+    def _keyed_records(records, file_no):
+        """各ログを(並び変えのキー, ファイルの番号, ファイル内の番号, ログ)にする"""
+        for row_no, dic in enumerate(records):
+            yield _time_key(dic), file_no, row_no, dic
+    
+    def _iter_records(self, ranges, where = None, columns = None):
+        """範囲の順・行の順にログの辞書を返す"""
+        for path, start, end in ranges:
+            yield from iter_logfile(path, self.attributes, self.splitter
+                                    , start, end, self.logformat, where, columns
+                                    , self.expand_values)
+    
+    def _iter_records_parallel(self, ranges, workers, where = None, columns = None):
+        """_iter_recordsと同じ順でログの辞書を返す（プロセスプールで解析）
+        
+        ファイルはsplit_logfileで分割され、分割された範囲ごとに並列に解析される。
+        結果は範囲の順に返されるので、出力は直列の場合と同一になる。
+        メモリ使用量を抑えるため、同時に処理する範囲はworkersの2倍までとする。
+        """
+        tasks = iter([(path, start, end, self.attributes, self.splitter, self.logformat
+                       , where, columns, self.expand_values)
+                      for path, start, end in ranges])
+        
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            pending = collections.deque(executor.submit(_parse_range, task)
+                                        for task in itertools.islice(tasks, workers * 2))
+            while pending:
+                dics = pending.popleft().result()
+                task = next(tasks, None)
+                if task is not None:
+                    pending.append(executor.submit(_parse_range, task))
+                yield from dics
+    
+    def convert(self, logfilepath_ls : list, chunksize : int = CHUNKSIZE
+                , workers : int = None, start = None, end = None
+                , columns : list = None, where : dict = None, merge : bool = False):
         """変換処理を行う
 
         Parameters
         ----------
         logfilepath_ls : list of path
             処理するログファイルのパスのリスト
+        chunksize : int, optional
+            iter_chunksに渡すchunksize, by default CHUNKSIZE
+        workers : int, optional
+            解析に使用するプロセス数, by default None
+            詳細はiter_chunksを参照
+        start, end : str, datetime.datetime or pandas.Timestamp, optional
+            asctimeの範囲（両端を含む）, by default None
+            詳細はiter_chunksを参照
+            指定した場合はキャッシュは使用しない
+        columns : list of str, optional
+            出力する列, by default None
+            詳細はiter_chunksを参照
+        where : dict, optional
+            ログの絞り込み条件, by default None
+            詳細はiter_chunksを参照
+            指定した場合はキャッシュは使用しない
+        merge : bool, optional
+            ファイル全体を結合してから並び変える代わりに、
+            ファイルごとのログをasctimeの順にマージするかどうか, by default False
+            出力は同一で、全体の並び変えのためのコピーが不要になる。
+            詳細はiter_chunksを参照
+            Trueの場合はキャッシュは使用しない
 
         Returns
         -------
         pandas.DataFrame
             ログが集約されたテーブル
         """
-        df_ls = []
-        for path in logfilepath_ls:
-            df_ls.append(pd.DataFrame(logfile_converter(path, self.attributes, self.splitter)))
-        log_df = pd.concat(df_ls, ignore_index=True)
+        start, end = _to_time_bound(start), _to_time_bound(end)
+        if where:
+            make_matchers(where, self.attributes) # 条件の確認
+        self._check_columns(columns)
+        if merge:
+            return self._convert_merged(logfilepath_ls, chunksize, start, end, where, columns)
+        if (self.cache is None or start is not None or end is not None
+            or where or columns is not None):
+            ranges = self._make_ranges(logfilepath_ls, workers, start, end)
+            df_ls = list(self._iter_raw_chunks(ranges, chunksize, workers, start, end
+                                               , where, self._parse_columns(columns)))
+        else:
+            df_ls = [self._convert_cached(path, chunksize, workers)
+                     for path in logfilepath_ls]
+        log_df = _concat_chunks(df_ls)
+        if self.typed:
+            log_df = apply_schema(log_df)
         log_df = self._sort_by_time(log_df)
-        return log_df
+        return self._project(log_df, columns)
+    
+    def _convert_merged(self, logfilepath_ls, chunksize, start, end, where, columns):
+        """convertのmerge=Trueの場合の処理
+        
+        インデックスと列の順は、ファイルを結合してから並び変えた場合と同じ
+        （インデックスはファイルの順・行の順の通し番号、列はファイルの順・行の順で最初に現れた順）にする
+        """
+        df_ls, positions, first_seen = [], [], {}
+        for df, chunk_positions in self._iter_merged_chunks(logfilepath_ls, chunksize, start, end
+                                                            , where, self._parse_columns(columns)
+                                                            , first_seen):
+            df_ls.append(df)
+            positions.extend(chunk_positions)
+        if not df_ls:
+            return self._project(pd.DataFrame(), columns)
+        
+        counts = collections.Counter(file_no for file_no, _ in positions)
+        bases, base = {}, 0
+        for file_no in range(len(logfilepath_ls)):
+            bases[file_no] = base
+            base += counts[file_no]
+        
+        log_df = _concat_chunks(df_ls)
+        log_df = log_df[sorted(log_df.columns, key = first_seen.__getitem__)]
+        log_df.index = pd.Index([bases[file_no] + row_no for file_no, row_no in positions])
+        if self.typed:
+            log_df = apply_schema(log_df)
+        if "asctime" not in log_df.columns:
+            warnings.warn("log data is not sorted.")
+        return self._project(log_df, columns)
+    
+    def _parse_range(self, path, start, end, chunksize, workers):
+        """ファイルのstart~endを型の変換をせずにテーブルにする"""
+        if workers is None or workers <= 1:
+            ranges = [(path, start, end)]
+        else:
+            ranges = [(path, s, e) for s, e in split_logfile(path, start = start, end = end)]
+        df_ls = list(self._iter_raw_chunks(ranges, chunksize, workers))
+        if not df_ls:
+            return pd.DataFrame()
+        return pd.concat(df_ls, ignore_index = True)
+    
+    def _convert_cached(self, path, chunksize, workers):
+        """キャッシュを使って1ファイルをテーブルにする（型の変換はしない）
+        
+        - サイズ・更新時刻が変わっていない : キャッシュをそのまま使う
+        - 先頭が同じで解析済みの位置より大きい : 追記された部分だけを解析する
+        - その他（ローテーション・書き換え） : ファイル全体を解析する
+        書き込み途中の最後の行はキャッシュせず、毎回解析する
+        """
+        settings = [self.logformat, list(self.attributes), self.splitter, self.expand_values]
+        stat = os.stat(path)
+        size = logfile_size(path)
+        complete_end = last_line_end(path, size)
+        
+        df, meta = self.cache.load(path, settings)
+        if (df is not None
+            and meta["size"] == size
+            and meta["mtime_ns"] == stat.st_mtime_ns):
+            offset = meta["offset"]
+        else:
+            if (df is not None
+                and meta["offset"] <= complete_end
+                and _head_digest(path, meta["offset"]) == meta["head"]):
+                start = meta["offset"]
+                tail = self._parse_range(path, start, complete_end, chunksize, workers)
+                if len(tail):
+                    df = pd.concat([df, tail], ignore_index = True)
+            else:
+                df = self._parse_range(path, 0, complete_end, chunksize, workers)
+            offset = complete_end
+            self.cache.store(path, df, {"size" : size
+                                        , "mtime_ns" : stat.st_mtime_ns
+                                        , "offset" : offset
+                                        , "head" : _head_digest(path, offset)
+                                        , "settings" : settings})
+        
+        if offset < size:
+            partial = self._parse_range(path, offset, size, chunksize, None)
+            if len(partial):
+                df = pd.concat([df, partial], ignore_index = True)
+        return df
     
     def _sort_by_time(self, df):
-        """asctimeで並び変える"""
+        """asctimeで並び変える（同時刻は元の順）"""
         try:
-            df.sort_values('asctime', inplace = True)
+            df.sort_values('asctime', inplace = True, kind = "mergesort")
         except KeyError:
             warnings.warn("log data is not sorted.")
         return df
     
-    # [FutureWork]
-    # def export_db(self):
-    #     ...
+
+
+class LogFollower():
+    """ログファイルを追跡し(tail -Fのように)、追記されたログだけを返す
+    
+    読み込んだ位置を保持し、poll()のたびに前回からの追記分だけを解析する。
+    RotatingFileHandlerのローテーション(.log -> .log.1 -> .log.2 ...)を検知した場合は、
+    ローテーションされたファイルの未読の部分を読んでから、新しいファイルを先頭から読む。
+    ローテーション時に圧縮されたファイル(.log.1.gz等)も同様に読む。
+    
+    Notes
+    -----
+    - ファイルの同一性はinode番号と先頭(最大HEAD_BYTES)のハッシュ値で判定する
+      （圧縮されたファイルは展開後の先頭のハッシュ値だけで判定する）
+    - 書き込み途中の（改行で終わっていない）最後の行は、次回以降に返される
+    - poll()の間隔の間にbackupCountを超えてローテーションされた場合、
+      削除されたファイルの未読の部分は失われる
+    """
+    def __init__(self, filepath, attributes:tuple = None, splitter:str = None
+                 , typed:bool = True, logformat:str = "text", from_start:bool = True):
+        """
+
+        Parameters
+        ----------
+        filepath : path
+            追跡するログファイルのパス
+        attributes, splitter, typed, logformat
+            LogToDfを参照
+        from_start : bool, optional
+            既存のログも返すかどうか, by default True
+            Falseの場合は、インスタンス化以降に追記されたログだけを返す
+        """
+        logtodf = LogToDf(attributes = attributes, splitter = splitter
+                          , typed = typed, logformat = logformat)
+        self._parse = get_line_parser(logtodf.attributes, logtodf.splitter, logformat)
+        self.typed = typed
+        self.filepath = os.fspath(filepath)
+        
+        self._ino = None
+        self._offset = 0
+        self._head = None
+        if not from_start:
+            # 既存の部分を読み込み済みとする
+            self._new_ranges()
+        elif os.path.exists(self.filepath):
+            # 初回のpollまでにローテーションされても、このファイルを先頭から読む
+            self._ino = os.stat(self.filepath).st_ino
+            self._head = _head_digest(self.filepath, 0)
+    
+    @property
+    def offset(self)->int:
+        """現在のファイルの読み込み済みの位置"""
+        return self._offset
     
+    def _is_current(self, stat)->bool:
+        """読み込み中のファイルがローテーションされていないか"""
+        if stat.st_ino and stat.st_ino != self._ino:
+            return False
+        if stat.st_size < self._offset:
+            return False
+        return _head_digest(self.filepath, self._offset) == self._head
+    
+    def _rotated_ranges(self)->list:
+        """ローテーションされたファイルの未読の範囲
+        
+        読み込み中だったファイルを.1, .2, ...から探し、
+        その未読の部分と、それより新しいローテーション済みのファイル全体を古い順に返す
+        """
+        rotated = []
+        i = 1
+        path = self._rotated_path(i)
+        while path is not None:
+            rotated.append(path)
+            i += 1
+            path = self._rotated_path(i)
+        
+        for k, path in enumerate(rotated):
+            stat = os.stat(path)
+            # 圧縮されたファイルは別のファイルになるので、inode番号では判定しない
+            compressed = detect_compression(path) is not None
+            size = logfile_size(path)
+            if ((compressed or not stat.st_ino or stat.st_ino == self._ino)
+                and size >= self._offset
+                and _head_digest(path, self._offset) == self._head):
+                ranges = [(path, self._offset, last_line_end(path, size))]
+                ranges.extend((newer, 0, last_line_end(newer)) for newer in reversed(rotated[:k]))
+                return ranges
+        
+        warnings.warn("rotated log file is not found")
+        return []
+    
+    def _rotated_path(self, i:int)->str:
+        """i番目のローテーション済みのファイル(.i, または圧縮された.i.gz等)のパス
+        
+        存在しない場合はNone
+        圧縮中で両方存在する場合は圧縮前のファイルを返す
+        """
+        path = self.filepath + "." + str(i)
+        for candidate in [path] + [path + suffix for suffix in SUFFIXES.values()]:
+            if os.path.exists(candidate):
+                return candidate
+        return None
+    
+    def _new_ranges(self)->list:
+        """前回からの追記分の範囲(path, start, end)のリストを求め、読み込み済みの位置を更新する"""
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            # ローテーションの途中
+            return []
+        
+        ranges = []
+        if self._ino is not None and not self._is_current(stat):
+            ranges.extend(self._rotated_ranges())
+            self._offset = 0
+        
+        end = last_line_end(self.filepath, stat.st_size)
+        if end > self._offset:
+            ranges.append((self.filepath, self._offset, end))
+            self._offset = end
+        self._ino = stat.st_ino
+        self._head = _head_digest(self.filepath, self._offset)
+        return ranges
+    
+    def poll_records(self)->list[dict]:
+        """前回からの追記分のログを辞書のリストとして返す"""
+        records = []
+        for path, start, end in self._new_ranges():
+            for line in iter_logfile_lines(path, start, end):
+                records.append(self._parse(line))
+        return records
+    
+    def poll(self):
+        """前回からの追記分のログをテーブルとして返す
+
+        Returns
+        -------
+        pandas.DataFrame
+            追記されたログのテーブル（ファイルに書かれた順）
+            追記がない場合は空のテーブル
+        """
+        df = records_to_df(self.poll_records())
+        return apply_schema(df) if self.typed else df
+    
+    def follow(self, interval:float = 1.0):
+        """追記されたログを待ち続けて、テーブルとして返すジェネレータ
+
+        Parameters
+        ----------
+        interval : float, optional
+            ファイルを確認する間隔[s], by default 1.0
+
+        Yields
+        ------
+        pandas.DataFrame
+            追記されたログのテーブル（空のテーブルは返さない）
+        """
+        while True:
+            df = self.poll()
+            if len(df):
+                yield df
+            else:
+                time.sleep(interval)
@@ -1,12 +1,21 @@
 
 from collections import namedtuple
 import dataclasses
-import logging
+import functools
 import inspect
+import logging
 from inspect import signature
+import sys
+import threading
+import time
+import types
 from typing import Tuple
 import warnings
 
+from logtools.async_emitter import AsyncEmitter
+from logtools.sampling import LogSampler
+from logtools.trace_stats import TraceStats
+
 
 ##############################################
 # Logのデフォルト設定
@@ -20,6 +29,59 @@ ATTRIBUTES = tuple(["asctime", "levelname", "name", "function"
 # 各属性のスプリッター
 SPLITTER = "==="
 
+# Logger._loggingのlevel引数とログレベルの対応
+LEVELNO = {"debug" : logging.DEBUG
+           , "info" : logging.INFO
+           , "warning" : logging.WARNING
+           , "error" : logging.ERROR
+           , "critical" : logging.CRITICAL}
+
+# ログレベルとLogger._loggingのlevel引数の対応
+LEVELNAME = {levelno : level for level, levelno in LEVELNO.items()}
+
+# Logger.enable_trace_statsの設定
+_TraceConfig = namedtuple("TraceConfig", ["interval", "per_call", "levelno"])
+
+class _CpuTimer():
+    """_drive_timedで計測したCPU時間の累計"""
+    __slots__ = ("cpu",)
+    def __init__(self):
+        self.cpu = 0.0
+
+def _drive_timed(iterator, timer):
+    """ジェネレータ（またはコルーチンの__await__）を1ステップずつ進め、
+    実行中のCPU時間だけをtimerに加算する
+    
+    send, throw, closeはiteratorにそのまま渡し、iteratorの戻り値を返す。
+    yield fromで使用する。
+    """
+    value, exc = None, None
+    while True:
+        start = time.thread_time()
+        try:
+            if exc is None:
+                item = iterator.send(value)
+            else:
+                item = iterator.throw(exc)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            timer.cpu += time.thread_time() - start
+        
+        value, exc = None, None
+        try:
+            value = yield item
+        except GeneratorExit:
+            iterator.close()
+            raise
+        except BaseException as e:
+            exc = e
+
+@types.coroutine
+def _await_timed(awaitable, timer):
+    """awaitableを待ち、実行中のCPU時間だけをtimerに加算する"""
+    return (yield from _drive_timed(awaitable.__await__(), timer))
+
 
 ##############################################
 # 以下、コード
@@ -45,28 +107,79 @@ class LogSetting():
     ExtraLogData : object
     format : str
 
+# get_funcnameのキャッシュ
+# code object -> (関数名, selfを参照し得るか)
+_FUNCNAME_CACHE = {}
+
+def _resolve_code(code)->tuple:
+    """code objectから関数名とselfを参照し得るかどうかを求めてキャッシュする"""
+    refers_self = ("self" in code.co_varnames
+                   or "self" in code.co_cellvars
+                   or "self" in code.co_freevars)
+    resolved = (code.co_name, refers_self)
+    _FUNCNAME_CACHE[code] = resolved
+    return resolved
+
 def get_funcname(layer:int = 1)->str:
     """呼び出し元の関数名を返す
     
     呼び出し元がクラスメソッドの場合、
     "[クラス名].[メソッド名]"
     を返す。
-    クラス名の取得が少し強引。もっといい方法があるかも。
+    
+    Notes
+    -----
+    - inspect.stack()はスタック全体のFrameInfoを作成し、ソースコードまで読むため遅い。
+      sys._getframeで対象のフレームだけを取得する。
+    - 関数名とselfの有無はcode objectごとにキャッシュする。
+      クラス名はselfの実行時のクラスから取得する（サブクラスの場合はサブクラス名）。
+    - co_qualnameは"<locals>"や定義元のクラス名を含み、従来の出力と異なるので使用しない。
     """
     
-    frame = inspect.stack()[layer] # https://docs.python.org/ja/3/library/inspect.html#inspect.stack
-    function_name = frame.function
-    locals_dic = inspect.getargvalues(frame[0]).locals
-    if ("self" in locals_dic.keys()):
+    frame = sys._getframe(layer) # layer=0はget_funcname自身のフレーム（inspect.stack()と同じ）
+    code = frame.f_code
+    try:
+        function_name, refers_self = _FUNCNAME_CACHE[code]
+    except KeyError:
+        function_name, refers_self = _resolve_code(code)
+    
+    if refers_self:
         # 名前空間内にselfがある場合、呼び出し元はメソッド関数であると判断してクラス名を取りに行く
-        class_name = locals_dic["self"].__class__.__name__
-        return class_name + "." + function_name
-    else:
-        return function_name
+        locals_dic = frame.f_locals
+        if "self" in locals_dic:
+            return locals_dic["self"].__class__.__name__ + "." + function_name
+    return function_name
 
 
-def getLogger(name):
-    return Logger(name)
+# getLoggerで作成したLoggerの登録簿
+# name -> Logger
+_logger_registry = {}
+_registry_lock = threading.Lock()
+
+def getLogger(name, async_:bool = False):
+    """nameに対応するLoggerを返す
+    
+    同じnameで呼ばれた場合は、同じLoggerインスタンスを返す
+    （logging.getLoggerと同じ振る舞い）
+    
+    Parameters
+    ----------
+    name : str
+        logger's name
+    async_ : bool, optional
+        Trueの場合、Logger.enable_async()をデフォルトの設定で呼ぶ, by default False
+    """
+    try:
+        logger = _logger_registry[name]
+    except KeyError:
+        with _registry_lock:
+            if name not in _logger_registry:
+                _logger_registry[name] = Logger(name)
+            logger = _logger_registry[name]
+    
+    if async_:
+        logger.enable_async()
+    return logger
 
 class Logger():
     """
@@ -86,6 +199,12 @@ class Logger():
     _attributes = ATTRIBUTES
     _splitter = SPLITTER
     
+    # ExtraLogDataはフォーマットによらないので、クラスの作成は1回だけ行う
+    _ExtraLogData = namedtuple("ExtraLogData", EXTRA_ATTRIBUTES
+                               , defaults = [None for _ in range(len(EXTRA_ATTRIBUTES))])
+    # (attributes, splitter) -> LogSetting
+    _logsetting_cache = {}
+    
     @classmethod
     def makeformat(cls, attributes = None, splitter = None):
         """フォーマットの確認・更新を行う
@@ -111,26 +230,30 @@ class Logger():
             attributes = cls._attributes
         if splitter is None:
             splitter = cls._splitter
+        attributes = tuple(attributes)
         
-        if not _is_attribs_available(set(attributes), set(EXTRA_ATTRIBUTES)):
-            raise ConfigurationError
-        
-        ExtraLogData = namedtuple("ExtraLogData", EXTRA_ATTRIBUTES
-                                  , defaults = [None for _ in range(len(EXTRA_ATTRIBUTES))])
-        
-        # make format
-        ## [FutureWork]ここは関数にしてしまうべき
-        form = "%(" + attributes[0] + ")s"
-        if len(attributes) > 1:
-            for attrib in attributes[1:]:
-                form += splitter + "%(" + attrib + ")s"
+        try:
+            logsetting = cls._logsetting_cache[(attributes, splitter)]
+        except KeyError:
+            if not _is_attribs_available(set(attributes), set(EXTRA_ATTRIBUTES)):
+                raise ConfigurationError
+            
+            # make format
+            ## [FutureWork]ここは関数にしてしまうべき
+            form = "%(" + attributes[0] + ")s"
+            if len(attributes) > 1:
+                for attrib in attributes[1:]:
+                    form += splitter + "%(" + attrib + ")s"
+            
+            logsetting = LogSetting(attributes=attributes, splitter = splitter
+                                    , ExtraLogData = cls._ExtraLogData, format = form)
+            cls._logsetting_cache[(attributes, splitter)] = logsetting
                 
         # クラス変数の書き換え
         cls._attributes = attributes
         cls._splitter = splitter
         
-        return LogSetting(attributes=attributes, splitter = splitter
-                          , ExtraLogData = ExtraLogData, format = form)
+        return logsetting
     
     def __init__(self, name=None):
         """
@@ -144,12 +267,21 @@ class Logger():
         self.__name = name
         if name:
             self.__logger = logging.getLogger(name)
-            self.__logger.addHandler(logging.NullHandler())
+            # 同じnameで複数回作成されてもNullHandlerは1つだけ
+            if not any(type(hdlr) is logging.NullHandler
+                       for hdlr in self.__logger.handlers):
+                self.__logger.addHandler(logging.NullHandler())
         else:
             self.__logger = None
             
         self.logsetting = Logger.makeformat()
         self._has_addStreamHandler_been_called = False
+        self._async_emitter = None
+        self._sampler = None
+        self._trace_config = None
+        self._trace_stats = {} # __qualname__ -> TraceStats
+        self._trace_lock = threading.Lock()
+        self._trace_last_summary = time.monotonic()
             
         
     @property
@@ -168,29 +300,151 @@ class Logger():
         """関数呼び出し前後のデバッグログ実装用デコレータ
         
         ログメッセージの内容はコンストラクタで変更可能
+        FINISHEDのログのvaluesには処理時間
+        {"duration" : wall time[s], "cpu_time" : CPU time[s]}を含める。
+        enable_trace_statsを呼んだ場合は、処理時間を__qualname__ごとの
+        ヒストグラムに記録する。
+        
+        コルーチン関数(async def)、非同期ジェネレータ、ジェネレータにも使用でき、
+        実際に実行を開始した時点でRUN、完了した時点（コルーチンの終了、
+        ジェネレータを最後まで進めた時点）でFINISHEDをログする。
+        
+        Notes
+        -----
+        - 関数の種類の判定はデコレート時に1回だけ行う
+        - DEBUGが無効かつ記録も無効な場合は、計測もログもせずにfuncを呼ぶ
+        - CPU timeは呼び出したスレッドのCPU時間(time.thread_time)
+          コルーチン・ジェネレータでは、中断している間（await先で他のタスクが動いている間や、
+          yieldした値を呼び出し元が処理している間）を含まない。
+          wall timeは中断している間も含む
+        - funcが例外を送出した場合や、ジェネレータが途中で閉じられた場合は
+          FINISHEDのログも記録も行わない
+        - enable_sampling(every=N)の呼び出し回数は、デコレートした関数の__qualname__と
+          RUN/FINISHEDごとに数える
         """
+        qualname = func.__qualname__
         
-        def wrap(*args,**kwargs):
-            self._debug(message = "RUN:" + func.__qualname__
-                        , action = "run"
-                        , function = func.__qualname__
-                        , tag = "trace")
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrap(*args, **kwargs):
+                config, per_call = self._trace_mode()
+                if not per_call and config is None:
+                    return await func(*args, **kwargs)
                 
-            ret = func(*args, **kwargs)
+                self._trace_run(per_call, qualname)
+                timer = _CpuTimer()
+                wall_start = time.perf_counter()
+                ret = await _await_timed(func(*args, **kwargs), timer)
+                self._trace_finished(config, per_call, qualname
+                                     , time.perf_counter() - wall_start, timer.cpu)
+                return ret
+            return wrap
+        
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrap(*args, **kwargs):
+                config, per_call = self._trace_mode()
+                # 非同期ジェネレータは委譲できないので、計測しない場合もasend, athrowを渡すループは通る
+                traced = per_call or config is not None
+                agen = func(*args, **kwargs)
+                if traced:
+                    self._trace_run(per_call, qualname)
+                    timer = _CpuTimer()
+                    wall_start = time.perf_counter()
+                
+                # asend, athrowをagenにそのまま渡す
+                value, exc = None, None
+                while True:
+                    step = agen.asend(value) if exc is None else agen.athrow(exc)
+                    try:
+                        item = await (_await_timed(step, timer) if traced else step)
+                    except StopAsyncIteration:
+                        break
+                    
+                    value, exc = None, None
+                    try:
+                        value = yield item
+                    except GeneratorExit:
+                        await agen.aclose()
+                        raise
+                    except BaseException as e:
+                        exc = e
+                
+                if traced:
+                    self._trace_finished(config, per_call, qualname
+                                         , time.perf_counter() - wall_start, timer.cpu)
+            return wrap
+        
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrap(*args, **kwargs):
+                config, per_call = self._trace_mode()
+                if not per_call and config is None:
+                    return (yield from func(*args, **kwargs))
+                
+                self._trace_run(per_call, qualname)
+                timer = _CpuTimer()
+                wall_start = time.perf_counter()
+                ret = yield from _drive_timed(func(*args, **kwargs), timer)
+                self._trace_finished(config, per_call, qualname
+                                     , time.perf_counter() - wall_start, timer.cpu)
+                return ret
+            return wrap
+        
+        @functools.wraps(func)
+        def wrap(*args,**kwargs):
+            config, per_call = self._trace_mode()
+            if not per_call and config is None:
+                return func(*args, **kwargs)
             
-            self._debug(message = "FINISHED:" + func.__qualname__
-                        , action = "finished"
-                        , function = func.__qualname__
-                        , tag = "trace")
+            self._trace_run(per_call, qualname)
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            ret = func(*args, **kwargs)
+            self._trace_finished(config, per_call, qualname
+                                 , time.perf_counter() - wall_start
+                                 , time.thread_time() - cpu_start)
             return ret
         return wrap
+    
+    def _trace_mode(self)->tuple:
+        """trace_decoの設定と、呼び出しごとのログを出力するかどうかを返す"""
+        config = self._trace_config
+        per_call = ((config is None or config.per_call)
+                    and self.__logger.isEnabledFor(logging.DEBUG))
+        return config, per_call
+    
+    def _trace_run(self, per_call, qualname):
+        """trace_decoのRUNをログする
+        
+        間引きの呼び出し箇所は関数ごとにする
+        （asyncioのタスクから呼ばれた場合、呼び出し元のフレームはasyncioの内部になるため）
+        """
+        if per_call:
+            self._debug(message = "RUN:" + qualname
+                        , action = "run"
+                        , function = qualname
+                        , tag = "trace"
+                        , callsite = (qualname, "run"))
+    
+    def _trace_finished(self, config, per_call, qualname, wall, cpu):
+        """trace_decoの処理時間を記録し、FINISHEDをログする"""
+        if config is not None:
+            self._record_trace(config, qualname, wall, cpu)
+        if per_call:
+            self._debug(message = "FINISHED:" + qualname
+                        , action = "finished"
+                        , function = qualname
+                        , tag = "trace"
+                        , values = {"duration" : wall, "cpu_time" : cpu}
+                        , callsite = (qualname, "finished"))
         
     def _debug(self
               , message = None
               , action = None
               , function = None
               , tag = None
-              , values = None):
+              , values = None
+              , callsite = None):
         """debug level (for private use)
 
         Parameters
@@ -201,14 +455,23 @@ class Logger():
             function name
             , by default None
         tag : str, optional
-        values : dict, optional
+        values : dict or callable, optional
+        callsite : hashable, optional
+            間引きの呼び出し箇所, by default None
+            Noneの場合はdebugの呼び出し元のフレーム
 
         SeeAlso
         -------
         self.debug : API module
         """
+        if not self.__logger.isEnabledFor(logging.DEBUG):
+            return
         
         f = get_funcname(2) if function is None else function
+        if (self._sampler is not None
+            and not self._sample(logging.DEBUG, f, action, tag, depth = 3
+                                 , callsite = callsite)):
+            return
         
         extralogdata = self.logsetting.ExtraLogData(action = action
                                                     , function = f
@@ -242,11 +505,15 @@ class Logger():
             - "trace" : only for trace
             , by default None
             
-        values : dict, optional
+        values : dict or callable, optional
             arbitrary dictionary
             its values must be parseable
+            a callable with no arguments returning the dictionary is also accepted.
+            it is called only when the record is emitted
             , by default None
         """
+        if not self.__logger.isEnabledFor(logging.DEBUG):
+            return
         self._debug(message=message
                     , action=action
                     , function=get_funcname(2)
@@ -284,14 +551,22 @@ class Logger():
             - "use" : be actively used
             , by default None
             
-        values : dict, optional
+        values : dict or callable, optional
             arbitrary dictionary
             its values must be parseable
+            a callable with no arguments returning the dictionary is also accepted.
+            it is called only when the record is emitted
             , by default None
         """
         
+        if not self.__logger.isEnabledFor(logging.INFO):
+            return
+        function = get_funcname(2)
+        if (self._sampler is not None
+            and not self._sample(logging.INFO, function, action, tag)):
+            return
         extralogdata = self.logsetting.ExtraLogData(action = action
-                                                    , function = get_funcname(2)
+                                                    , function = function
                                                     , tag = tag
                                                     , values = values)
         self._logging(extralogdata, "info", message)
@@ -313,14 +588,22 @@ class Logger():
             exception class name
             , by default None
             
-        values : dict, optional
+        values : dict or callable, optional
             arbitrary dictionary
             its values must be parseable
+            a callable with no arguments returning the dictionary is also accepted.
+            it is called only when the record is emitted
             , by default None
         """
         
+        if not self.__logger.isEnabledFor(logging.WARNING):
+            return
+        function = get_funcname(2)
+        if (self._sampler is not None
+            and not self._sample(logging.WARNING, function)):
+            return
         extralogdata = self.logsetting.ExtraLogData(exception = exception
-                                                    , function = get_funcname(2)
+                                                    , function = function
                                                     , values = values)
         self._logging(extralogdata, "warning", message)
         
@@ -341,13 +624,21 @@ class Logger():
             exception class name
             , by default None
             
-        values : dict, optional
+        values : dict or callable, optional
             arbitrary dictionary
             its values must be parseable
+            a callable with no arguments returning the dictionary is also accepted.
+            it is called only when the record is emitted
             , by default None
         """
+        if not self.__logger.isEnabledFor(logging.ERROR):
+            return
+        function = get_funcname(2)
+        if (self._sampler is not None
+            and not self._sample(logging.ERROR, function)):
+            return
         extralogdata = self.logsetting.ExtraLogData(exception = exception
-                                                    , function = get_funcname(2)
+                                                    , function = function
                                                     , values = values)
         self._logging(extralogdata, "error", message)
         
@@ -368,16 +659,224 @@ class Logger():
             exception class name
             , by default None
             
-        values : dict, optional
+        values : dict or callable, optional
             arbitrary dictionary
             its values must be parseable
+            a callable with no arguments returning the dictionary is also accepted.
+            it is called only when the record is emitted
             , by default None
         """
+        if not self.__logger.isEnabledFor(logging.CRITICAL):
+            return
+        function = get_funcname(2)
+        if (self._sampler is not None
+            and not self._sample(logging.CRITICAL, function)):
+            return
         extralogdata = self.logsetting.ExtraLogData(exception = exception
-                                                    , function = get_funcname(2)
+                                                    , function = function
                                                     , values = values)
         self._logging(extralogdata, "critical", message)
     
+    @property
+    def async_emitter(self):
+        """非同期モードのAsyncEmitter（非同期モードでない場合はNone）"""
+        return self._async_emitter
+    
+    def enable_async(self, maxsize:int = 10000, overflow:str = "block"):
+        """非同期モードを有効にする
+        
+        ログレコードはキューに追加され、フォーマットとハンドラのI/Oは
+        バックグラウンドスレッドで行われる。
+        既に有効な場合は何もしない。
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            キューに保持する最大レコード数, by default 10000
+        overflow : str, optional
+            キューが満杯の場合の振る舞い, by default "block"
+            "block", "drop_oldest", "drop_debug"のいずれか
+            詳細はAsyncEmitterを参照
+
+        Returns
+        -------
+        AsyncEmitter
+            キューの統計(queued, dropped)の確認やflushに使用する
+        """
+        if self._async_emitter is None:
+            emitter = AsyncEmitter(self.__logger, maxsize = maxsize, overflow = overflow)
+            emitter.start()
+            self._async_emitter = emitter
+        return self._async_emitter
+    
+    def disable_async(self, timeout:float = None):
+        """非同期モードを無効にする
+        
+        キューにあるレコードを出力しきってから同期モードに戻る
+        """
+        emitter = self._async_emitter
+        if emitter is not None:
+            self._async_emitter = None
+            emitter.close(timeout)
+    
+    @property
+    def sampler(self):
+        """ログの間引きのLogSampler（間引きが無効な場合はNone）"""
+        return self._sampler
+    
+    def enable_sampling(self, every:int = None, per_second:int = None
+                        , summarize:bool = False, max_level:int = logging.INFO):
+        """ログの間引き（サンプリング・レート制限）を有効にする
+        
+        ループ内等で大量に呼ばれるログを、呼び出し元を変更せずに間引く。
+        既に有効な場合は設定を置き換える。
+
+        Parameters
+        ----------
+        every : int, optional
+            呼び出し箇所ごとにN回に1回だけログする, by default None
+        per_second : int, optional
+            (function, action, tag)ごとの1秒あたりの最大ログ数, by default None
+        summarize : bool, optional
+            per_secondで間引いた件数を"suppressed M similar records"としてログするかどうか
+            , by default False
+            valuesの"suppressed"キーに件数が入る
+        max_level : int, optional
+            間引く対象とする最大のログレベル, by default logging.INFO
+            これより重要度の高いログ(WARNING以上等)は間引かない
+
+        Returns
+        -------
+        LogSampler
+            間引いた件数(sampled_out, rate_limited)の確認に使用する
+        """
+        self.disable_sampling()
+        self._sampler = LogSampler(every = every, per_second = per_second
+                                   , summarize = summarize, max_level = max_level)
+        return self._sampler
+    
+    def disable_sampling(self):
+        """ログの間引きを無効にする
+        
+        summarizeでまだログしていない間引いた件数があればログする
+        """
+        sampler = self._sampler
+        if sampler is None:
+            return
+        self._sampler = None
+        for (function, action, tag), suppressed, levelno in sampler.pop_suppressed():
+            self._log_suppressed(levelno, function, action, tag, suppressed)
+    
+    def _sample(self, levelno, function, action = None, tag = None, depth = 2
+                , callsite = None)->bool:
+        """間引きの判定を行い、ログする場合はTrueを返す
+        
+        callsiteがNoneの場合は、深さdepthのフレーム（_sample自身が0）を呼び出し箇所とする
+        """
+        if callsite is None:
+            frame = sys._getframe(depth)
+            callsite = (frame.f_code, frame.f_lineno, action)
+        checked = self._sampler.check(levelno, callsite, (function, action, tag))
+        if checked is None:
+            return False
+        suppressed, suppressed_level = checked
+        if suppressed:
+            # 間引いたログの最大レベルでログする
+            self._log_suppressed(suppressed_level, function, action, tag, suppressed)
+        return True
+    
+    def _log_suppressed(self, levelno, function, action, tag, suppressed):
+        """間引いた件数をログする"""
+        extralogdata = self.logsetting.ExtraLogData(action = action
+                                                    , function = function
+                                                    , tag = tag
+                                                    , values = {"suppressed" : suppressed})
+        self._logging(extralogdata, LEVELNAME.get(levelno, "info")
+                      , "suppressed {} similar records".format(suppressed))
+    
+    @property
+    def trace_stats(self)->dict:
+        """trace_decoの処理時間の記録（__qualname__ -> TraceStats）"""
+        return dict(self._trace_stats)
+    
+    def enable_trace_stats(self, interval:float = None, per_call:bool = True
+                           , level:int = logging.INFO):
+        """trace_decoの処理時間の記録を有効にする
+        
+        wall time, CPU timeを__qualname__ごとの対数ヒストグラム(TraceStats)に記録する。
+        既に有効な場合は設定を置き換え、記録を消去する。
+        
+        Parameters
+        ----------
+        interval : float, optional
+            集計のログ(SUMMARY)を出力する間隔[s], by default None
+            Noneの場合は定期的には出力しない（emit_trace_summaryで出力できる）
+        per_call : bool, optional
+            呼び出しごとのRUN/FINISHEDのログを出力するかどうか, by default True
+            Falseの場合は集計のログだけを出力する
+        level : int, optional
+            集計のログのログレベル, by default logging.INFO
+        
+        Notes
+        -----
+        - 集計のログはaction="summary", tag="trace"で、valuesに
+          count, wall_p50, wall_p95, wall_p99, wall_max, cpu_p50, ..., cpu_maxを含む
+        - intervalの経過はtrace_decoした関数の呼び出し時に判定する
+        """
+        self.disable_trace_stats()
+        with self._trace_lock:
+            self._trace_stats = {}
+            self._trace_last_summary = time.monotonic()
+        self._trace_config = _TraceConfig(interval = interval, per_call = per_call
+                                          , levelno = level)
+    
+    def disable_trace_stats(self):
+        """trace_decoの処理時間の記録を無効にする
+        
+        intervalを指定していた場合は、まだログしていない集計をログする
+        """
+        config = self._trace_config
+        if config is None:
+            return
+        if config.interval is not None:
+            self.emit_trace_summary()
+        self._trace_config = None
+    
+    def emit_trace_summary(self):
+        """trace_decoの処理時間の集計をログし、記録を消去する
+        
+        前回の集計以降に呼び出しのあった関数ごとに1件ずつログする
+        """
+        config = self._trace_config
+        levelno = logging.INFO if config is None else config.levelno
+        with self._trace_lock:
+            self._trace_last_summary = time.monotonic()
+            stats_ls = list(self._trace_stats.items())
+        summaries = [(qualname, stats.summary(reset = True)) for qualname, stats in stats_ls]
+        
+        if not self.__logger.isEnabledFor(levelno):
+            return
+        for qualname, summary in summaries:
+            if not summary["count"]:
+                continue
+            extralogdata = self.logsetting.ExtraLogData(action = "summary"
+                                                        , function = qualname
+                                                        , tag = "trace"
+                                                        , values = summary)
+            self._logging(extralogdata, LEVELNAME.get(levelno, "info")
+                          , "SUMMARY:" + qualname)
+    
+    def _record_trace(self, config, qualname, wall, cpu):
+        """処理時間を記録し、intervalが経過していれば集計をログする"""
+        stats = self._trace_stats.get(qualname)
+        if stats is None:
+            with self._trace_lock:
+                stats = self._trace_stats.setdefault(qualname, TraceStats())
+        stats.record(wall, cpu)
+        if (config.interval is not None
+            and time.monotonic() - self._trace_last_summary >= config.interval):
+            self.emit_trace_summary()
+    
     def setLevel(self, level):
         self.__logger.setLevel(level)
         
@@ -397,7 +896,10 @@ class Logger():
         -----
         - Jupyter等で使うときにgetLoggerした後にこれを呼び出すだけで使える
         - この処理はハンドラにStreamHandlerが１つもsetされていない場合にのみ実行される
+        - フォーマッタはlogtools.formatters.SplitterFormatter
         """
+        # formattersはこのモジュールをimportするので、ここでimportする
+        from logtools.formatters import SplitterFormatter
 
         streamhandler_exists = False
         
@@ -407,7 +909,8 @@ class Logger():
                 
         is_added = not(streamhandler_exists)
         if is_added:
-            formatter = logging.Formatter(self.logsetting.format)
+            formatter = SplitterFormatter(attributes = self.logsetting.attributes
+                                          , splitter = self.logsetting.splitter)
             hdlr = logging.StreamHandler()
             hdlr.setFormatter(formatter)
             self.addHandler(hdlr)
@@ -425,9 +928,28 @@ class Logger():
             debug, info, warning, error, critical
         message : str, optional
             message, by default None
+        
+        Notes
+        -----
+        - valuesが呼び出し可能な場合は、ここで評価した結果をログする
         """
         
         extralog_dic = dict(extralogdata._asdict())
+        if callable(extralog_dic["values"]):
+            extralog_dic["values"] = extralog_dic["values"]()
+        
+        if self._async_emitter is not None:
+            # レコードの作成までを呼び出し元のスレッドで行う
+            levelno = LEVELNO.get(level)
+            if levelno is None:
+                levelno, message = logging.WARNING, "unexpected loglevel"
+            fn, lno, func = self.__logger.findCaller()[:3]
+            record = self.__logger.makeRecord(self.__logger.name, levelno, fn, lno
+                                              , message, None, None
+                                              , func = func, extra = extralog_dic)
+            self._async_emitter.put(record)
+            return
+        
         if level == "debug":
             self.__logger.debug(msg = message
                                 , extra = extralog_dic)
@@ -0,0 +1,560 @@
+"""複数のプロセスのログを1つのライタープロセスで出力する
+
+multiprocessingやpreforkのサーバー等で、複数のプロセスが同じファイルに書き込むと
+行が混ざったりローテーションが壊れたりする。
+このモジュールでは、ファイルへの出力とローテーションを1つのライタープロセス(LogWriter)が担い、
+各プロセスはLogWriterHandlerでレコードをライタープロセスに送信する。
+
+- 送信は各プロセスのバックグラウンドスレッドで行い、キューにたまったレコードをまとめて1回で送る
+- レコードはフォーマットに必要な属性だけのタプル(logtools.records)にしてpickleで送る
+- 通信はmultiprocessing.connection（POSIXではUnixドメインソケット、Windowsでは名前付きパイプ）で、
+  接続時にauthkeyで認証する
+"""
+
+import collections
+import logging
+import logging.config
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from logtools.async_emitter import OVERFLOW_POLICIES
+from logtools.records import decode_record, dumps_records, encode_record, loads_records
+
+
+# ライタープロセスがLogWriter.stop()の後に、接続中のプロセスの切断を待つ最大時間[s]
+DRAIN_TIMEOUT = 10.0
+
+# プロセス内のLogWriterHandler（fork後の子プロセスで状態を初期化する）
+_HANDLERS = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for handler in list(_HANDLERS):
+        handler._reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child = _after_fork_in_child)
+
+
+class LogWriterHandler(logging.Handler):
+    """レコードをライタープロセス(LogWriter)に送信するハンドラ
+
+    emitではレコードを送信用のタプルにしてキューに追加するだけで、
+    送信はバックグラウンドスレッドが行う。送信スレッドはキューにたまっている
+    レコード（最大batch_size件）を1回で送るので、負荷が高いほどまとめて送信される。
+
+    ライタープロセスの書き込みが追いつかない場合は、ソケットのバッファが埋まって送信が待たされ、
+    キューがmaxsize件に達した時点でoverflowに従って呼び出し元を待たせるかレコードを捨てる。
+    捨てた件数は、次の送信時に"dropped N records"というWARNINGのレコードとして送られる。
+
+    dictConfigでは以下のように指定する。
+    {"handlers" : {"writer" : {"class" : "logtools.multiprocess.LogWriterHandler"
+                               , "address" : "/tmp/logtools-writer.sock"}}}
+
+    Notes
+    -----
+    - フォーマットはライタープロセスのハンドラで行われるので、このハンドラのFormatterは使われない
+    - valuesの辞書は送信されるまで参照で保持されるため、
+      ログした後に呼び出し元で変更すると変更後の内容が送信される可能性がある
+    - pickleできない属性の値はreprの文字列として送信される
+    - fork後の子プロセスでは、親プロセスのキューを引き継がずに新しく接続する
+    - プロセスの終了時(atexit, multiprocessingの子プロセスの終了時)にキューを送信しきる
+    - close後に追加されたレコードは、呼び出し元のスレッドで同期的に送信される
+    """
+    def __init__(self, address, authkey:bytes = None, maxsize:int = 10000
+                 , overflow:str = "block", batch_size:int = 1000):
+        """
+
+        Parameters
+        ----------
+        address : str or tuple
+            ライタープロセスのアドレス(LogWriter.address)
+        authkey : bytes, optional
+            認証キー, by default None
+            Noneの場合はmultiprocessing.current_process().authkey
+        maxsize : int, optional
+            キューに保持する最大レコード数, by default 10000
+        overflow : str, optional
+            キューが満杯の場合の振る舞い, by default "block"
+            "block", "drop_oldest", "drop_debug"のいずれか
+            詳細はlogtools.async_emitter.AsyncEmitterを参照
+        batch_size : int, optional
+            1回で送信する最大レコード数, by default 1000
+
+        Raises
+        ------
+        ValueError
+            maxsize, batch_sizeが1未満、またはoverflowが不正な場合
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of " + str(OVERFLOW_POLICIES))
+        super().__init__()
+        self.address = address
+        self.authkey = authkey
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self._reset()
+        _HANDLERS.add(self)
+
+    def _reset(self):
+        """キュー・送信スレッド・接続の状態を初期化する（fork後の子プロセスでも呼ばれる）"""
+        self._queue = collections.deque()
+        self._queue_lock = threading.Lock()
+        self._not_empty = threading.Condition(self._queue_lock)
+        self._not_full = threading.Condition(self._queue_lock)
+        self._all_done = threading.Condition(self._queue_lock)
+        self._unfinished = 0
+        self._unreported = 0 # 捨てたがまだ送信していない件数
+
+        self._sent = 0
+        self._dropped = 0
+        self._batches = 0
+
+        self._conn = None
+        self._sender = None
+        self._stopping = False
+        self._closed = False
+
+    @property
+    def sent(self)->int:
+        """送信したレコードの累計"""
+        return self._sent
+
+    @property
+    def dropped(self)->int:
+        """overflowまたは送信の失敗によって捨てられたレコードの累計"""
+        return self._dropped
+
+    @property
+    def batches(self)->int:
+        """送信(send)の累計"""
+        return self._batches
+
+    def emit(self, record):
+        try:
+            fields = encode_record(record)
+            with self._queue_lock:
+                if not self._closed:
+                    if self._sender is None:
+                        self._start_sender()
+                    while len(self._queue) >= self.maxsize:
+                        if self.overflow == "drop_oldest":
+                            self._queue.popleft()
+                            self._unfinished -= 1
+                            self._drop()
+                        elif (self.overflow == "drop_debug"
+                              and record.levelno <= logging.DEBUG):
+                            self._drop()
+                            return
+                        elif (self.overflow == "drop_debug"
+                              and self._drop_queued_debug()):
+                            pass
+                        else:
+                            self._not_full.wait()
+                            if self._closed:
+                                break
+                    else:
+                        self._queue.append(fields)
+                        self._unfinished += 1
+                        self._not_empty.notify()
+                        return
+
+            # close後は同期的に送信する
+            self._send_batch([fields])
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _drop(self):
+        """捨てた件数を数える（ロックを取得して呼ぶこと）"""
+        self._dropped += 1
+        self._unreported += 1
+
+    def _drop_queued_debug(self)->bool:
+        """キューにある最も古いDEBUGレベル以下のレコードを捨てる（ロックを取得して呼ぶこと）"""
+        for i, fields in enumerate(self._queue):
+            if fields[0][1] <= logging.DEBUG:
+                del self._queue[i]
+                self._unfinished -= 1
+                self._drop()
+                return True
+        return False
+
+    def _start_sender(self):
+        """送信スレッドを開始する（ロックを取得して呼ぶこと）"""
+        self._sender = threading.Thread(target = self._send_loop
+                                        , name = "logtools-LogWriterHandler", daemon = True)
+        self._sender.start()
+        # プロセスの終了時にキューを送信しきる
+        # multiprocessingの子プロセスはatexitを実行しないので、Finalizeで登録する
+        multiprocessing.util.Finalize(None, self.flush, kwargs = {"timeout" : DRAIN_TIMEOUT}
+                                      , exitpriority = 10)
+
+    def _dropped_record(self, n:int)->tuple:
+        """捨てた件数を知らせるレコード"""
+        record = logging.makeLogRecord({"name" : __name__
+                                        , "levelno" : logging.WARNING
+                                        , "levelname" : "WARNING"
+                                        , "msg" : "dropped {} records".format(n)
+                                        , "values" : {"dropped" : n}})
+        return encode_record(record)
+
+    def _send_loop(self):
+        """送信スレッドの処理"""
+        while True:
+            with self._queue_lock:
+                while not self._queue and not self._stopping:
+                    self._not_empty.wait()
+                if not self._queue:
+                    # _stoppingかつキューが空
+                    return
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                self._not_full.notify_all()
+                n_records = len(batch)
+                if self._unreported:
+                    batch.append(self._dropped_record(self._unreported))
+                    self._unreported = 0
+
+            sent = False
+            try:
+                self._send_batch(batch)
+                sent = True
+            except Exception:
+                traceback.print_exc(file = sys.stderr)
+            finally:
+                with self._queue_lock:
+                    self._unfinished -= n_records
+                    if sent:
+                        self._sent += n_records
+                    else:
+                        self._dropped += n_records
+                    if self._unfinished <= 0:
+                        self._all_done.notify_all()
+
+    def _send_batch(self, batch:list):
+        """レコードのリストを1回で送信する（接続していない場合は接続する）"""
+        data = dumps_records(batch)
+        if self._conn is None:
+            authkey = self.authkey
+            if authkey is None:
+                authkey = bytes(multiprocessing.current_process().authkey)
+            self._conn = multiprocessing.connection.Client(self.address, authkey = authkey)
+        try:
+            self._conn.send_bytes(data)
+        except Exception:
+            # 次の送信で接続し直す
+            conn, self._conn = self._conn, None
+            conn.close()
+            raise
+        self._batches += 1
+
+    def flush(self, timeout:float = None)->bool:
+        """キューにあるレコードがすべて送信されるまで待つ
+
+        Parameters
+        ----------
+        timeout : float, optional
+            最大待ち時間[s], by default None
+
+        Returns
+        -------
+        bool
+            すべて送信された場合にはTrue、タイムアウトした場合にはFalse
+        """
+        with self._queue_lock:
+            if self._sender is None:
+                return not self._queue
+            return self._all_done.wait_for(lambda: self._unfinished <= 0, timeout)
+
+    def close(self):
+        """キューにあるレコードを送信しきってから接続を閉じる"""
+        with self._queue_lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+            sender = self._sender
+        if sender is not None and sender is not threading.current_thread():
+            sender.join()
+        with self._queue_lock:
+            self._closed = True
+            # blockで待っている呼び出し元を解放する
+            self._not_full.notify_all()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        super().close()
+
+
+def _remove_writer_handlers():
+    """fork元から引き継いだLogWriterHandlerを外す（ライタープロセスが自身に送信しないように）"""
+    loggers = [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values())
+    for logger in loggers:
+        if isinstance(logger, logging.Logger):
+            for hdlr in list(logger.handlers):
+                if isinstance(hdlr, LogWriterHandler):
+                    logger.removeHandler(hdlr)
+
+def _configured_handlers()->list:
+    """ロガーに設定されているハンドラ"""
+    handlers = []
+    loggers = [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values())
+    for logger in loggers:
+        if isinstance(logger, logging.Logger):
+            for hdlr in logger.handlers:
+                if hdlr not in handlers:
+                    handlers.append(hdlr)
+    return handlers
+
+def _accept(listener, accepted:list, wake):
+    """接続を受け付け、メインループを起こす（ライタープロセスのスレッド）"""
+    while True:
+        try:
+            conn = listener.accept()
+        except multiprocessing.AuthenticationError:
+            continue
+        except (OSError, EOFError):
+            # listenerが閉じられた
+            return
+        accepted.append(conn)
+        try:
+            wake.send_bytes(b"")
+        except OSError:
+            return
+
+def _handle_batch(data:bytes)->int:
+    """受信したレコードを同じ名前のロガーで出力する"""
+    batch = loads_records(data)
+    for fields in batch:
+        record = decode_record(fields)
+        logging.getLogger(record.name).handle(record)
+    return len(batch)
+
+def _serve(config:dict, address, authkey:bytes, control):
+    """ライタープロセスの処理"""
+    _remove_writer_handlers()
+    config = dict(config)
+    config.setdefault("disable_existing_loggers", False)
+    logging.config.dictConfig(config)
+    handlers = _configured_handlers()
+
+    listener = multiprocessing.connection.Listener(address, authkey = authkey)
+    wake_r, wake_w = multiprocessing.Pipe(duplex = False)
+    accepted = []
+    threading.Thread(target = _accept, args = (listener, accepted, wake_w)
+                     , name = "logtools-LogWriter-accept", daemon = True).start()
+    control.send(listener.address)
+
+    clients = []
+    waitables = [control, wake_r]
+    records = batches = 0
+    unflushed = False
+    deadline = None # stop()後の終了期限
+    while True:
+        if deadline is None:
+            timeout = None
+        else:
+            timeout = max(0.0, deadline - time.monotonic())
+        ready = multiprocessing.connection.wait(clients + waitables, 0 if unflushed else timeout)
+        if not ready:
+            if unflushed:
+                # 受信したレコードがなくなったらハンドラをflushする
+                for hdlr in handlers:
+                    hdlr.flush()
+                unflushed = False
+                continue
+            break
+
+        for conn in ready:
+            if conn is control:
+                try:
+                    drain_timeout = control.recv()
+                except (EOFError, OSError):
+                    # 親プロセスが終了した
+                    drain_timeout = 0.0
+                deadline = time.monotonic() + drain_timeout
+                waitables.remove(control)
+                listener.close()
+            elif conn is wake_r:
+                wake_r.recv_bytes()
+                while accepted:
+                    clients.append(accepted.pop(0))
+            else:
+                try:
+                    data = conn.recv_bytes()
+                except (EOFError, OSError):
+                    clients.remove(conn)
+                    conn.close()
+                    continue
+                try:
+                    records += _handle_batch(data)
+                    batches += 1
+                except Exception:
+                    traceback.print_exc(file = sys.stderr)
+                unflushed = True
+
+        if deadline is not None and (not clients or time.monotonic() >= deadline):
+            break
+
+    for conn in clients:
+        conn.close()
+    logging.shutdown()
+    try:
+        control.send({"records" : records, "batches" : batches})
+    except OSError:
+        pass
+
+
+class LogWriter():
+    """ログの出力とローテーションを担うライタープロセス
+
+    ライタープロセスはdictConfigの設定でハンドラを作成し、
+    LogWriterHandlerから受信したレコードを、レコードと同じ名前のロガーで出力する。
+    ファイルを開くのはライタープロセスだけなので、ローテーションも安全に行われる。
+
+    >>> writer = LogWriter(conf_dic)
+    >>> writer.start()
+    >>> # 各プロセスで
+    >>> logging.getLogger().addHandler(writer.handler())
+    >>> ...
+    >>> writer.stop()
+
+    Notes
+    -----
+    - 各プロセスはLogWriterHandlerにwriter.address, （authkeyを指定した場合は）authkeyを指定する。
+      spawnで起動するプロセスには、addressを引数等で渡す
+    - 受信したレコードのレベルは判定しない（送信側のロガーで判定済み）。
+      ハンドラのレベルとフィルタは適用される
+    - configのdisable_existing_loggersのデフォルトはFalseとする
+    - プロセスの終了時(atexit)にstop()が呼ばれる
+    """
+    def __init__(self, config:dict, address = None, authkey:bytes = None):
+        """
+
+        Parameters
+        ----------
+        config : dict
+            ライタープロセスで適用するlogging.config.dictConfigの設定
+        address : str or tuple, optional
+            待ち受けるアドレス, by default None
+            Noneの場合は一時的なUnixドメインソケット（Windowsでは名前付きパイプ）
+        authkey : bytes, optional
+            認証キー, by default None
+            Noneの場合はmultiprocessing.current_process().authkey
+        """
+        self.config = config
+        self._address = address
+        if authkey is None:
+            authkey = bytes(multiprocessing.current_process().authkey)
+        self.authkey = authkey
+        self._process = None
+        self._control = None
+        self._stats = None
+
+    @property
+    def address(self):
+        """待ち受けているアドレス（start()の前はNone, addressを指定した場合はその値）"""
+        return self._address
+
+    @property
+    def records(self)->int:
+        """受信して出力したレコードの累計（stop()の後に確定する）"""
+        return None if self._stats is None else self._stats["records"]
+
+    @property
+    def batches(self)->int:
+        """受信(recv)の累計（stop()の後に確定する）"""
+        return None if self._stats is None else self._stats["batches"]
+
+    def start(self, timeout:float = 30.0):
+        """ライタープロセスを開始し、待ち受けを始めるまで待つ
+
+        Returns
+        -------
+        str or tuple
+            待ち受けているアドレス
+
+        Raises
+        ------
+        RuntimeError
+            ライタープロセスが開始できなかった（dictConfigの設定が不正等）場合
+        """
+        if self._process is not None:
+            return self._address
+        control, child_control = multiprocessing.Pipe()
+        process = multiprocessing.Process(target = _serve
+                                          , args = (self.config, self._address
+                                                    , self.authkey, child_control)
+                                          , name = "logtools-LogWriter", daemon = True)
+        process.start()
+        child_control.close()
+        try:
+            if not control.poll(timeout):
+                raise EOFError
+            address = control.recv()
+        except (EOFError, OSError):
+            process.terminate()
+            process.join()
+            control.close()
+            raise RuntimeError("failed to start the log writer process")
+        self._process = process
+        self._control = control
+        self._address = address
+        multiprocessing.util.Finalize(None, self.stop, exitpriority = 5)
+        return address
+
+    def handler(self, **kwargs)->LogWriterHandler:
+        """このライタープロセスに送信するLogWriterHandlerを作成する
+
+        Parameters
+        ----------
+        **kwargs
+            LogWriterHandlerの引数(maxsize, overflow, batch_size)
+        """
+        return LogWriterHandler(self._address, authkey = self.authkey, **kwargs)
+
+    def stop(self, timeout:float = DRAIN_TIMEOUT)->dict:
+        """ライタープロセスを終了する
+
+        新しい接続の受け付けをやめ、接続中のプロセスが切断するか、timeout秒が経過するまで
+        受信したレコードを出力してから、ハンドラを閉じて終了する。
+
+        Parameters
+        ----------
+        timeout : float, optional
+            接続中のプロセスの切断を待つ最大時間[s], by default DRAIN_TIMEOUT
+
+        Returns
+        -------
+        dict
+            "records", "batches"をキーとする辞書（取得できなかった場合はNone）
+        """
+        process, self._process = self._process, None
+        if process is None:
+            return self._stats
+        control, self._control = self._control, None
+        try:
+            control.send(timeout)
+            if control.poll(timeout + DRAIN_TIMEOUT):
+                self._stats = control.recv()
+        except (EOFError, OSError):
+            pass
+        control.close()
+        process.join(DRAIN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        return self._stats
@@ -0,0 +1,139 @@
+"""LogRecordのフォーマット前の圧縮表現
+
+LogRecordを、フォーマットに必要な属性だけのタプルにする（およびその逆）。
+プロセス間の送信(logtools.multiprocess)やメモリ上での保持(logtools.handlers.RingBufferHandler)に使う。
+
+- メッセージはmsg % argsを適用した文字列にする（deferred=Trueの場合はmsg, argsのまま保持する）
+- 例外はトレースバックの文字列(exc_text)にする（exc_infoは保持しない）
+- levelname, filename, module等は復元時に作り直す
+- logtoolsのvalues等の組み込み以外の属性はそのまま保持する
+"""
+
+import copy
+import functools
+import logging
+import operator
+import os
+import pickle
+
+
+# 保持するLogRecordの組み込みの属性（メッセージ・例外以外）
+_RECORD_ATTRIBUTES = tuple(["name", "levelno", "pathname", "lineno", "funcName"
+                            , "created", "msecs", "relativeCreated"
+                            , "thread", "threadName", "process", "processName", "stack_info"])
+_get_record_attributes = operator.attrgetter(*_RECORD_ATTRIBUTES)
+
+# 空のLogRecordの属性（復元時のひな形）
+_BLANK_RECORD = logging.makeLogRecord({}).__dict__
+
+# これら以外の属性（logtoolsのvalues等, extraで指定した属性）はそのまま保持する
+_STANDARD_KEYS = frozenset(_BLANK_RECORD) | frozenset(["message", "asctime"])
+
+# 例外のトレースバックを文字列にするFormatter
+_FORMATTER = logging.Formatter()
+
+# deferred=Trueの場合に浅いコピーを保持する型
+_COPIED_TYPES = (dict, list, set, bytearray)
+
+
+def _snapshot(value):
+    """変更可能なコンテナは浅いコピーにする"""
+    if isinstance(value, _COPIED_TYPES):
+        return copy.copy(value)
+    if type(value) is tuple:
+        return tuple(_snapshot(v) for v in value)
+    return value
+
+def encode_record(record, deferred:bool = False)->tuple:
+    """LogRecordをフォーマット前の圧縮表現のタプルにする
+
+    Parameters
+    ----------
+    record : logging.LogRecord
+    deferred : bool, optional
+        msg % argsの適用をdecode_recordの後（フォーマット時）まで遅らせるかどうか, by default False
+        Trueの場合は、呼び出し元がログした後に値を変更しても保持した内容が変わらないように、
+        args, extraの値(valuesの辞書等)のうち、辞書・リスト等を浅いコピーにする
+        （入れ子になった辞書・リストの中身はコピーしない）
+
+    Returns
+    -------
+    tuple
+        decode_recordでLogRecordに戻せるタプル
+    """
+    if record.exc_info and not record.exc_text:
+        record.exc_text = _FORMATTER.formatException(record.exc_info)
+    extra = {key : value for key, value in record.__dict__.items() if key not in _STANDARD_KEYS}
+    if not deferred:
+        return (_get_record_attributes(record), record.getMessage(), None, record.exc_text
+                , extra or None)
+    for key, value in extra.items():
+        if isinstance(value, _COPIED_TYPES):
+            extra[key] = copy.copy(value)
+    return (_get_record_attributes(record), record.msg, _snapshot(record.args), record.exc_text
+            , extra or None)
+
+@functools.lru_cache(maxsize = 1024)
+def _split_pathname(pathname:str)->tuple:
+    """pathnameから(filename, module)を求める（LogRecordと同じ）"""
+    try:
+        filename = os.path.basename(pathname)
+        return filename, os.path.splitext(filename)[0]
+    except (TypeError, ValueError, AttributeError):
+        return pathname, "Unknown module"
+
+def decode_record(fields:tuple):
+    """encode_recordのタプルからLogRecordを作る
+
+    Returns
+    -------
+    logging.LogRecord
+        元のレコードと同じ出力になるレコード（exc_infoはNone）
+    """
+    attributes, msg, args, exc_text, extra = fields
+    record = logging.LogRecord.__new__(logging.LogRecord)
+    dic = record.__dict__
+    dic.update(_BLANK_RECORD)
+    dic.update(zip(_RECORD_ATTRIBUTES, attributes))
+    record.msg = msg
+    record.args = args
+    record.exc_text = exc_text
+    record.levelname = logging.getLevelName(record.levelno)
+    record.filename, record.module = _split_pathname(record.pathname)
+    if extra:
+        dic.update(extra)
+    return record
+
+def _is_picklable(value)->bool:
+    try:
+        pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return True
+    except Exception:
+        return False
+
+def _picklable(fields:tuple)->tuple:
+    """pickleできない属性の値をreprの文字列にする（argsがpickleできない場合はmsg % argsを適用する）"""
+    if _is_picklable(fields):
+        return fields
+    attributes, msg, args, exc_text, extra = fields
+    if not _is_picklable((msg, args)):
+        record = logging.makeLogRecord({"msg" : msg, "args" : args})
+        msg, args = record.getMessage(), None
+    if extra:
+        extra = {key : value if _is_picklable(value) else repr(value)
+                 for key, value in extra.items()}
+    return (attributes, msg, args, exc_text, extra)
+
+def dumps_records(records:list)->bytes:
+    """encode_recordのタプルのリストをバイト列にする
+
+    pickleできない属性の値はreprの文字列にする
+    """
+    try:
+        return pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return pickle.dumps([_picklable(fields) for fields in records], pickle.HIGHEST_PROTOCOL)
+
+def loads_records(data:bytes)->list:
+    """dumps_recordsのバイト列からタプルのリストに戻す"""
+    return pickle.loads(data)
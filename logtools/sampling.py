@@ -0,0 +1,164 @@
+"""ログの間引き（サンプリング・レート制限）を判定する"""
+
+import logging
+import threading
+import time
+
+
+# 呼び出し回数を数える呼び出し箇所の最大数（超えた場合はカウンタをリセットする）
+MAX_CALLSITES = 10000
+
+# 間引いた件数がない場合のcheckの戻り値
+_NOT_SUPPRESSED = tuple([0, logging.NOTSET])
+
+
+class LogSampler():
+    """ログするかどうかを呼び出しごとに判定する
+
+    - every : 呼び出し箇所ごとに、N回に1回（1回目, N+1回目, ...）だけログする
+    - per_second : (function, action, tag)ごとに、1秒あたりK件までログする
+    - summarize : per_secondで間引いた件数を、次の1秒の最初のログの前に
+      "suppressed M similar records"としてログする
+
+    判定は辞書の参照とカウンタの更新だけなので、すべての呼び出しで行ってもよい。
+    max_levelより重要度の高いログは間引かない。
+
+    Notes
+    -----
+    - 呼び出し箇所は(code object, 行番号, action)で区別する
+    - 1秒の区切りはキーごとに、その区切りで最初にログした時刻から数える
+    - 呼び出し箇所がMAX_CALLSITESを超えた場合は、everyのカウンタをリセットする
+      （リセット直後の呼び出しはログされる）
+    - 区切りが終わったキーは1秒ごとに消去する。
+      ただし、summarizeでまだログしていない間引いた件数があるキーは残す
+    """
+    def __init__(self, every:int = None, per_second:int = None, summarize:bool = False
+                 , max_level:int = logging.INFO):
+        """
+
+        Parameters
+        ----------
+        every : int, optional
+            呼び出し箇所ごとにN回に1回だけログする, by default None
+            Noneの場合は間引かない
+        per_second : int, optional
+            (function, action, tag)ごとの1秒あたりの最大ログ数, by default None
+            Noneの場合は制限しない
+        summarize : bool, optional
+            per_secondで間引いた件数をログするかどうか, by default False
+        max_level : int, optional
+            間引く対象とする最大のログレベル, by default logging.INFO
+
+        Raises
+        ------
+        ValueError
+            every, per_secondが1未満の場合
+        """
+        if every is not None and every < 1:
+            raise ValueError("every must be positive")
+        if per_second is not None and per_second < 1:
+            raise ValueError("per_second must be positive")
+
+        self.every = every
+        self.per_second = per_second
+        self.summarize = summarize
+        self.max_level = max_level
+
+        self._lock = threading.Lock()
+        self._calls = {} # 呼び出し箇所 -> 呼び出し回数
+        # (function, action, tag) -> [区切りの開始時刻, ログ数, 間引いた数, 間引いたログの最大レベル]
+        self._windows = {}
+        self._last_sweep = time.monotonic()
+
+        self._sampled_out = 0
+        self._rate_limited = 0
+
+    @property
+    def sampled_out(self)->int:
+        """everyによって間引かれたログの累計"""
+        return self._sampled_out
+
+    @property
+    def rate_limited(self)->int:
+        """per_secondによって間引かれたログの累計"""
+        return self._rate_limited
+
+    def check(self, levelno:int, callsite, key):
+        """ログするかどうかを判定する
+
+        Parameters
+        ----------
+        levelno : int
+            ログレベル
+        callsite : hashable
+            呼び出し箇所
+        key : tuple
+            (function, action, tag)
+
+        Returns
+        -------
+        tuple or None
+            ログしない場合はNone
+            ログする場合は(間引いた件数, 間引いたログの最大レベル)
+            summarizeがTrueであれば前の1秒間に間引いた分、それ以外は(0, logging.NOTSET)
+        """
+        if levelno > self.max_level:
+            return _NOT_SUPPRESSED
+        with self._lock:
+            if self.every is not None:
+                n_calls = self._calls.get(callsite)
+                if n_calls is None:
+                    if len(self._calls) >= MAX_CALLSITES:
+                        self._calls.clear()
+                    n_calls = 0
+                self._calls[callsite] = n_calls + 1
+                if n_calls % self.every:
+                    self._sampled_out += 1
+                    return None
+
+            if self.per_second is None:
+                return _NOT_SUPPRESSED
+            now = time.monotonic()
+            if now - self._last_sweep >= 1.0:
+                self._sweep(now)
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1.0:
+                self._windows[key] = [now, 1, 0, logging.NOTSET]
+                if window is None or not window[2] or not self.summarize:
+                    return _NOT_SUPPRESSED
+                return (window[2], window[3])
+            if window[1] < self.per_second:
+                window[1] += 1
+                return _NOT_SUPPRESSED
+            window[2] += 1
+            if levelno > window[3]:
+                window[3] = levelno
+            self._rate_limited += 1
+            return None
+
+    def _sweep(self, now:float):
+        """区切りが終わり、ログしていない間引いた件数もないキーを消去する（ロックを取得して呼ぶ）"""
+        self._last_sweep = now
+        expired = [key for key, window in self._windows.items()
+                   if now - window[0] >= 1.0 and not (self.summarize and window[2])]
+        for key in expired:
+            del self._windows[key]
+
+    def pop_suppressed(self)->list:
+        """まだログしていない間引いた件数を取り出す
+
+        Returns
+        -------
+        list of tuple
+            (key, 間引いた件数, 間引いたログの最大レベル)のリスト
+            summarizeがFalseの場合は空のリスト
+        """
+        if not self.summarize:
+            return []
+        with self._lock:
+            suppressed = [(key, window[2], window[3])
+                          for key, window in self._windows.items() if window[2]]
+            for window in self._windows.values():
+                window[2] = 0
+                window[3] = logging.NOTSET
+        return suppressed
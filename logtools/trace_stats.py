@@ -0,0 +1,139 @@
+"""trace_decoで計測した処理時間の集計"""
+
+import math
+import threading
+
+
+# ヒストグラムの1オクターブ（2倍）あたりのバケット数
+# パーセンタイルの相対誤差は2**(1/8)-1（約9%）以下
+BUCKETS_PER_OCTAVE = 8
+
+# 最初のバケットの上限[s]（これ以下の処理時間は最初のバケットに入る）
+MIN_SECONDS = 1e-7
+
+# バケット数（MIN_SECONDS * 2**40 = 約30時間まで）
+N_BUCKETS = BUCKETS_PER_OCTAVE * 40
+
+# log2(seconds) * BUCKETS_PER_OCTAVEからバケット番号への変換のオフセット
+_OFFSET = -math.log2(MIN_SECONDS) * BUCKETS_PER_OCTAVE
+
+# TraceStats.summaryで求めるパーセンタイル
+PERCENTILES = tuple([50, 95, 99])
+
+
+def _bucket(seconds:float)->int:
+    """処理時間のバケット番号を返す"""
+    if seconds <= MIN_SECONDS:
+        return 0
+    i = int(math.log2(seconds) * BUCKETS_PER_OCTAVE + _OFFSET)
+    return i if i < N_BUCKETS else N_BUCKETS - 1
+
+
+class LatencyHistogram():
+    """処理時間の対数ヒストグラム
+
+    処理時間を保持せず、バケットごとの件数だけを数えるので
+    メモリ使用量と記録のコストは呼び出し回数によらず一定。
+    件数・合計・最大値は正確な値を保持する。
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """記録をすべて消去する"""
+        self._counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds:float):
+        """処理時間を1件記録する
+
+        Parameters
+        ----------
+        seconds : float
+            処理時間[s]
+        """
+        self._counts[_bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q:float)->float:
+        """q%点の処理時間を返す
+
+        Parameters
+        ----------
+        q : float
+            0から100
+
+        Returns
+        -------
+        float
+            q%点を含むバケットの上限（最大値を超える場合や最後のバケットの場合は最大値）
+            記録がない場合はNone
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * q / 100))
+        cumsum = 0
+        for i, n in enumerate(self._counts):
+            cumsum += n
+            if cumsum >= rank:
+                break
+        if i == N_BUCKETS - 1:
+            return self.max
+        return min(MIN_SECONDS * 2 ** ((i + 1) / BUCKETS_PER_OCTAVE), self.max)
+
+
+class TraceStats():
+    """1つの関数のwall time, CPU timeのヒストグラム"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wall = LatencyHistogram()
+        self.cpu = LatencyHistogram()
+
+    @property
+    def count(self)->int:
+        """記録した呼び出し回数"""
+        return self.wall.count
+
+    def record(self, wall:float, cpu:float):
+        """1回の呼び出しの処理時間を記録する
+
+        Parameters
+        ----------
+        wall : float
+            wall time[s]
+        cpu : float
+            CPU time[s]
+        """
+        with self._lock:
+            self.wall.record(wall)
+            self.cpu.record(cpu)
+
+    def summary(self, reset:bool = False)->dict:
+        """集計値を返す
+
+        Parameters
+        ----------
+        reset : bool, optional
+            集計後に記録を消去するかどうか, by default False
+
+        Returns
+        -------
+        dict
+            "count", "wall_p50", "wall_p95", "wall_p99", "wall_max",
+            "cpu_p50", ..., "cpu_max"をキーとする辞書
+        """
+        with self._lock:
+            dic = {"count" : self.wall.count}
+            for name, hist in (("wall", self.wall), ("cpu", self.cpu)):
+                for q in PERCENTILES:
+                    dic["{}_p{}".format(name, q)] = hist.percentile(q)
+                dic[name + "_max"] = hist.max
+            if reset:
+                self.wall.reset()
+                self.cpu.reset()
+        return dic
@@ -1,11 +1,68 @@
 # テスト用のダミーログファイル生成
 import logging.config
+import threading
 import time
 
 import pytest
 
 import logtools
 
+# list_loggerのロガー名
+LIST_LOGGER = "list_logger"
+
+
+class ListHandler(logging.Handler):
+    """受け取ったレコードと、出力したスレッドをリストに格納するハンドラ"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.append(threading.current_thread())
+
+class FakeClock():
+    """time.monotonicの代わりに、nowを返す"""
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.monotonicをFakeClockに置き換える"""
+    fake = FakeClock()
+    monkeypatch.setattr(time, "monotonic", fake)
+    return fake
+
+@pytest.fixture
+def list_logger():
+    """ListHandlerだけに出力するlogtools.Logger
+
+    Returns
+    -------
+    tuple
+        (logtools.Logger, ListHandler)
+        logging.Loggerはlogging.getLogger(LIST_LOGGER)で取得する
+    """
+    std_logger = logging.getLogger(LIST_LOGGER)
+    level = std_logger.level
+    std_logger.setLevel(logging.DEBUG)
+    std_logger.propagate = False
+    std_logger.disabled = False # 他のテストのdictConfigで無効にされている場合がある
+    handler = ListHandler()
+    std_logger.addHandler(handler)
+    logger = logtools.getLogger(LIST_LOGGER)
+    yield logger, handler
+    logger.disable_async()
+    logger.disable_sampling()
+    logger.disable_trace_stats()
+    std_logger.handlers = []
+    # テストが失敗した場合も、テスト中に変更したレベルを戻す
+    std_logger.setLevel(level)
+
 @pytest.fixture(scope="module")
 def valid_typ_log():
     """loganal.pyで取り扱えるタイプのログ（１つ）を作成する
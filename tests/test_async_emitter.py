@@ -0,0 +1,96 @@
+import logging
+import threading
+
+import pytest
+
+from logtools.async_emitter import AsyncEmitter
+from tests.conftest import LIST_LOGGER
+
+
+@pytest.fixture
+def std_logger(list_logger):
+    """list_loggerのlogging.LoggerとListHandler"""
+    _, handler = list_logger
+    return logging.getLogger(LIST_LOGGER), handler
+
+def make_record(logger, levelno, msg):
+    return logger.makeRecord(logger.name, levelno, "(unknown file)", 0, msg, None, None)
+
+def test_emit_in_background(std_logger):
+    logger, handler = std_logger
+    emitter = AsyncEmitter(logger)
+    emitter.start()
+    for i in range(5):
+        assert emitter.put(make_record(logger, logging.INFO, str(i)))
+    assert emitter.flush(timeout = 5)
+
+    assert [r.msg for r in handler.records] == ["0", "1", "2", "3", "4"]
+    assert all(th is not threading.current_thread() for th in handler.threads)
+    assert emitter.queued == 5
+    assert emitter.emitted == 5
+    assert emitter.dropped == 0
+    emitter.close()
+
+def test_drop_oldest(std_logger):
+    logger, handler = std_logger
+    emitter = AsyncEmitter(logger, maxsize = 2, overflow = "drop_oldest")
+    for i in range(3):
+        emitter.put(make_record(logger, logging.INFO, str(i)))
+    assert emitter.dropped == 1
+    assert emitter.qsize == 2
+
+    emitter.start()
+    emitter.close()
+    assert [r.msg for r in handler.records] == ["1", "2"]
+
+def test_drop_debug(std_logger):
+    logger, handler = std_logger
+    emitter = AsyncEmitter(logger, maxsize = 2, overflow = "drop_debug")
+    emitter.put(make_record(logger, logging.DEBUG, "debug1"))
+    emitter.put(make_record(logger, logging.INFO, "info1"))
+    # 満杯時のDEBUGは捨てられる
+    assert not emitter.put(make_record(logger, logging.DEBUG, "debug2"))
+    # 満杯時のINFOはキューにあるDEBUGを押し出す
+    assert emitter.put(make_record(logger, logging.INFO, "info2"))
+    assert emitter.dropped == 2
+
+    emitter.close()
+    assert [r.msg for r in handler.records] == ["info1", "info2"]
+
+def test_put_after_close(std_logger):
+    logger, handler = std_logger
+    emitter = AsyncEmitter(logger)
+    emitter.start()
+    emitter.close()
+    assert emitter.closed
+
+    emitter.put(make_record(logger, logging.INFO, "sync"))
+    assert [r.msg for r in handler.records] == ["sync"]
+    assert handler.threads[0] is threading.current_thread()
+
+def test_invalid_overflow(std_logger):
+    logger, _ = std_logger
+    with pytest.raises(ValueError):
+        AsyncEmitter(logger, overflow = "foo")
+
+def test_logger_async(list_logger):
+    """logtools.Loggerの非同期モード"""
+    logger, handler = list_logger
+    logger.enable_async()
+    try:
+        emitter = logger.async_emitter
+        assert emitter is not None
+        assert logger.enable_async() is emitter
+
+        logger.info("async info", action = "run", values = lambda: {"A" : 1})
+        assert emitter.flush(timeout = 5)
+
+        record = handler.records[0]
+        assert record.msg == "async info"
+        assert record.function == "test_logger_async"
+        assert record.values == {"A" : 1}
+        assert record.levelno == logging.INFO
+    finally:
+        logger.disable_async()
+    assert logger.async_emitter is None
+    assert emitter.closed
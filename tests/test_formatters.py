@@ -0,0 +1,112 @@
+import json
+import logging
+import logging.config
+
+import pytest
+
+from logtools.formatters import JsonFormatter, SplitterFormatter
+from logtools.loganal import log_to_dict
+from logtools.logging_tool import Logger, getLogger
+
+
+def make_record(msg = "message", **extra):
+    record = logging.LogRecord("formatter_test", logging.INFO, "(unknown file)", 0
+                               , msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+def make_logtools_record(msg = "message", **extra):
+    dic = {"action" : None, "exception" : None, "function" : "FUNC", "tag" : None, "values" : None}
+    dic.update(extra)
+    return make_record(msg, **dic)
+
+def test_json_formatter():
+    formatter = JsonFormatter()
+    record = make_record("split===me"
+                         , action = "run", exception = None, function = "FUNC", tag = "use"
+                         , values = {"A" : 1, "nest" : {"B" : [1, 2]}})
+    
+    dic = json.loads(formatter.format(record))
+    assert list(dic.keys()) == ["asctime", "levelname", "name", "function", "action"
+                                , "exception", "message", "tag", "values"]
+    assert dic["message"] == "split===me"
+    assert dic["levelname"] == "INFO"
+    assert dic["exception"] is None
+    assert dic["values"] == {"A" : 1, "nest" : {"B" : [1, 2]}}
+
+def test_json_formatter_not_serializable():
+    formatter = JsonFormatter(attributes = ("message", "values"))
+    record = make_record(None, values = {"S" : {1}})
+    
+    dic = json.loads(formatter.format(record))
+    assert dic == {"message" : None, "values" : {"S" : "{1}"}}
+
+def test_json_formatter_key_types():
+    """JSONのキーにできないキーはreprの文字列になる"""
+    formatter = JsonFormatter(attributes = ("message", "values"))
+    record = make_record("message", values = {(1, 2) : "tuple", 3 : "int"
+                                              , "nest" : [{frozenset() : None}]})
+    
+    dic = json.loads(formatter.format(record))
+    assert dic["values"] == {"(1, 2)" : "tuple", "3" : "int", "nest" : [{"frozenset()" : None}]}
+
+
+@pytest.mark.parametrize("msg, extra", [("message", {})
+                                        , (None, {})
+                                        , ("loop %s", {"action" : "run", "values" : {"i" : 1}})
+                                        , (3, {"tag" : "use", "values" : {"A" : {"B" : [1, 2]}}})
+                                        ])
+def test_splitter_formatter_same_as_stdlib(msg, extra):
+    """スプリッターを含まないレコードはlogging.Formatterと同じ出力になる"""
+    stdlib = logging.Formatter(Logger.makeformat().format)
+    formatter = SplitterFormatter()
+    record = make_logtools_record(msg, **extra)
+    if msg == "loop %s":
+        record.args = ("arg",)
+    assert formatter.format(record) == stdlib.format(record)
+    # asctimeのキャッシュを使う2回目も同じ
+    assert formatter.format(record) == stdlib.format(record)
+    assert formatter._fmt == stdlib._fmt
+
+@pytest.mark.parametrize("msg", ["split===me", "multi\nline", "ends=", "=starts", "==="])
+def test_splitter_formatter_escape(msg):
+    """スプリッターや改行を含むフィールドはエスケープされ、loganalで元に戻る"""
+    logsetting = Logger.makeformat()
+    record = make_logtools_record(msg, action = "run==", values = {"key" : msg, "n" : 1})
+    line = SplitterFormatter().format(record)
+    assert "\n" not in line
+
+    dic = log_to_dict(line, logsetting.attributes, logsetting.splitter)
+    assert dic["message"] == msg
+    assert dic["action"] == "run=="
+    assert dic["key"] == msg
+    assert dic["n"] == 1
+
+def test_splitter_formatter_foreign_record():
+    """logtools.Logger以外のレコードは、ない属性をNoneとして出力する"""
+    formatter = SplitterFormatter(attributes = ("levelname", "message", "values"), splitter = "|")
+    assert formatter.format(make_record("plain")) == "INFO|plain|None"
+
+def test_splitter_formatter_invalid_splitter():
+    with pytest.raises(ValueError):
+        SplitterFormatter(splitter = "'")
+
+def test_splitter_formatter_drop_in():
+    """dictConfigとadd_StreamHandlerで使用できる"""
+    conf_dic = {"version" : 1
+                , "disable_existing_loggers" : False
+                , "formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}
+                , "handlers" : {"stream" : {"class" : "logging.StreamHandler"
+                                            , "formatter" : "splitter"}}
+                , "loggers" : {"formatter_test_conf" : {"handlers" : ["stream"]}}
+                }
+    logging.config.dictConfig(conf_dic)
+    std_logger = logging.getLogger("formatter_test_conf")
+    assert isinstance(std_logger.handlers[0].formatter, SplitterFormatter)
+    std_logger.handlers = []
+
+    logger = getLogger("formatter_test_stream")
+    logger.add_StreamHandler()
+    std_logger = logging.getLogger("formatter_test_stream")
+    assert isinstance(std_logger.handlers[-1].formatter, SplitterFormatter)
+    std_logger.handlers = []
@@ -0,0 +1,322 @@
+import gzip
+import logging
+import logging.config
+import os
+import threading
+import time
+
+import pytest
+
+from logtools import handlers
+from logtools.compression import compress_file, frame_index
+from logtools.formatters import SplitterFormatter
+from logtools.handlers import BufferedRotatingFileHandler, RingBufferHandler
+from logtools.logging_tool import getLogger
+from tests.conftest import LIST_LOGGER, ListHandler
+
+
+def make_record(msg, levelno = logging.INFO, created = None):
+    record = logging.LogRecord("handler_test", levelno, "(unknown file)", 0, msg, None, None)
+    if created is not None:
+        record.created = created
+    return record
+
+def read_lines(path):
+    with open(path, encoding = "utf-8") as f:
+        return f.read().splitlines()
+
+@pytest.fixture
+def logpath(tmp_path):
+    return tmp_path / "logfile.log"
+
+def test_buffered(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", flush_interval = None)
+    for i in range(100):
+        handler.handle(make_record("record {}".format(i)))
+    # バッファにたまっている
+    assert read_lines(logpath) == []
+    assert handler.writes == 0
+
+    handler.flush()
+    assert read_lines(logpath) == ["record {}".format(i) for i in range(100)]
+    assert (handler.records, handler.writes) == (100, 1)
+    handler.close()
+
+def test_flush_triggers(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8"
+                                          , buffer_size = 30, flush_interval = None)
+    handler.handle(make_record("info"))
+    assert read_lines(logpath) == []
+    # ERROR以上はすぐに書き込む
+    handler.handle(make_record("error", logging.ERROR))
+    assert read_lines(logpath) == ["info", "error"]
+    # buffer_sizeを超えたら書き込む
+    handler.handle(make_record("x" * 40))
+    assert read_lines(logpath)[-1] == "x" * 40
+    assert handler.writes == 2
+
+    # closeで残りを書き込む
+    handler.handle(make_record("last"))
+    handler.close()
+    assert read_lines(logpath)[-1] == "last"
+
+def test_flush_interval(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", flush_interval = 0.05)
+    handler.handle(make_record("background"))
+    deadline = time.monotonic() + 5
+    while not read_lines(logpath) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_lines(logpath) == ["background"]
+    handler.close()
+
+def test_size_rotation(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", maxBytes = 100
+                                          , backupCount = 2, flush_interval = None)
+    for i in range(20):
+        handler.handle(make_record("record {:04d}".format(i))) # 12バイト
+    handler.close()
+
+    # 100バイトを超えない範囲で8件ずつ
+    assert read_lines(logpath) == ["record {:04d}".format(i) for i in range(16, 20)]
+    assert read_lines(str(logpath) + ".1") == ["record {:04d}".format(i) for i in range(8, 16)]
+    assert read_lines(str(logpath) + ".2") == ["record {:04d}".format(i) for i in range(8)]
+
+def test_time_rotation(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", backupCount = 1
+                                          , rotate_interval = 60, flush_interval = None)
+    handler.handle(make_record("old"))
+    handler.handle(make_record("new", created = time.time() + 61))
+    handler.handle(make_record("new2"))
+    handler.close()
+    assert read_lines(str(logpath) + ".1") == ["old"]
+    assert read_lines(logpath) == ["new", "new2"]
+
+def test_compressed_rotation(logpath):
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", maxBytes = 100
+                                          , backupCount = 2, flush_interval = None
+                                          , compress = "gzip")
+    for i in range(20):
+        handler.handle(make_record("record {:04d}".format(i)))
+    handler.close()
+
+    assert not os.path.exists(str(logpath) + ".1")
+    assert not os.path.exists(str(logpath) + ".2")
+    assert read_lines(logpath) == ["record {:04d}".format(i) for i in range(16, 20)]
+    for suffix, expect in ((".1.gz", range(8, 16)), (".2.gz", range(8))):
+        path = str(logpath) + suffix
+        assert frame_index(path) is not None
+        with gzip.open(path, "rt", encoding = "utf-8") as f:
+            assert f.read().splitlines() == ["record {:04d}".format(i) for i in expect]
+
+def read_backup(path):
+    """ローテーション済みのファイル（圧縮の有無によらない）の行"""
+    if os.path.exists(path + ".gz"):
+        with gzip.open(path + ".gz", "rt", encoding = "utf-8") as f:
+            return f.read().splitlines()
+    return read_lines(path)
+
+@pytest.mark.parametrize("failures", [1, 100])
+def test_compression_failure(logpath, monkeypatch, failures):
+    """圧縮に失敗しても、ローテーションしたファイルは失われずbackupCountに数えられる"""
+    calls = []
+    def failing(src, dst = None, *args, **kwargs):
+        calls.append(src)
+        if len(calls) <= failures:
+            raise OSError("compression failed")
+        return compress_file(src, dst, *args, **kwargs)
+    monkeypatch.setattr(handlers, "compress_file", failing)
+
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", maxBytes = 100
+                                          , backupCount = 3, flush_interval = None
+                                          , compress = "gzip")
+    for i in range(40):
+        handler.handle(make_record("record {:04d}".format(i)))
+    handler.close()
+
+    assert read_lines(logpath) == ["record {:04d}".format(i) for i in range(32, 40)]
+    for n in range(1, 4):
+        expect = ["record {:04d}".format(i) for i in range(32 - 8 * n, 40 - 8 * n)]
+        assert read_backup(str(logpath) + ".{}".format(n)) == expect
+    # 圧縮前後のファイルが重複せず、backupCountを超えるファイルもない
+    suffix = ".gz" if failures == 1 else ""
+    assert (sorted(p.name for p in logpath.parent.iterdir())
+            == ["logfile.log"] + ["logfile.log.{}{}".format(n, suffix) for n in range(1, 4)])
+
+def test_append(logpath):
+    logpath.write_text("existing\n", encoding = "utf-8")
+    handler = BufferedRotatingFileHandler(logpath, encoding = "utf-8", maxBytes = 20
+                                          , backupCount = 1, flush_interval = None)
+    # 既存のファイルサイズを考慮してローテーションする
+    handler.handle(make_record("0123456789"))
+    handler.close()
+    assert read_lines(str(logpath) + ".1") == ["existing"]
+    assert read_lines(logpath) == ["0123456789"]
+
+def test_invalid(logpath):
+    with pytest.raises(ValueError):
+        BufferedRotatingFileHandler(logpath, flush_interval = 0)
+    with pytest.raises(ValueError):
+        BufferedRotatingFileHandler(logpath, buffer_size = -1)
+    with pytest.raises(ValueError):
+        BufferedRotatingFileHandler(logpath, compress = "bz2")
+
+def test_dictconfig_async(logpath):
+    """dictConfigで設定し、非同期モードのハンドラとして使用する"""
+    conf_dic = {"version" : 1
+                , "disable_existing_loggers" : False
+                , "formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}
+                , "handlers" : {"file" : {"class" : "logtools.handlers.BufferedRotatingFileHandler"
+                                          , "formatter" : "splitter"
+                                          , "filename" : str(logpath)
+                                          , "encoding" : "utf-8"
+                                          , "flush_interval" : None}}
+                , "loggers" : {"handler_test_async" : {"level" : "DEBUG"
+                                                       , "handlers" : ["file"]
+                                                       , "propagate" : False}}
+                }
+    logging.config.dictConfig(conf_dic)
+    std_logger = logging.getLogger("handler_test_async")
+    handler = std_logger.handlers[0]
+    assert isinstance(handler, BufferedRotatingFileHandler)
+
+    logger = getLogger("handler_test_async")
+    emitter = logger.enable_async()
+    try:
+        for i in range(1000):
+            logger.info("loop", values = {"i" : i})
+        # キューを空にした時点でハンドラもflushされる
+        assert emitter.flush(timeout = 10)
+        lines = read_lines(logpath)
+        assert len(lines) == 1000
+        assert lines[-1].endswith("{'i': 999}")
+        assert handler.writes < 1000
+    finally:
+        logger.disable_async()
+        std_logger.handlers = []
+        handler.close()
+
+@pytest.fixture
+def ring_logger(list_logger):
+    """list_loggerのlogging.Logger, logtools.Logger, ListHandler"""
+    logger, handler = list_logger
+    return logging.getLogger(LIST_LOGGER), logger, handler
+
+def test_ring_buffer(ring_logger):
+    """ERRORを受け取ると直近capacity件を古い順にtargetに出力する"""
+    std_logger, logger, original = ring_logger
+    target = ListHandler()
+    handler = RingBufferHandler(capacity = 5, target = target)
+    std_logger.addHandler(handler)
+
+    for i in range(10):
+        logger.debug(action = "run", values = {"i" : i})
+    assert target.records == []
+    assert handler.size == 5
+    logger.error("failed", values = {"i" : 10})
+    assert [r.values["i"] for r in target.records] == [6, 7, 8, 9, 10]
+    assert handler.size == 0
+    assert handler.discarded == 6
+    assert handler.dumps == 1
+
+    # targetでのフォーマットは元のレコードと同じ出力になる
+    formatter = SplitterFormatter()
+    assert ([formatter.format(r) for r in target.records]
+            == [formatter.format(r) for r in original.records[-5:]])
+
+    # flushでは出力しない。dumpで出力する
+    logger.debug(action = "run", values = {"i" : 11})
+    handler.flush()
+    assert len(target.records) == 5
+    handler.dump()
+    assert target.records[-1].values == {"i" : 11}
+    handler.close()
+
+def test_ring_buffer_bytes(ring_logger):
+    """max_bytesを指定した場合は、保持するバイト数がmax_bytes以内になる"""
+    std_logger, logger, _ = ring_logger
+    target = ListHandler()
+    handler = RingBufferHandler(capacity = 1000, max_bytes = 2000, target = target)
+    std_logger.addHandler(handler)
+    for i in range(100):
+        logger.debug(action = "run", values = {"i" : i})
+        assert handler.nbytes <= 2000
+    assert 0 < handler.size < 100
+    # pickleできない値はreprの文字列で保持する
+    lock = threading.Lock()
+    logger.critical("failed", values = {"lock" : lock})
+    assert target.records[-1].values == repr({"lock" : lock})
+    n = len(target.records) - 1
+    assert n > 0
+    assert [r.values["i"] for r in target.records[:-1]] == list(range(100 - n, 100))
+    handler.close()
+
+class CountingArg():
+    """文字列にされた回数を数える"""
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "arg"
+
+@pytest.mark.parametrize("max_bytes", [None, 100000])
+def test_ring_buffer_deferred(ring_logger, max_bytes):
+    """msg % argsは出力時まで適用せず、valuesは保持した時点の内容を出力する"""
+    std_logger, logger, _ = ring_logger
+    target = ListHandler()
+    handler = RingBufferHandler(capacity = 10, max_bytes = max_bytes, target = target)
+    # pytestのログの取得もメッセージをフォーマットするので外す
+    std_logger.handlers = [handler]
+
+    values = {"i" : 1}
+    logger.debug(action = "run", values = values)
+    values["i"] = 99
+    arg = CountingArg()
+    if max_bytes is None:
+        std_logger.debug("deferred %s", arg)
+        assert arg.calls == 0
+    logger.error("failed")
+
+    assert target.records[0].values == {"i" : 1}
+    if max_bytes is None:
+        assert target.records[1].getMessage() == "deferred arg"
+        assert arg.calls == 1
+    handler.close()
+
+def test_ring_buffer_invalid():
+    with pytest.raises(ValueError):
+        RingBufferHandler(capacity = 0)
+    with pytest.raises(ValueError):
+        RingBufferHandler(max_bytes = 0)
+
+def test_ring_buffer_dictconfig(logpath):
+    """dictConfigでtargetをハンドラ名で指定する"""
+    conf_dic = {"version" : 1
+                , "disable_existing_loggers" : False
+                , "formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}
+                , "handlers" : {"file" : {"class" : "logging.FileHandler"
+                                          , "formatter" : "splitter"
+                                          , "filename" : str(logpath)
+                                          , "encoding" : "utf-8"}
+                                , "ring" : {"class" : "logtools.handlers.RingBufferHandler"
+                                            , "capacity" : 3
+                                            , "target" : "file"}}
+                , "loggers" : {"ring_test_dictconfig" : {"level" : "DEBUG"
+                                                         , "handlers" : ["ring"]
+                                                         , "propagate" : False}}
+                }
+    logging.config.dictConfig(conf_dic)
+    std_logger = logging.getLogger("ring_test_dictconfig")
+    logger = getLogger("ring_test_dictconfig")
+    try:
+        for i in range(10):
+            logger.debug(action = "run", values = {"i" : i})
+        assert read_lines(logpath) == []
+        logger.error("failed")
+        lines = read_lines(logpath)
+        assert len(lines) == 3
+        assert lines[0].endswith("{'i': 8}")
+    finally:
+        for handler in std_logger.handlers:
+            handler.close()
+        std_logger.handlers = []
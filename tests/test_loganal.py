@@ -1,9 +1,25 @@
 
+import ast
+import datetime
+import gzip
+import json
+import shutil
+import logging
+import logging.handlers
+import os
+
 import pandas as pd
 import pytest
 
-from logtools.loganal import LogToDf
+from logtools import getLogger, loganal
+from logtools.compression import compress_file, frame_index
+from logtools.formatters import JsonFormatter
+from logtools.loganal import ColumnAccumulator, LogFollower, LogToDf, TimeIndex
 from logtools.loganal import breakdown_values, expand_dict, keymake, log_to_dict, logfile_converter
+from logtools.loganal import decode_line, iter_logfile_fields, iter_logfile_lines, split_logfile
+from logtools.loganal import apply_schema, decode_literal, is_time_ordered, json_to_dict
+from logtools.loganal import ValuesFlattener, flatten_values, flatten_values_column
+from logtools.loganal import lines_to_df, records_to_df
 from logtools.logging_tool import Logger
 
 @pytest.fixture(scope="class")
@@ -107,6 +123,55 @@ def test_log_to_dict(valid_typ_log, default_attributes, default_splitter):
     
     assert log_to_dict(valid_typ_log, default_attributes, default_splitter) == expect
     
+@pytest.mark.parametrize("v"
+                         , ["run", "INFO", "dummyError : [-1, -1, -1]", "", "None", "True"
+                            , "3", "-3.5", " 5", "'quoted'", "b'bytes'", "r'raw'", "rerun"
+                            , "[1, 2]", "(1,)", "{'A': 1}", "set()", "None is not literal"
+                            , "1 + 2j", "..."])
+def test_decode_literal(v):
+    """ast.literal_evalで評価した場合と同じ結果"""
+    try:
+        expect = ast.literal_eval(v)
+    except (SyntaxError, ValueError):
+        expect = v
+    assert decode_literal(v) == expect
+    assert type(decode_literal(v)) == type(expect)
+
+def test_log_to_dict_typed():
+    """型が既知の組み込み属性はast.literal_evalを使わずにデコードされる"""
+    attributes = ("asctime", "created", "process", "name", "message", "values")
+    log = "2021-05-09 16:30:12,093===1620545412.0934===1234===123===[1, 2]===None"
+    
+    assert log_to_dict(log, attributes, "===") == {"asctime" : "2021-05-09 16:30:12,093"
+                                                   , "created" : 1620545412.0934
+                                                   , "process" : 1234
+                                                   , "name" : "123"
+                                                   , "message" : [1, 2]}
+
+def test_apply_schema():
+    df = apply_schema(pd.DataFrame({"asctime" : ["2021-05-09 16:30:12,093", None]
+                                    , "levelname" : ["INFO", "DEBUG"]}))
+    assert df["asctime"][0] == pd.Timestamp("2021-05-09 16:30:12.093")
+    assert df["levelname"].dtype == "category"
+    
+    # デフォルトの書式ではないasctimeは文字列のまま
+    df = apply_schema(pd.DataFrame({"asctime" : ["2021/05/09 16:30:12"]}))
+    assert df["asctime"][0] == "2021/05/09 16:30:12"
+
+def test_json_to_dict():
+    log = ('{"asctime": "2021-05-09 16:30:12,093", "message": "a===b", "tag": null'
+           ', "values": {"A": "AAA", "nest": {"B": [1, 2]}}}')
+    assert json_to_dict(log) == {"asctime" : "2021-05-09 16:30:12,093"
+                                 , "message" : "a===b"
+                                 , "tag" : None
+                                 , "A" : "AAA"
+                                 , "nest-B" : [1, 2]}
+
+def test_json_to_dict_formaterror(recwarn):
+    ret = json_to_dict("not a json")
+    assert ret == {"values" : "not a json", "convert_exception" : "strange format"}
+    assert str(recwarn.pop().message) == "strange format"
+
 def test_log_to_dict_formaterror(recwarn, invalid_short_log, default_attributes, default_splitter):
     
     ret = log_to_dict(invalid_short_log, default_attributes, default_splitter)
@@ -123,6 +188,111 @@ def test_logfile_converter(logfile_dir, default_attributes, default_splitter):
     
     assert log_ls[0]["message"] == "log from logger1 No.1"
 
+def test_split_logfile(tmp_path):
+    lines = ["line{}".format(i) * (i + 1) for i in range(20)]
+    path = tmp_path / "split.log"
+    path.write_text("\n".join(lines) + "\n")
+    
+    ranges = split_logfile(path, split_bytes = 30)
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == path.stat().st_size
+    # 範囲は連続していて、各範囲の読み出しを繋げると全行になる
+    for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+        assert end == start
+    read_lines = []
+    for start, end in ranges:
+        read_lines.extend(iter_logfile_lines(path, start, end))
+    assert read_lines == lines
+
+def test_iter_logfile_lines(tmp_path, monkeypatch):
+    """ブロックの大きさによらず、行単位で読んだ場合と同じ結果"""
+    monkeypatch.setattr(loganal, "BLOCK_BYTES", 8)
+    path = tmp_path / "lines.log"
+    path.write_bytes("a===1\r\n\nlong line over the block size\nあいう\nno newline".encode("utf-8"))
+    
+    expect = ["a===1", "", "long line over the block size", "あいう", "no newline"]
+    assert list(iter_logfile_lines(path)) == expect
+    # endが行の途中の場合はその行の終わりまで
+    assert list(iter_logfile_lines(path, 0, 3)) == expect[:1]
+    assert list(iter_logfile_lines(path, 7, 9)) == expect[1:3]
+
+def test_iter_logfile_fields(tmp_path):
+    path = tmp_path / "fields.log"
+    path.write_text("A===B===C\nshort===line\nD===E===F\r\n", encoding = "utf-8")
+    
+    ret = [(decode_line(line), fields)
+           for line, fields in iter_logfile_fields(path, "===", 3, (0, 2))]
+    assert ret == [("A===B===C", ["A", "C"])
+                   , ("short===line", None)
+                   , ("D===E===F", ["D", "F"])]
+
+def test_split_logfile_empty(tmp_path):
+    path = tmp_path / "empty.log"
+    path.write_text("")
+    assert split_logfile(path) == [(0, 0)]
+
+@pytest.mark.parametrize("values_lit", [
+    {"A" : 1, "B" : "b"}
+    , {"A" : "AAA", "nest" : {"A" : "nestA", "BB" : {"bnest" : [1, 2, 3]}}, "C" : 3}
+    , {"a-b" : 1, "a" : {"b" : 2}}
+])
+def test_values_flattener(values_lit):
+    flattener = ValuesFlattener()
+    expected = flatten_values(values_lit)
+    for _ in range(2):
+        assert list(flattener.flatten(values_lit, "FUNC").items()) == list(expected.items())
+    
+    # 最上位のキーが同じでネストの形が異なる場合
+    changed = {k : ({"x" : v} if type(v) != dict else 1) for k, v in values_lit.items()}
+    assert (list(flattener.flatten(changed, "FUNC").items())
+            == list(flatten_values(changed).items()))
+
+@pytest.mark.parametrize("head", [[], ["strange line"]])
+def test_lines_to_df(valid_typ_log, invalid_short_log, default_attributes, default_splitter, head):
+    tagged_log = valid_typ_log.replace("None==={", "[1, 2]==={'extra': 'x', ")
+    tuple_log = valid_typ_log.replace("===None===", "===([1], 2)===")
+    lines = head + [valid_typ_log, tagged_log, invalid_short_log, tagged_log
+                    , valid_typ_log.replace("===None===", "===use===")
+                    , tuple_log, tuple_log]
+    with pytest.warns(UserWarning, match = "strange format"):
+        expected = records_to_df(log_to_dict(line, default_attributes, default_splitter)
+                                 for line in lines)
+    with pytest.warns(UserWarning, match = "strange format"):
+        log_df = lines_to_df(lines, default_attributes, default_splitter)
+    pd.testing.assert_frame_equal(log_df, expected)
+    # 変更可能な値（を含むtuple）は行ごとに別のオブジェクト
+    assert log_df["tag"].iloc[-6] == log_df["tag"].iloc[-4] == [1, 2]
+    assert log_df["tag"].iloc[-6] is not log_df["tag"].iloc[-4]
+    assert log_df["tag"].iloc[-2] == log_df["tag"].iloc[-1] == ([1], 2)
+    assert log_df["tag"].iloc[-2][0] is not log_df["tag"].iloc[-1][0]
+
+class TestColumnAccumulator():
+    @pytest.mark.parametrize("records", [
+        [{"levelname" : "INFO", "i" : 1, "f" : 0.5}, {"levelname" : "ERROR", "i" : 2, "f" : 1.5}]
+        , [{"i" : 1, "tag" : None}, {"f" : 2.5}, {"i" : None, "tag" : "use"}]
+        , [{"i" : 1}, {"i" : 2.5}, {"i" : "x"}, {"i" : [1]}, {"i" : 2 ** 70}]
+        , [{"tag" : 1}, {"tag" : True}, {"tag" : None}, {}]
+        , [{"name" : "a", "flag" : True}, {"flag" : False}, {"name" : "a"}]
+        , [{}, {}]
+    ])
+    def test_same_as_dataframe(self, records):
+        accumulator = ColumnAccumulator()
+        for dic in records:
+            accumulator.append(dic)
+        assert len(accumulator) == len(records)
+        pd.testing.assert_frame_equal(accumulator.to_df(), pd.DataFrame(records))
+    
+    def test_compact_buffers(self):
+        accumulator = ColumnAccumulator()
+        for i in range(100):
+            accumulator.append({"levelname" : "INFO", "i" : i, "f" : i / 2, "s" : str(i)})
+        kinds = accumulator._kinds
+        assert [kinds[k] for k in ["levelname", "i", "f", "s"]] == [loganal._CATEGORY, loganal._INT
+                                                                   , loganal._FLOAT, loganal._OBJECT]
+        assert accumulator._codes["levelname"] == {"INFO" : 0}
+        assert ColumnAccumulator().to_df().empty
+
 class TestLogToDf():
     def setup_method(self,method):
         print('method={}'.format(method.__name__))
@@ -149,6 +319,189 @@ class TestLogToDf():
         for tar, expect in zip(log_df["message"], expect_message):
             assert tar == expect
             
+    def test_iter_chunks(self, logfile_dir):
+        fn1 = str(logfile_dir.join('logfile1.log'))
+        fn2 = str(logfile_dir.join('logfile2.log'))
+        chunks = list(self.target.iter_chunks([fn1, fn2], chunksize = 3))
+        
+        assert [len(df) for df in chunks] == [3, 1]
+        assert list(chunks[0]["message"]) == ["log from logger1 No.1", "log from logger1 No.2"
+                                              , "log from logger2 No.1"]
+    
+    def test_convert_typed(self, logfile_dir):
+        fn1 = str(logfile_dir.join('logfile1.log'))
+        
+        log_df = self.target.convert([fn1])
+        assert pd.api.types.is_datetime64_any_dtype(log_df["asctime"])
+        assert log_df["levelname"].dtype == "category"
+        
+        log_df = LogToDf(typed = False).convert([fn1])
+        assert not pd.api.types.is_datetime64_any_dtype(log_df["asctime"])
+    
+    def test_engine(self, logfile_dir):
+        paths = [str(logfile_dir.join('logfile1.log')), str(logfile_dir.join('logfile2.log'))]
+        pd.testing.assert_frame_equal(LogToDf(engine = "vectorized").convert(paths, chunksize = 3)
+                                      , LogToDf(engine = "python").convert(paths, chunksize = 3))
+        with pytest.raises(ValueError):
+            LogToDf(engine = "foo")
+    
+    @pytest.mark.parametrize("engine", ["vectorized", "python"])
+    def test_expand_values(self, logfile_dir, invalid_short_log, tmp_path, engine):
+        fn1 = tmp_path / "logfile1.log"
+        fn1.write_text(logfile_dir.join('logfile1.log').read() + invalid_short_log + "\n")
+        with pytest.warns(UserWarning, match = "strange format"):
+            expected = LogToDf(engine = engine).convert([str(fn1)])
+        with pytest.warns(UserWarning, match = "strange format"):
+            log_df = LogToDf(engine = engine, expand_values = False).convert([str(fn1)])
+        assert isinstance(log_df["values"].iloc[0], str)
+        assert log_df["values"].iloc[-1] == invalid_short_log
+        
+        pd.testing.assert_frame_equal(flatten_values_column(log_df)[expected.columns], expected)
+        assert "values" not in flatten_values_column(log_df.iloc[:-1]).columns
+    
+    def test_convert_chunksize(self, logfile_dir):
+        """chunksizeによらず同じ結果"""
+        fn1 = str(logfile_dir.join('logfile1.log'))
+        fn2 = str(logfile_dir.join('logfile2.log'))
+        expect = self.target.convert([fn2, fn1])
+        
+        for chunksize in [1, 2, 100]:
+            log_df = self.target.convert([fn2, fn1], chunksize = chunksize)
+            pd.testing.assert_frame_equal(log_df.reset_index(drop=True)
+                                          , expect.reset_index(drop=True))
+    
+    @pytest.mark.parametrize("typed", [True, False])
+    def test_convert_chunksize_partial_none(self, valid_typ_log, tmp_path, typed):
+        """一部のチャンクだけでNoneの列も、chunksizeによらず同じ型・同じ欠損値になる"""
+        lines = []
+        for i in range(6):
+            tag = "None" if i < 3 else "trace"
+            action = "run" if i % 4 == 0 else "None"
+            values = "{'L': [1]}" if i == 1 else "{'L': 'str', 'A': None}"
+            fields = valid_typ_log.split("===")
+            fields[4], fields[6:] = action, ["No.{}".format(i), tag, values]
+            lines.append("===".join(fields))
+        path = tmp_path / "partial.log"
+        path.write_text("\n".join(lines) + "\n")
+        target = LogToDf(typed = typed)
+        expect = target.convert([path])
+        assert expect["tag"].isna().tolist() == [True] * 3 + [False] * 3
+        assert expect["L"][0] == "str"
+        for chunksize in [1, 2, 4, 5]:
+            log_df = target.convert([path], chunksize = chunksize)
+            pd.testing.assert_frame_equal(log_df, expect)
+    
+    def test_convert_parallel(self, logfile_dir, monkeypatch):
+        """workersによらず同じ結果"""
+        monkeypatch.setattr(loganal, "SPLIT_BYTES", 200) # ファイル内の分割も行う
+        fn1 = str(logfile_dir.join('logfile1.log'))
+        fn2 = str(logfile_dir.join('logfile2.log'))
+        expect = self.target.convert([fn2, fn1])
+        log_df = self.target.convert([fn2, fn1], chunksize = 3, workers = 2)
+        
+        pd.testing.assert_frame_equal(log_df, expect)
+    
+    def test_convert_jsonl(self, tmp_path):
+        """JsonFormatterで出力したログを変換できる"""
+        fn = str(tmp_path / "log.jsonl")
+        handler = logging.FileHandler(fn)
+        handler.setFormatter(JsonFormatter())
+        logger = getLogger("jsonl_logger")
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        logger.info("contains===splitter", values = {"i" : 1, "nest" : {"s" : "x===y"}})
+        logger.debug("second", action = "run")
+        logging.getLogger("jsonl_logger").removeHandler(handler)
+        handler.close()
+        
+        log_df = LogToDf(logformat = "jsonl").convert([fn])
+        
+        assert list(log_df["message"]) == ["contains===splitter", "second"]
+        assert list(log_df["function"]) == ["TestLogToDf.test_convert_jsonl"] * 2
+        assert log_df["i"][0] == 1
+        assert log_df["nest-s"][0] == "x===y"
+        assert pd.api.types.is_datetime64_any_dtype(log_df["asctime"])
+    
+    def test_convert_cache(self, logfile_dir, tmp_path):
+        """キャッシュを使っても同じ結果"""
+        pytest.importorskip("pyarrow")
+        fn1 = str(logfile_dir.join('logfile1.log'))
+        fn2 = str(logfile_dir.join('logfile2.log'))
+        expect = self.target.convert([fn2, fn1])
+        
+        cached = LogToDf(cache_dir = tmp_path / "cache")
+        pd.testing.assert_frame_equal(cached.convert([fn2, fn1]), expect) # キャッシュ作成
+        pd.testing.assert_frame_equal(cached.convert([fn2, fn1]), expect) # キャッシュ使用
+    
+    def test_convert_cache_append(self, valid_typ_log, tmp_path, monkeypatch):
+        """追記された部分だけが解析される"""
+        pytest.importorskip("pyarrow")
+        fn = tmp_path / "append.log"
+        fn.write_text(valid_typ_log + "\n")
+        cached = LogToDf(cache_dir = tmp_path / "cache")
+        cached.convert([fn])
+        
+        parsed = []
+        original = loganal.iter_logfile_lines
+        def counting(filepath, start = 0, end = None):
+            for line in original(filepath, start, end):
+                parsed.append(line)
+                yield line
+        monkeypatch.setattr(loganal, "iter_logfile_lines", counting)
+        
+        appended = valid_typ_log.replace("valid_typ_log", "appended")
+        writing = valid_typ_log.replace("valid_typ_log", "writing")
+        with open(fn, "a") as f:
+            f.write(appended + "\n")
+            f.write(writing[:20]) # 書き込み途中の行
+        with pytest.warns(UserWarning, match = "strange format"):
+            log_df = cached.convert([fn])
+        
+        assert parsed == [appended, writing[:20]]
+        assert list(log_df["message"][:2]) == ["valid_typ_log", "appended"]
+        assert log_df["nest-BB-bnest"][1] == [1, 2, 3]
+        
+        # 書き込み途中の行はキャッシュされていない
+        with open(fn, "a") as f:
+            f.write(writing[20:] + "\n")
+        parsed.clear()
+        log_df = cached.convert([fn])
+        
+        assert parsed == [writing]
+        pd.testing.assert_frame_equal(log_df, self.target.convert([fn]))
+    
+    def test_convert_cache_corrupt(self, logfile_dir, tmp_path):
+        """壊れたキャッシュは使わずに解析し直す"""
+        pytest.importorskip("pyarrow")
+        fn = str(logfile_dir.join('logfile1.log'))
+        expect = self.target.convert([fn])
+        cached = LogToDf(cache_dir = tmp_path / "cache")
+        cached.convert([fn])
+        for data_path in (tmp_path / "cache").glob("*.parquet"):
+            data_path.write_bytes(b"PAR1xxx")
+        pd.testing.assert_frame_equal(cached.convert([fn]), expect)
+        pd.testing.assert_frame_equal(cached.convert([fn]), expect)
+    
+    def test_convert_cache_special_floats(self, tmp_path):
+        """inf, nanを含むobject型の列もキャッシュから元に戻す"""
+        pytest.importorskip("pyarrow")
+        fn = tmp_path / "floats.jsonl"
+        lines = [{"asctime" : "2021-05-09 16:30:12,093", "message" : str(i), "values" : {"x" : x}}
+                 for i, x in enumerate(["a", float("inf"), float("-inf"), [1.0, float("nan")]])]
+        fn.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+        target = LogToDf(logformat = "jsonl")
+        expect = target.convert([fn])
+        cached = LogToDf(logformat = "jsonl", cache_dir = tmp_path / "cache")
+        cached.convert([fn])
+        log_df = cached.convert([fn])
+        assert list(log_df["x"][:3]) == ["a", float("inf"), float("-inf")]
+        assert log_df["x"][3][0] == 1.0 and log_df["x"][3][1] != log_df["x"][3][1]
+        assert list(log_df.columns) == list(expect.columns)
+    
+    def test_invalid_logformat(self):
+        with pytest.raises(ValueError):
+            LogToDf(logformat = "foo")
+    
     def test_sort_exception(self):
         """asctimeが属性に含まれない場合にはUserWarning"""
         dummy_df = pd.DataFrame({"col1":[4,2,5], "col2":[5,6,7]}) # df does not have "asctime"
@@ -160,6 +513,385 @@ class TestLogToDf():
         assert record[0].message.args[0] == "log data is not sorted."
         
 
+@pytest.fixture
+def timed_logfile(valid_typ_log, tmp_path):
+    """1秒ごとのログ100件（ところどころ時刻が前後する）"""
+    lines = []
+    for i in range(100):
+        sec = i - 1 if i % 10 == 5 else i
+        asctime = "2021-05-09 16:{:02d}:{:02d},000".format(sec // 60, sec % 60)
+        lines.append(valid_typ_log.replace("2021-05-09 16:30:12,093", asctime)
+                                  .replace("valid_typ_log", "No.{}".format(i)))
+    path = tmp_path / "timed.log"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+class TestTimeIndex():
+    def test_ranges(self, timed_logfile, monkeypatch, default_attributes, default_splitter
+                    , tmp_path):
+        monkeypatch.setattr(loganal, "INDEX_BYTES", 1000)
+        index_dir = tmp_path / "index"
+        index = TimeIndex(timed_logfile, default_attributes, default_splitter
+                          , index_dir = index_dir)
+        index.update()
+        assert len(index.blocks) > 5
+        assert [p.suffix for p in index_dir.iterdir()] == [".idx"]
+        
+        size = timed_logfile.stat().st_size
+        ranges = index.ranges(datetime.datetime(2021, 5, 9, 16, 0, 40)
+                              , datetime.datetime(2021, 5, 9, 16, 0, 50))
+        assert len(ranges) == 1
+        assert 0 < ranges[0][0] < ranges[0][1] < size
+        assert index.ranges(datetime.datetime(2021, 5, 10)) == []
+        
+        # 保存したインデックスを読み込む
+        loaded = TimeIndex(timed_logfile, default_attributes, default_splitter
+                           , index_dir = index_dir)
+        assert loaded.blocks == index.blocks
+        # index_dirを指定しない場合は保存しない
+        assert TimeIndex(timed_logfile, default_attributes, default_splitter).blocks == []
+    
+    def test_append(self, timed_logfile, valid_typ_log, default_attributes, default_splitter
+                    , tmp_path):
+        index = TimeIndex(timed_logfile, default_attributes, default_splitter
+                          , index_dir = tmp_path / "index")
+        index.update()
+        with open(timed_logfile, "a") as f:
+            f.write(valid_typ_log.replace("2021-05-09 16:30:12,093", "2021-05-09 17:00:00,000") + "\n")
+        
+        index = TimeIndex(timed_logfile, default_attributes, default_splitter
+                          , index_dir = tmp_path / "index")
+        index.update()
+        assert index.blocks[-1][3] == datetime.datetime(2021, 5, 9, 17)
+        assert index.indexed_end == timed_logfile.stat().st_size
+    
+    def test_convert_time_range(self, timed_logfile, monkeypatch):
+        """時刻の範囲を指定した場合、範囲外を読み込まずに全体から絞り込んだ場合と同じ結果"""
+        monkeypatch.setattr(loganal, "INDEX_BYTES", 1000)
+        target = LogToDf()
+        start, end = "2021-05-09 16:00:40,000", pd.Timestamp("2021-05-09 16:00:50")
+        
+        all_df = target.convert([timed_logfile])
+        expect = all_df[(all_df["asctime"] >= pd.Timestamp(start)) & (all_df["asctime"] <= end)]
+        log_df = target.convert([timed_logfile], start = start, end = end)
+        
+        assert len(log_df) == 11
+        pd.testing.assert_frame_equal(log_df.reset_index(drop = True)
+                                      , expect.reset_index(drop = True))
+        # インデックスはログファイルの隣には保存しない
+        assert [p.name for p in timed_logfile.parent.iterdir()] == ["timed.log"]
+        
+        # cache_dirを指定した場合はcache_dirに保存する
+        cache_dir = timed_logfile.parent / "cache"
+        cached = LogToDf(cache_dir = cache_dir)
+        pd.testing.assert_frame_equal(cached.convert([timed_logfile], start = start, end = end)
+                                      , log_df)
+        assert [p.suffix for p in cache_dir.iterdir()] == [".idx"]
+    
+    def test_invalid_time(self, timed_logfile):
+        with pytest.raises(ValueError):
+            LogToDf().convert([timed_logfile], start = "not a time")
+    
+class TestPushdown():
+    @pytest.fixture
+    def mixed_logfile(self, valid_typ_log, tmp_path):
+        lines = []
+        for i, (level, name, tag) in enumerate([("INFO", "svc.a", "use"), ("ERROR", "svc.b", "None")
+                                                , ("DEBUG", "other", "trace"), ("ERROR", "other", "use")]):
+            lines.append(valid_typ_log.replace("INFO===DUMMYLOG", level + "===" + name)
+                                      .replace("valid_typ_log===None", "No.{}===".format(i) + tag))
+        lines.append("strange line")
+        path = tmp_path / "mixed.log"
+        path.write_text("\n".join(lines) + "\n")
+        return path
+    
+    def test_where(self, mixed_logfile):
+        target = LogToDf()
+        log_df = target.convert([mixed_logfile], where = {"levelname" : ["ERROR", "CRITICAL"]})
+        assert list(log_df["message"]) == ["No.1", "No.3"]
+        
+        log_df = target.convert([mixed_logfile], where = {"name" : "svc.", "tag" : [None, "use"]})
+        assert list(log_df["message"]) == ["No.0", "No.1"]
+        assert log_df["tag"].isna().tolist() == [False, True]
+    
+    def test_columns(self, mixed_logfile, monkeypatch):
+        """valuesの列を指定しない場合は、valuesは評価されない"""
+        def fail(values):
+            raise AssertionError("values must not be evaluated")
+        monkeypatch.setattr(loganal, "breakdown_values", fail)
+        
+        target = LogToDf()
+        log_df = target.convert([mixed_logfile], columns = ["levelname", "message"]
+                                , where = {"levelname" : "ERROR"})
+        assert list(log_df.columns) == ["levelname", "message"]
+        assert list(log_df["message"]) == ["No.1", "No.3"]
+    
+    def test_columns_values(self, mixed_logfile):
+        target = LogToDf()
+        with pytest.warns(UserWarning, match = "strange format"):
+            log_df = target.convert([mixed_logfile], columns = ["message", "nest-A", "missing"])
+        assert list(log_df.columns) == ["message", "nest-A", "missing", "convert_exception"]
+        assert list(log_df["nest-A"][:4]) == ["nestA"] * 4
+        assert log_df["missing"].isna().all()
+    
+    def test_same_as_convert(self, mixed_logfile):
+        """絞り込みを行わない場合と同じ値"""
+        target = LogToDf()
+        with pytest.warns(UserWarning):
+            all_df = target.convert([mixed_logfile])
+        expect = all_df[all_df["levelname"] == "ERROR"][["asctime", "message", "A", "nest-BB-bnest"]]
+        
+        for workers in [None, 2]:
+            log_df = target.convert([mixed_logfile], workers = workers
+                                    , columns = ["asctime", "message", "A", "nest-BB-bnest"]
+                                    , where = {"levelname" : "ERROR"})
+            pd.testing.assert_frame_equal(log_df.reset_index(drop = True)
+                                          , expect.reset_index(drop = True))
+    
+    def test_invalid_where(self, mixed_logfile):
+        with pytest.raises(ValueError):
+            LogToDf().convert([mixed_logfile], where = {"message" : "No.1"})
+    
+    def test_values_column(self, mixed_logfile, valid_typ_log):
+        """"values"はexpand_values=Falseの場合だけ指定できる"""
+        with pytest.raises(ValueError, match = "expand_values"):
+            LogToDf().convert([mixed_logfile], columns = ["values"])
+        with pytest.raises(ValueError, match = "expand_values"):
+            next(LogToDf().iter_chunks([mixed_logfile], columns = ["message", "values"]))
+        
+        log_df = LogToDf(expand_values = False).convert([mixed_logfile]
+                                                        , columns = ["message", "values"]
+                                                        , where = {"levelname" : "ERROR"})
+        assert list(log_df["message"]) == ["No.1", "No.3"]
+        # 評価前の文字列
+        assert log_df["values"].tolist() == [valid_typ_log.split("===")[-1]] * 2
+    
+class TestMerge():
+    @pytest.fixture
+    def interleaved_logfiles(self, valid_typ_log, tmp_path):
+        """時刻が交互になる2つのファイル（同時刻のログを含む）"""
+        paths = []
+        for file_no in range(2):
+            lines = []
+            for i in range(20):
+                sec = i * 2 + file_no if i % 5 else i * 2
+                asctime = "2021-05-09 16:00:{:02d},000".format(sec)
+                lines.append(valid_typ_log.replace("2021-05-09 16:30:12,093", asctime)
+                                          .replace("valid_typ_log", "F{}No.{}".format(file_no, i)))
+            path = tmp_path / "merge{}.log".format(file_no)
+            path.write_text("\n".join(lines) + "\n")
+            paths.append(path)
+        return paths
+    
+    @pytest.fixture
+    def unordered_logfile(self, timed_logfile, invalid_short_log):
+        """時刻が逆順で、途中にフォーマット異常の行があるファイル"""
+        lines = timed_logfile.read_text().splitlines()[::-1]
+        lines.insert(50, invalid_short_log)
+        timed_logfile.write_text("\n".join(lines) + "\n")
+        return timed_logfile
+    
+    def test_is_time_ordered(self, interleaved_logfiles, timed_logfile, unordered_logfile
+                             , default_attributes, default_splitter):
+        assert is_time_ordered(interleaved_logfiles[0], default_attributes, default_splitter)
+        assert not is_time_ordered(unordered_logfile, default_attributes, default_splitter)
+    
+    @pytest.fixture
+    def varied_logfile(self, valid_typ_log, tmp_path):
+        """一部の行だけNoneの属性と、行によって異なるvaluesのキーを持つファイル"""
+        lines = []
+        for i in range(30):
+            fields = valid_typ_log.split("===")
+            fields[0] = "2021-05-09 16:00:{:02d},500".format(29 - i if i % 3 else i)
+            fields[4] = "run" if i % 7 == 0 else "None"
+            fields[6:] = ["V{}".format(i), "None" if i % 4 else "trace"
+                          , ["{'A': 1}", "{'L': [1], 'A': None}", "{'B': 'b'}"][i % 3]]
+            lines.append("===".join(fields))
+        path = tmp_path / "varied.log"
+        path.write_text("\n".join(lines) + "\n")
+        return path
+    
+    @pytest.mark.parametrize("typed", [True, False])
+    @pytest.mark.parametrize("chunksize", [1, 3, 7, 13])
+    def test_same_as_sort(self, interleaved_logfiles, unordered_logfile, varied_logfile
+                          , typed, chunksize):
+        """列の順・型・欠損値を含めて、mergeを指定しない場合と同一"""
+        paths = [varied_logfile] + interleaved_logfiles + [unordered_logfile]
+        target = LogToDf(typed = typed)
+        with pytest.warns(UserWarning):
+            expected = target.convert(paths)
+        with pytest.warns(UserWarning):
+            log_df = target.convert(paths, chunksize = chunksize, merge = True)
+        pd.testing.assert_frame_equal(log_df, expected)
+        assert log_df["convert_exception"].notna().tolist()[-1]
+    
+    def test_iter_chunks(self, interleaved_logfiles):
+        target = LogToDf()
+        chunks = list(target.iter_chunks(interleaved_logfiles, chunksize = 15, merge = True))
+        assert [len(df) for df in chunks] == [15, 15, 10]
+        log_df = pd.concat(chunks, ignore_index = True)
+        assert log_df["asctime"].is_monotonic_increasing
+        # 同時刻のログはファイルの順
+        assert list(log_df["message"][:3]) == ["F0No.0", "F1No.0", "F0No.1"]
+    
+    def test_time_range(self, interleaved_logfiles):
+        target = LogToDf()
+        start, end = "2021-05-09 16:00:10", "2021-05-09 16:00:20"
+        pd.testing.assert_frame_equal(
+            target.convert(interleaved_logfiles, start = start, end = end, merge = True)
+            , target.convert(interleaved_logfiles, start = start, end = end))
+
+    def test_no_asctime(self, tmp_path):
+        """asctimeが属性にない場合は警告を出し、ファイルの順・行の順に結合する"""
+        attributes = ("levelname", "message", "values")
+        paths = []
+        for file_no in range(2):
+            path = tmp_path / "noasctime{}.log".format(file_no)
+            path.write_text("".join("INFO===F{}No.{}==={{'i': {}}}\n".format(file_no, i, i)
+                                    for i in range(3)))
+            paths.append(path)
+        with pytest.warns(UserWarning, match = "asctime is not in attributes"):
+            assert is_time_ordered(paths[0], attributes, "===")
+        
+        target = LogToDf(attributes = attributes, splitter = "===")
+        with pytest.warns(UserWarning, match = "log data is not sorted"):
+            expected = target.convert(paths)
+        with pytest.warns(UserWarning, match = "log data is not sorted"):
+            log_df = target.convert(paths, chunksize = 2, merge = True)
+        pd.testing.assert_frame_equal(log_df, expected)
+        assert list(log_df["message"][:4]) == ["F0No.0", "F0No.1", "F0No.2", "F1No.0"]
+    
+    @pytest.mark.parametrize("chunksize, merge", [(1, False), (100, False), (1, True)])
+    def test_all_null_column(self, valid_typ_log, tmp_path, chunksize, merge):
+        """すべて欠損値の列は、チャンクの区切り方によらずobject型のNoneになる"""
+        values = "{'A': 'AAA', 'int': 3, 'nest': {'A': 'nestA', 'BB': {'bnest': [1, 2, 3], 'tag': True}}}"
+        path = tmp_path / "null.log"
+        path.write_text("\n".join([valid_typ_log
+                                   , valid_typ_log.replace(values, "{'A': 'AAA', 'X': None}")
+                                   , valid_typ_log]) + "\n")
+        log_df = LogToDf(typed = False).convert([path], chunksize = chunksize, merge = merge)
+        assert log_df["X"].dtype == object
+        assert log_df["X"].tolist() == [None, None, None]
+
+class TestLogFollower():
+    def make_line(self, valid_typ_log, message):
+        return valid_typ_log.replace("valid_typ_log", message) + "\n"
+    
+    def test_poll(self, valid_typ_log, tmp_path):
+        fn = tmp_path / "follow.log"
+        fn.write_text(self.make_line(valid_typ_log, "No.1"))
+        follower = LogFollower(fn)
+        
+        assert list(follower.poll()["message"]) == ["No.1"]
+        assert len(follower.poll()) == 0
+        
+        with open(fn, "a") as f:
+            f.write(self.make_line(valid_typ_log, "No.2"))
+            f.write(self.make_line(valid_typ_log, "No.3")[:10]) # 書き込み途中
+        assert [r["message"] for r in follower.poll_records()] == ["No.2"]
+        
+        with open(fn, "a") as f:
+            f.write(self.make_line(valid_typ_log, "No.3")[10:])
+        assert [r["message"] for r in follower.poll_records()] == ["No.3"]
+    
+    def test_not_from_start(self, valid_typ_log, tmp_path):
+        fn = tmp_path / "follow.log"
+        fn.write_text(self.make_line(valid_typ_log, "old"))
+        follower = LogFollower(fn, from_start = False)
+        with open(fn, "a") as f:
+            f.write(self.make_line(valid_typ_log, "new"))
+        assert [r["message"] for r in follower.poll_records()] == ["new"]
+    
+    def test_rotation(self, tmp_path):
+        """RotatingFileHandlerのローテーションの前後のログを漏れなく順に返す"""
+        fn = str(tmp_path / "rotate.log")
+        handler = logging.handlers.RotatingFileHandler(fn, maxBytes = 400, backupCount = 10)
+        handler.setFormatter(logging.Formatter(Logger.makeformat().format))
+        logger = getLogger("follower_logger")
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        
+        try:
+            follower = LogFollower(fn)
+            messages = []
+            for i in range(3):
+                for j in range(5): # ポーリングの間に複数回ローテーションされる
+                    logger.info("poll{} No.{}".format(i, j))
+                messages.extend(r["message"] for r in follower.poll_records())
+        finally:
+            logging.getLogger("follower_logger").removeHandler(handler)
+            handler.close()
+        
+        assert messages == ["poll{} No.{}".format(i, j) for i in range(3) for j in range(5)]
+    
+class TestCompressed():
+    @pytest.fixture
+    def compressed(self, timed_logfile):
+        """フレーム付きのgzip（1フレーム約1000バイト）と通常のgzip"""
+        framed = compress_file(timed_logfile, str(timed_logfile) + ".framed.gz"
+                               , frame_bytes = 1000, remove = False)
+        plain = str(timed_logfile) + ".plain.gz"
+        with open(timed_logfile, "rb") as fin, gzip.open(plain, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+        return {"framed" : framed, "plain" : plain}
+    
+    def test_frame_index(self, timed_logfile, compressed):
+        frames = frame_index(compressed["framed"])
+        assert len(frames) > 5
+        assert sum(frame[3] for frame in frames) == timed_logfile.stat().st_size
+        assert frame_index(compressed["plain"]) is None
+        assert loganal.logfile_size(compressed["plain"]) == timed_logfile.stat().st_size
+    
+    @pytest.mark.parametrize("kind", ["framed", "plain"])
+    def test_convert(self, timed_logfile, compressed, kind):
+        """圧縮ファイルから、圧縮前のファイルと同じDataFrameを作成する"""
+        target = LogToDf()
+        expect = target.convert([timed_logfile])
+        pd.testing.assert_frame_equal(target.convert([compressed[kind]]), expect)
+        
+        start, end = "2021-05-09 16:00:40,000", "2021-05-09 16:00:50,000"
+        pd.testing.assert_frame_equal(target.convert([compressed[kind]], start = start, end = end)
+                                      , target.convert([timed_logfile], start = start, end = end))
+    
+    def test_split(self, timed_logfile, compressed):
+        """フレーム付きのgzipはフレームの区切りで分割して並列に読み込む"""
+        frame_starts = [frame[2] for frame in frame_index(compressed["framed"])]
+        ranges = split_logfile(compressed["framed"], 2000)
+        assert len(ranges) > 2
+        assert all(start in frame_starts for start, _ in ranges)
+        assert ranges[-1][1] == timed_logfile.stat().st_size
+        assert len(split_logfile(compressed["plain"], 2000)) == 1
+        
+        lines = [line for start, end in ranges
+                 for line in iter_logfile_lines(compressed["framed"], start, end)]
+        assert lines == timed_logfile.read_text().splitlines()
+        
+        target = LogToDf()
+        pd.testing.assert_frame_equal(target.convert([compressed["framed"]], workers = 2)
+                                      , target.convert([timed_logfile]))
+    
+    def test_zstd(self, timed_logfile, tmp_path):
+        zstandard = pytest.importorskip("zstandard")
+        path = tmp_path / "timed.log.zst"
+        path.write_bytes(zstandard.ZstdCompressor().compress(timed_logfile.read_bytes()))
+        target = LogToDf()
+        pd.testing.assert_frame_equal(target.convert([path]), target.convert([timed_logfile]))
+    
+    def test_follower(self, valid_typ_log, tmp_path):
+        """ローテーション時に圧縮されたファイルの未読の部分を読む"""
+        fn = tmp_path / "follow.log"
+        make_line = lambda message: valid_typ_log.replace("valid_typ_log", message) + "\n"
+        fn.write_text(make_line("No.1"))
+        follower = LogFollower(fn)
+        assert [r["message"] for r in follower.poll_records()] == ["No.1"]
+        
+        with open(fn, "a") as f:
+            f.write(make_line("No.2"))
+        compress_file(fn, str(fn) + ".1.gz", remove = False)
+        os.remove(fn)
+        fn.write_text(make_line("No.3"))
+        assert [r["message"] for r in follower.poll_records()] == ["No.2", "No.3"]
+    
 # [ToDo]以下の項目でExceptionのテストが必要
 # Warning
 # - /そもそも入りが違う(@log_to_dict)
@@ -173,4 +905,4 @@ class TestLogToDf():
 # ===参考
 # def test_AAA(dummylog_unit):
 #     avl_log = dummylog_unit["avl_log"]
-#     assert avl_log.read() == 'DEBUG===run===None==={A:"A"}'
\ No newline at end of file
+#     assert avl_log.read() == 'DEBUG===run===None==={A:"A"}'
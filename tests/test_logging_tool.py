@@ -28,6 +28,29 @@ def test_get_funcname_at_class():
     
     assert cc.in_init == "CallingClass.__init__"
     assert cc.calling_method() == "CallingClass.calling_method"
+
+def test_get_funcname_subclass():
+    """クラス名は実行時のselfのクラスから取得される"""
+    class BaseClass():
+        def calling_method(self):
+            return get_funcname()
+    
+    class SubClass(BaseClass):
+        pass
+    
+    assert BaseClass().calling_method() == "BaseClass.calling_method"
+    assert SubClass().calling_method() == "SubClass.calling_method"
+
+def test_get_funcname_layer():
+    def inner():
+        return get_funcname(2)
+    
+    def outer():
+        return inner()
+    
+    assert outer() == "outer"
+    # キャッシュ済みでも同じ結果
+    assert outer() == "outer"
     
 class TestLogSetting():
     def setup_method(self,method):
@@ -63,6 +86,7 @@ class TestLogger():
         # ハンドラのテストのコンタミをなくすためにはLoggerの名前を変更するか、
         # ハンドラを強制的に初期化するか。今回は後者を選択した。
         self.logger._Logger__logger.handlers = []
+        self.logger.setLevel(logging.NOTSET)
         del self.logger
         
     def test_name_prop(self):
@@ -103,6 +127,44 @@ class TestLogger():
         assert caplog.records[1].function == "TestLogger.test_trace_deco.<locals>.decorated"
         assert caplog.records[1].message == "FINISHED:TestLogger.test_trace_deco.<locals>.decorated"
 
+    def test_getLogger_registry(self):
+        """同じ名前のgetLoggerは同じインスタンスを返し、NullHandlerも増えない"""
+        for _ in range(3):
+            assert getLogger("testlogger") is self.logger
+        
+        Logger("testlogger") # 直接インスタンス化してもNullHandlerは増えない
+        nullhandlers = [hdlr for hdlr in self.logger._Logger__logger.handlers
+                        if type(hdlr) is logging.NullHandler]
+        assert len(nullhandlers) == 1
+        
+        assert getLogger("testlogger_other") is not self.logger
+    
+    def test_level_gate(self, caplog):
+        """無効なレベルのログではvaluesの関数が呼ばれない"""
+        called = []
+        def make_values():
+            called.append(True)
+            return {"A" : 1}
+        
+        self.logger.setLevel(logging.INFO)
+        self.logger.debug("disabled", values = make_values)
+        assert called == []
+        assert caplog.records == []
+        
+        self.logger.info("enabled", values = make_values)
+        assert called == [True]
+        assert caplog.records[0].values == {"A" : 1}
+        assert caplog.records[0].function == "TestLogger.test_level_gate"
+    
+    def test_trace_deco_disabled(self, caplog):
+        @self.logger.trace_deco
+        def decorated():
+            return 3
+        
+        self.logger.setLevel(logging.INFO)
+        assert decorated() == 3
+        assert caplog.records == []
+
     @pytest.mark.skip(reason="ログのテストの仕方を要確認")
     def test_logging(self, capture):
         ...
@@ -168,6 +230,15 @@ class TestLoggerClassMethod_and_Val():
         assert Logger.makeformat().attributes == new_attrib_tpl
         assert Logger.makeformat().splitter == new_splitter
         
+    def test_makeformat_cache(self):
+        """同じフォーマットではLogSetting・ExtraLogDataが共有される"""
+        logsetting = Logger.makeformat()
+        assert Logger.makeformat() is logsetting
+        
+        other = Logger.makeformat(attributes=tuple(["asctime", "function", "message"]))
+        assert other is not logsetting
+        assert other.ExtraLogData is logsetting.ExtraLogData
+        
     def test_makeformat_raise(self):
         with pytest.raises(ConfigurationError):
             Logger.makeformat(attributes = tuple(["action", "foo"]))
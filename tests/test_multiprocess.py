@@ -0,0 +1,99 @@
+import logging
+import multiprocessing
+import threading
+
+import pytest
+
+from logtools.loganal import LogToDf
+from logtools.logging_tool import getLogger
+from logtools.multiprocess import LogWriter, LogWriterHandler
+from logtools.records import decode_record
+
+
+def writer_config(logpath, **handler_kwargs):
+    handler_conf = {"class" : "logtools.handlers.BufferedRotatingFileHandler"
+                    , "formatter" : "splitter"
+                    , "filename" : str(logpath)
+                    , "encoding" : "utf-8"}
+    handler_conf.update(handler_kwargs)
+    return {"version" : 1
+            , "formatters" : {"splitter" : {"()" : "logtools.formatters.SplitterFormatter"}}
+            , "handlers" : {"file" : handler_conf}
+            , "root" : {"level" : "DEBUG", "handlers" : ["file"]}}
+
+def worker(address, authkey, worker_id, n):
+    """ライタープロセスに送信するプロセス"""
+    std_logger = logging.getLogger("multiprocess_worker")
+    std_logger.setLevel(logging.DEBUG)
+    std_logger.addHandler(LogWriterHandler(address, authkey = authkey))
+    logger = getLogger("multiprocess_worker")
+    for i in range(n):
+        logger.info("worker{}".format(worker_id), values = {"worker" : worker_id, "i" : i})
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        LogWriterHandler("address", maxsize = 0)
+    with pytest.raises(ValueError):
+        LogWriterHandler("address", overflow = "drop")
+    with pytest.raises(RuntimeError):
+        LogWriter({"version" : 1, "handlers" : {"bad" : {"class" : "no.such.Handler"}}}).start()
+
+def test_overflow():
+    """送信が待たされている間にキューが満杯になると、古いレコードから捨てて件数を送信する"""
+    handler = LogWriterHandler("address", maxsize = 10, overflow = "drop_oldest")
+    sent = []
+    blocked = threading.Event()
+    release = threading.Event()
+    def send_batch(batch):
+        blocked.set()
+        release.wait()
+        sent.extend(decode_record(fields) for fields in batch)
+    handler._send_batch = send_batch
+
+    std_logger = logging.getLogger("multiprocess_overflow")
+    std_logger.setLevel(logging.DEBUG)
+    std_logger.propagate = False
+    std_logger.addHandler(handler)
+    try:
+        std_logger.info("first")
+        assert blocked.wait(5)
+        for i in range(50):
+            std_logger.info("No.%d", i)
+        assert handler.dropped == 40
+        release.set()
+        assert handler.flush(timeout = 5)
+    finally:
+        std_logger.removeHandler(handler)
+        handler.close()
+
+    messages = [record.msg for record in sent]
+    assert messages == ["first"] + ["No.{}".format(i) for i in range(40, 50)] + ["dropped 40 records"]
+    assert sent[-1].levelno == logging.WARNING
+    assert sent[-1].values == {"dropped" : 40}
+    assert handler.sent == 11
+
+def test_writer(tmp_path):
+    """複数のプロセスのログを1つのファイルに、ローテーションしながら漏れなく書き込む"""
+    logpath = tmp_path / "multiprocess.log"
+    writer = LogWriter(writer_config(logpath, maxBytes = 20000, backupCount = 100))
+    writer.start()
+    processes = [multiprocessing.Process(target = worker
+                                         , args = (writer.address, writer.authkey, i, 500))
+                 for i in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    stats = writer.stop()
+    assert stats["records"] == 1500
+    assert writer.records == 1500
+
+    logfiles = sorted(tmp_path.glob("multiprocess.log.*"), key = lambda p: -int(p.suffix[1:]))
+    assert len(logfiles) > 3
+    log_df = LogToDf().convert(logfiles + [logpath])
+    assert len(log_df) == 1500
+    assert "convert_exception" not in log_df.columns
+    for i in range(3):
+        worker_df = log_df[log_df["worker"] == i]
+        assert list(worker_df["i"].sort_index()) == list(range(500))
+        assert set(worker_df["message"]) == {"worker{}".format(i)}
@@ -0,0 +1,52 @@
+import logging
+import threading
+
+from logtools.formatters import JsonFormatter, SplitterFormatter
+from logtools.records import decode_record, dumps_records, encode_record, loads_records
+from tests.conftest import LIST_LOGGER
+
+
+def test_encode_decode(list_logger):
+    """タプルから復元したレコードは、元のレコードと同じ出力になる"""
+    logger, handler = list_logger
+    logger.info("message", action = "run", values = {"A" : [1, 2], "B" : "===\n"})
+    try:
+        raise ValueError("test")
+    except ValueError as e:
+        logger.error("failed", exception = e)
+    logging.getLogger(LIST_LOGGER).warning("%s + %d", "args", 1, extra = {"custom" : 1})
+
+    for formatter in (SplitterFormatter(), JsonFormatter()):
+        for record in handler.records:
+            decoded = decode_record(loads_records(dumps_records([encode_record(record)]))[0])
+            assert formatter.format(decoded) == formatter.format(record)
+    assert decoded.custom == 1
+
+def test_unpicklable(list_logger):
+    """pickleできない値はreprの文字列になる"""
+    logger, handler = list_logger
+    lock = threading.Lock()
+    logger.info("lock", values = {"lock" : lock})
+    logger.info("plain", values = {"i" : 1})
+    batch = loads_records(dumps_records([encode_record(record) for record in handler.records]))
+    assert decode_record(batch[0]).values == repr({"lock" : lock})
+    assert decode_record(batch[1]).values == {"i" : 1}
+
+def test_deferred(list_logger):
+    """deferred=Trueではmsg % argsを遅らせ、値は浅いコピーを保持する"""
+    logger, handler = list_logger
+    values = {"A" : [1]}
+    logger.info("message", values = values)
+    logging.getLogger(LIST_LOGGER).warning("%s + %d", ["args"], 1)
+    formatter = SplitterFormatter()
+    expect = [formatter.format(record) for record in handler.records]
+    encoded = [encode_record(record, deferred = True) for record in handler.records]
+    values["B"] = 2
+    handler.records[1].args[0].append("changed")
+    assert [formatter.format(decode_record(fields)) for fields in encoded] == expect
+
+    # pickleできないargsはmsg % argsを適用してから保持する
+    lock = threading.Lock()
+    logging.getLogger(LIST_LOGGER).warning("lock %s", lock)
+    fields = loads_records(dumps_records([encode_record(handler.records[-1], deferred = True)]))[0]
+    assert decode_record(fields).getMessage() == "lock {}".format(lock)
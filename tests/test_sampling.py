@@ -0,0 +1,121 @@
+import asyncio
+import logging
+
+import pytest
+
+from logtools import sampling
+from logtools.sampling import LogSampler
+
+
+def test_every():
+    sampler = LogSampler(every = 3)
+    results = [sampler.check(logging.DEBUG, "site", ("f", None, None)) for _ in range(7)]
+    assert [r is not None for r in results] == [True, False, False, True, False, False, True]
+    assert sampler.sampled_out == 4
+    # 呼び出し箇所ごとに数える
+    assert sampler.check(logging.DEBUG, "other", ("f", None, None)) == (0, logging.NOTSET)
+
+def test_max_callsites(monkeypatch):
+    """呼び出し箇所がMAX_CALLSITESを超えるとカウンタをリセットする"""
+    monkeypatch.setattr(sampling, "MAX_CALLSITES", 3)
+    sampler = LogSampler(every = 2)
+    for callsite in range(3):
+        assert sampler.check(logging.DEBUG, callsite, ("f", None, None)) is not None
+    assert sampler.check(logging.DEBUG, 0, ("f", None, None)) is None
+    assert sampler.check(logging.DEBUG, 3, ("f", None, None)) is not None
+    assert len(sampler._calls) == 1
+    # リセット後の最初の呼び出しはログする
+    assert sampler.check(logging.DEBUG, 0, ("f", None, None)) is not None
+
+def test_per_second(clock):
+    sampler = LogSampler(per_second = 2, summarize = True)
+    key = ("f", "run", None)
+    levels = [logging.INFO, logging.INFO, logging.DEBUG, logging.INFO, logging.DEBUG]
+    results = [sampler.check(levelno, "site", key) for levelno in levels]
+    assert results == [(0, logging.NOTSET)] * 2 + [None] * 3
+    assert sampler.rate_limited == 3
+    # 別のキーは別に数える
+    assert sampler.check(logging.INFO, "site", ("g", "run", None)) == (0, logging.NOTSET)
+
+    # 間引いた件数と、間引いたログの最大レベル
+    clock.now += 1.0
+    assert sampler.check(logging.DEBUG, "site", key) == (3, logging.INFO)
+    assert sampler.check(logging.DEBUG, "site", key) == (0, logging.NOTSET)
+
+def test_sweep(clock):
+    """区切りが終わったキーは消去する（ログしていない間引いた件数があるキーは残す）"""
+    sampler = LogSampler(per_second = 1, summarize = True)
+    for i in range(100):
+        sampler.check(logging.INFO, "site", ("f", "run", i))
+    sampler.check(logging.INFO, "site", ("f", "run", 0))
+    assert len(sampler._windows) == 100
+
+    clock.now += 1.0
+    sampler.check(logging.INFO, "site", ("g", "run", None))
+    assert set(sampler._windows) == {("f", "run", 0), ("g", "run", None)}
+    assert sampler.pop_suppressed() == [(("f", "run", 0), 1, logging.INFO)]
+
+def test_max_level(clock):
+    sampler = LogSampler(every = 10, per_second = 1)
+    assert all(sampler.check(logging.ERROR, "site", ("f", None, None)) is not None
+               for _ in range(5))
+    assert sampler.sampled_out == 0
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        LogSampler(every = 0)
+    with pytest.raises(ValueError):
+        LogSampler(per_second = 0)
+
+def test_logger_every(list_logger):
+    logger, handler = list_logger
+    sampler = logger.enable_sampling(every = 4)
+    for i in range(10):
+        logger.debug("loop", action = "run", values = {"i" : i})
+    logger.error("error")
+    assert [r.values["i"] for r in handler.records[:-1]] == [0, 4, 8]
+    assert handler.records[-1].msg == "error"
+    assert sampler.sampled_out == 7
+
+def test_logger_summarize(list_logger, clock):
+    logger, handler = list_logger
+    logger.enable_sampling(per_second = 2, summarize = True)
+    for i in range(9):
+        if i == 5:
+            clock.now += 1.0
+        log = logger.info if i == 3 else logger.debug
+        log("loop", action = "run", tag = "use", values = {"i" : i})
+
+    messages = [r.msg for r in handler.records]
+    assert messages == ["loop", "loop", "suppressed 3 similar records", "loop", "loop"]
+    summary = handler.records[2]
+    assert summary.values == {"suppressed" : 3}
+    assert summary.function == "test_logger_summarize"
+    assert (summary.action, summary.tag) == ("run", "use")
+    # 間引いたログの最大レベルでログする
+    assert summary.levelno == logging.INFO
+
+    # 無効にする際に残りの件数をログする
+    logger.disable_sampling()
+    assert handler.records[-1].msg == "suppressed 2 similar records"
+    assert handler.records[-1].levelno == logging.DEBUG
+    assert logger.sampler is None
+
+def test_logger_every_trace(list_logger):
+    """trace_decoのログは、asyncioのタスクから呼ばれた場合も関数ごとに数える"""
+    logger, handler = list_logger
+    @logger.trace_deco
+    async def first():
+        pass
+    @logger.trace_deco
+    async def second():
+        pass
+
+    async def main():
+        for _ in range(2):
+            await asyncio.gather(first(), second())
+    logger.enable_sampling(every = 2)
+    asyncio.run(main())
+    messages = [r.msg for r in handler.records]
+    assert messages == ["RUN:" + first.__qualname__, "FINISHED:" + first.__qualname__
+                        , "RUN:" + second.__qualname__, "FINISHED:" + second.__qualname__]
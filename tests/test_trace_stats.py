@@ -0,0 +1,206 @@
+import asyncio
+import inspect
+import logging
+
+import pytest
+
+from logtools import logging_tool
+from logtools.trace_stats import LatencyHistogram, TraceStats, BUCKETS_PER_OCTAVE
+
+
+def test_histogram_percentile():
+    hist = LatencyHistogram()
+    assert hist.percentile(50) is None
+    for i in range(1, 1001):
+        hist.record(i * 1e-3)
+    assert hist.count == 1000
+    assert hist.max == 1.0
+    assert hist.total == pytest.approx(500.5)
+    tolerance = 2 ** (1 / BUCKETS_PER_OCTAVE)
+    for q in (50, 95, 99):
+        assert q * 1e-2 <= hist.percentile(q) <= q * 1e-2 * tolerance
+    assert hist.percentile(100) == 1.0
+
+def test_histogram_extreme():
+    hist = LatencyHistogram()
+    hist.record(0.0)
+    hist.record(1e9)
+    assert hist.percentile(1) > 0
+    assert hist.percentile(100) == 1e9
+
+def test_stats_summary():
+    stats = TraceStats()
+    stats.record(0.5, 0.25)
+    summary = stats.summary(reset = True)
+    assert summary["count"] == 1
+    assert summary["wall_max"] == 0.5
+    assert summary["cpu_p99"] == 0.25
+    assert stats.count == 0
+
+def test_wraps(list_logger):
+    logger, _ = list_logger
+    @logger.trace_deco
+    def decorated(a, b = 1):
+        """doc"""
+        return a + b
+    assert decorated.__name__ == "decorated"
+    assert decorated.__doc__ == "doc"
+    assert decorated.__wrapped__(1) == 2
+
+def test_duration(list_logger):
+    logger, handler = list_logger
+    @logger.trace_deco
+    def decorated():
+        return 3
+    assert decorated() == 3
+    finished = handler.records[1]
+    assert finished.action == "finished"
+    assert set(finished.values) == {"duration", "cpu_time"}
+    assert finished.values["duration"] >= 0
+    # 記録は無効
+    assert logger.trace_stats == {}
+
+def test_summary_only(list_logger, clock):
+    logger, handler = list_logger
+    @logger.trace_deco
+    def decorated():
+        pass
+    qualname = decorated.__qualname__
+
+    # DEBUGが無効でも記録する（レベルはlist_loggerの後処理で戻す）
+    logger.setLevel(logging.INFO)
+    logger.enable_trace_stats(interval = 10, per_call = False)
+    for _ in range(5):
+        decorated()
+    assert handler.records == []
+    assert logger.trace_stats[qualname].count == 5
+
+    clock.now += 10
+    decorated()
+    assert [r.msg for r in handler.records] == ["SUMMARY:" + qualname]
+    summary = handler.records[0]
+    assert (summary.action, summary.tag, summary.function) == ("summary", "trace", qualname)
+    assert summary.levelno == logging.INFO
+    assert summary.values["count"] == 6
+    assert summary.values["wall_p50"] <= summary.values["wall_max"]
+    assert logger.trace_stats[qualname].count == 0
+
+    # 無効にする際に残りの集計をログする
+    decorated()
+    logger.disable_trace_stats()
+    assert handler.records[-1].values["count"] == 1
+
+def test_coroutine(list_logger):
+    logger, handler = list_logger
+    @logger.trace_deco
+    async def decorated(x):
+        await asyncio.sleep(0.05)
+        return x * 2
+    assert inspect.iscoroutinefunction(decorated)
+
+    coro = decorated(2)
+    assert handler.records == [] # コルーチンの作成時にはログしない
+    assert asyncio.run(coro) == 4
+    run, finished = handler.records
+    assert run.msg == "RUN:" + decorated.__qualname__
+    assert finished.msg == "FINISHED:" + decorated.__qualname__
+    # awaitで中断している間はCPU時間に含まない
+    assert finished.values["duration"] >= 0.04
+    assert finished.values["cpu_time"] < finished.values["duration"]
+
+def test_coroutine_stats(list_logger):
+    logger, handler = list_logger
+    @logger.trace_deco
+    async def decorated():
+        await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*[decorated() for _ in range(3)])
+    logger.enable_trace_stats(per_call = False)
+    asyncio.run(main())
+    assert handler.records == []
+    assert logger.trace_stats[decorated.__qualname__].count == 3
+
+def test_generator(list_logger):
+    logger, handler = list_logger
+    @logger.trace_deco
+    def decorated(n):
+        total = 0
+        for i in range(n):
+            received = yield i
+            total += received or 0
+        return total
+    assert inspect.isgeneratorfunction(decorated)
+
+    gen = decorated(3)
+    assert handler.records == []
+    assert next(gen) == 0
+    assert [r.action for r in handler.records] == ["run"]
+    assert gen.send(10) == 1
+    assert gen.send(20) == 2
+    with pytest.raises(StopIteration) as stop:
+        gen.send(30)
+    assert stop.value.value == 60 # 戻り値も受け渡す
+    assert [r.action for r in handler.records] == ["run", "finished"]
+
+def test_generator_closed(list_logger):
+    logger, handler = list_logger
+    closed = []
+    @logger.trace_deco
+    def decorated():
+        try:
+            yield 1
+            yield 2
+        finally:
+            closed.append(True)
+
+    gen = decorated()
+    next(gen)
+    gen.close()
+    assert closed == [True]
+    assert [r.action for r in handler.records] == ["run"]
+
+def test_async_generator(list_logger):
+    logger, handler = list_logger
+    @logger.trace_deco
+    async def decorated(n):
+        for i in range(n):
+            await asyncio.sleep(0)
+            received = yield i
+            if received is not None:
+                yield received
+
+    async def main():
+        agen = decorated(2)
+        items = [await agen.__anext__()]
+        items.append(await agen.asend("sent"))
+        async for item in agen:
+            items.append(item)
+        return items
+    assert inspect.isasyncgenfunction(decorated)
+    assert asyncio.run(main()) == [0, "sent", 1]
+    assert [r.action for r in handler.records] == ["run", "finished"]
+    assert handler.records[1].values["duration"] >= 0
+
+def test_async_generator_disabled(list_logger, monkeypatch):
+    """DEBUGが無効かつ記録も無効な場合は、計測せずにasend, athrowを渡す"""
+    logger, handler = list_logger
+    def fail(awaitable, timer):
+        raise AssertionError("timed")
+    monkeypatch.setattr(logging_tool, "_await_timed", fail)
+    @logger.trace_deco
+    async def decorated():
+        try:
+            received = yield 1
+            yield received
+        except ValueError:
+            yield "thrown"
+
+    async def main():
+        agen = decorated()
+        items = [await agen.__anext__(), await agen.asend("sent")]
+        items.append(await agen.athrow(ValueError()))
+        return items
+    logger.setLevel(logging.INFO)
+    assert asyncio.run(main()) == [1, "sent", "thrown"]
+    assert handler.records == []